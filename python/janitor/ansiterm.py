@@ -51,6 +51,21 @@ class Term(object):
         self.sgr_start = "\x1b["
         self.sgr_sep = ';'
         self.sgr_end = 'm'
+        
+        # Cache of generated SGR sequences, indexed by ( from_color, to_color )
+        self.transitions = {}
+    
+    def transition(self, from_color, to_color):
+        """Get SGR sequence changing terminal state from FROM_COLOR to TO_COLOR."""
+        if not self.ansi_enabled or from_color == to_color:
+            return ''
+        # SGR sequences are generated only once for each pair of colors
+        key = (from_color, to_color)
+        seq = self.transitions.get(key)
+        if seq == None:
+            seq = TermLine.make_sgr_transition(from_color, to_color)
+            self.transitions[key] = seq
+        return seq
     
     def wrap_sgr_seq(self, seq):
         if not self.ansi_enabled:
@@ -98,79 +113,91 @@ class TermLine(object):
         # Reset generated line to force re-generation
         self.line = None
         
+        self.line_as_list.append(term.transition(self.color, color))
+        self.color = color
+    
+    def append_raw(self, s, color):
+        """Append string already containing SGR sequences, which leave terminal in COLOR state."""
+        self.line = None
+        self.line_as_list.append(s)
+        self.color = color
+    
+    @staticmethod
+    def make_sgr_transition(current, color):
+        """Build SGR sequence changing attributes from CURRENT to COLOR."""
+        
         # Start SGR (Select Graphic Rendition) sequence
-        self.line_as_list.append(term.sgr_start)
+        seq = [ term.sgr_start ]
         
         # Resetting to default color - just empty sequence to reset
         if color == term.DEFAULT_COLOR:
-            self.line_as_list.append(term.sgr_end)
-            self.color = term.DEFAULT_COLOR
-            return
+            seq.append(term.sgr_end)
+            return ''.join(seq)
         
-        attr_off = ~color & self.color & term.ATTR_MASK
+        attr_off = ~color & current & term.ATTR_MASK
         # If any attribute is being disabled and color changes, just start from reset
-        if (attr_off != 0 and ((color ^ self.color) & ~term.ATTR_MASK)):
-            self.line_as_list += ( term.reset_code, term.sgr_sep )
-            self.color = term.DEFAULT_COLOR
+        if (attr_off != 0 and ((color ^ current) & ~term.ATTR_MASK)):
+            seq += ( term.reset_code, term.sgr_sep )
+            current = term.DEFAULT_COLOR
             attr_off = 0
-        attr_on = color & ~self.color & term.ATTR_MASK
+        attr_on = color & ~current & term.ATTR_MASK
         
         # Turn off attributes
         first = True
         if attr_off:
             if attr_off & term.BOLD:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.bold_off_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.bold_off_code)
                 first = False
             
             if attr_off & term.HIGHLIGHT:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.high_off_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.high_off_code)
                 first = False
             
             if attr_off & term.INVERSE:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.inv_off_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.inv_off_code)
                 first = False
         
         # Turn on attributes
         if attr_on:
             if attr_on & term.BOLD:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.bold_on_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.bold_on_code)
                 first = False
             
             if attr_on & term.HIGHLIGHT:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.high_on_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.high_on_code)
                 first = False
             
             if attr_on & term.INVERSE:
                 if not first:
-                    self.line_as_list.append(term.sgr_sep)
-                self.line_as_list.append(term.inv_on_code)
+                    seq.append(term.sgr_sep)
+                seq.append(term.inv_on_code)
                 first = False
         
         # Change foreground
-        if (color ^ self.color) & term.FG_MASK:
+        if (color ^ current) & term.FG_MASK:
             if not first:
-                self.line_as_list.append(term.sgr_sep)
-            self.line_as_list += ( term.fg_start, chr((color & term.FG_MASK) + 0x30) )
+                seq.append(term.sgr_sep)
+            seq += ( term.fg_start, chr((color & term.FG_MASK) + 0x30) )
             first = False
         
         # Change background
-        if (color ^ self.color) & term.BG_MASK:
+        if (color ^ current) & term.BG_MASK:
             if not first:
-                self.line_as_list.append(term.sgr_sep)
-            self.line_as_list += ( term.bg_start, chr(((color & term.BG_MASK) >> term.BG_SHIFT) + 0x30) )
+                seq.append(term.sgr_sep)
+            seq += ( term.bg_start, chr(((color & term.BG_MASK) >> term.BG_SHIFT) + 0x30) )
         
-        self.line_as_list.append(term.sgr_end)
-        self.color = color
+        seq.append(term.sgr_end)
+        return ''.join(seq)
     
     def set_attrib(self, attrib, state):
         attrib &= term.ATTR_MASK
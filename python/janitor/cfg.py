@@ -0,0 +1,218 @@
+"""Basic blocks and control flow graph of function, used by 'janitor cfg' command."""
+
+import array
+import bisect
+import collections
+import hashlib
+
+import gdb
+
+import janitor.ansiterm
+from janitor.ansiterm import term
+import janitor.disassemble
+import janitor.memcache
+import janitor.output
+import janitor.xref
+
+HEADER_COLOR = term.COLOR_CYAN | term.BOLD
+EDGE_COLOR = term.COLOR_YELLOW
+EXIT_COLOR = term.COLOR_RED
+
+# Kinds of edges
+EDGE_TAKEN = "taken"
+EDGE_FALLTHROUGH = "fallthrough"
+EDGE_JUMP = "jump"
+
+DOT_EDGE_COLORS = { EDGE_TAKEN: "green", EDGE_FALLTHROUGH: "red", EDGE_JUMP: "blue" }
+
+class Block(object):
+    """Basic block from START to END (exclusive), instructions FIRST to LAST of the function."""
+
+    def __init__(self, start, first):
+        self.start = start
+        self.end = start
+        self.first = first
+        self.last = first
+        # ( address, kind ) of blocks following this one
+        self.successors = []
+        self.predecessors = []
+        # Targets of jumps leaving the function
+        self.exits = []
+
+class Cfg(object):
+    """Control flow graph of code from START to END (exclusive)."""
+
+    def __init__(self, arch_name, start, end, digest):
+        self.arch_name = arch_name
+        self.start = start
+        self.end = end
+        # Hash of code bytes the graph was built from
+        self.digest = digest
+        # Addresses and text of instructions
+        self.addrs = array.array("Q")
+        self.asm = []
+        self.blocks = []
+        self.block_starts = []
+        # ( source, target ) of jumps within the function, sorted by source
+        self.jumps = []
+
+    def block_at(self, address):
+        """Get block containing ADDRESS, None if it is outside of the function."""
+        index = bisect.bisect_right(self.block_starts, address) - 1
+        if index < 0 or address >= self.blocks[index].end:
+            return None
+        return self.blocks[index]
+
+def build(arch, start, end, code, flavor):
+    """Disassemble CODE at START and split it into basic blocks."""
+    arch_name = arch.name()
+    cfg = Cfg(arch_name, start, end, hashlib.sha1(code).digest())
+    flows = []
+    lengths = []
+    address = start
+    while address < end:
+        chunk_end = end - 1
+        if janitor.disassemble.disassemble_chunk_size != None:
+            chunk_end = min(chunk_end, address + janitor.disassemble.disassemble_chunk_size - 1)
+        disass = arch.disassemble(start_pc = address, end_pc = chunk_end)
+        if len(disass) == 0:
+            break
+        for instr in disass:
+            cfg.addrs.append(instr["addr"])
+            cfg.asm.append(instr["asm"])
+            lengths.append(instr["length"])
+            flows.append(janitor.xref.instruction_flow(arch_name, instr["asm"]))
+            # Displayed blocks are then taken from disassembly cache
+            offset = instr["addr"] - start
+            if offset + instr["length"] <= len(code):
+                janitor.disassemble.cache.store(arch_name, flavor, instr, code[offset : offset + instr["length"]])
+        address = disass[-1]["addr"] + disass[-1]["length"]
+        disass = None
+    cfg.end = address
+    count = len(cfg.addrs)
+    if count == 0:
+        return cfg
+
+    # Blocks start at the function start, at jump targets and after jumps
+    boundaries = set(cfg.addrs)
+    leaders = set([ start ])
+    for index in range(count):
+        kind, target, falls = flows[index]
+        if kind == janitor.xref.KIND_JUMP or not falls:
+            if index + 1 < count:
+                leaders.add(cfg.addrs[index + 1])
+            if kind == janitor.xref.KIND_JUMP and target in boundaries:
+                leaders.add(target)
+                cfg.jumps.append(( cfg.addrs[index], target ))
+
+    block = None
+    for index in range(count):
+        instr_addr = cfg.addrs[index]
+        if instr_addr in leaders:
+            block = Block(instr_addr, index)
+            cfg.blocks.append(block)
+            cfg.block_starts.append(instr_addr)
+        block.last = index
+        block.end = instr_addr + lengths[index]
+
+    for number in range(len(cfg.blocks)):
+        block = cfg.blocks[number]
+        kind, target, falls = flows[block.last]
+        next_start = cfg.blocks[number + 1].start if number + 1 < len(cfg.blocks) else None
+        if kind == janitor.xref.KIND_JUMP and target != None:
+            if target in boundaries:
+                block.successors.append(( target, EDGE_TAKEN if falls else EDGE_JUMP ))
+            else:
+                block.exits.append(target)
+        if falls and next_start != None and next_start == block.end:
+            block.successors.append(( next_start, EDGE_FALLTHROUGH ))
+        for successor, edge in block.successors:
+            cfg.block_at(successor).predecessors.append(block.start)
+    return cfg
+
+class CfgCache(object):
+    """Control flow graphs of recently used functions. Graph is rebuilt when code bytes change."""
+
+    def __init__(self):
+        # Maximum number of functions kept
+        self.size_limit = 64
+        self.entries = collections.OrderedDict()
+
+    def clear(self):
+        self.entries = collections.OrderedDict()
+
+    def get(self, arch, start, end, flavor):
+        janitor.disassemble.cache.check_settings()
+        code = bytes(janitor.memcache.read_memory(start, end - start))
+        key = (arch.name(), flavor, start, end)
+        cfg = self.entries.get(key)
+        if cfg != None and cfg.digest == hashlib.sha1(code).digest():
+            self.entries.move_to_end(key)
+            return cfg
+        cfg = build(arch, start, end, code, flavor)
+        self.entries[key] = cfg
+        while len(self.entries) > self.size_limit:
+            self.entries.popitem(last = False)
+        return cfg
+
+cache = CfgCache()
+
+def get_cfg(arch, address, flavor):
+    """Get control flow graph of function containing ADDRESS."""
+    bounds = janitor.disassemble.function_range(address)
+    if bounds == None:
+        raise gdb.GdbError ("cannot find bounds of function containing 0x%X" % address)
+    return cache.get(arch, bounds[0], bounds[1], flavor)
+
+def format_addresses(addresses):
+    return ", ".join("0x%X" % address for address in addresses)
+
+def print_cfg(cfg, arch, flavor):
+    """Display blocks of CFG with their instructions and edges."""
+    termline = janitor.ansiterm.TermLine()
+    janitor.output.write_line("Code 0x%X-0x%X: %d blocks, %d instructions" %
+            (cfg.start, cfg.end, len(cfg.blocks), len(cfg.addrs)))
+    for number in range(len(cfg.blocks)):
+        block = cfg.blocks[number]
+        termline.start()
+        termline.set_color(HEADER_COLOR)
+        termline.append("Block %d: 0x%X-0x%X" % (number, block.start, block.end))
+        termline.reset()
+        if len(block.predecessors) != 0:
+            termline.append("  from " + format_addresses(block.predecessors))
+        janitor.output.write_line(termline.get_line())
+
+        janitor.disassemble.disassemble_obj.invoke(arch, block.start, block.end - 1, flavor)
+
+        if len(block.successors) != 0 or len(block.exits) != 0:
+            termline.start()
+            termline.set_color(EDGE_COLOR)
+            termline.append("  -> " + ", ".join("0x%X %s" % (address, edge) for address, edge in block.successors))
+            if len(block.exits) != 0:
+                if len(block.successors) != 0:
+                    termline.append(", ")
+                termline.set_color(EXIT_COLOR)
+                termline.append(", ".join("0x%X exit" % address for address in block.exits))
+            termline.reset()
+            janitor.output.write_line(termline.get_line())
+
+def dot_escape(text):
+    return text.replace("\\", "\\\\").replace("\"", "\\\"")
+
+def print_dot(cfg):
+    """Write CFG in Graphviz DOT format."""
+    write_line = janitor.output.write_line
+    write_line("digraph \"cfg_0x%X\" {" % cfg.start)
+    write_line("    node [shape=box, fontname=\"monospace\"];")
+    for block in cfg.blocks:
+        lines = [ "0x%X:" % block.start ]
+        for index in range(block.first, block.last + 1):
+            lines.append("%X  %s" % (cfg.addrs[index], cfg.asm[index]))
+        write_line("    b%X [label=\"%s\\l\"];" % (block.start, "\\l".join(dot_escape(line) for line in lines)))
+    for block in cfg.blocks:
+        for address, edge in block.successors:
+            write_line("    b%X -> b%X [color=%s];" % (block.start, address, DOT_EDGE_COLORS[edge]))
+        for address in block.exits:
+            write_line("    x%X [label=\"0x%X\", shape=ellipse];" % (address, address))
+            write_line("    b%X -> x%X [style=dashed];" % (block.start, address))
+    write_line("}")
@@ -1,4 +1,7 @@
 
+import os
+import re
+
 import gdb
 import gdb.prompt
 import gdb.command.prompt
@@ -6,7 +9,16 @@ import gdb.command.prompt
 import janitor.registers
 import janitor.disassemble
 import janitor.dump
+import janitor.memcache
+import janitor.corefile
+import janitor.output
 import janitor.prompt
+import janitor.search
+import janitor.snapshot
+import janitor.watch
+import janitor.xref
+import janitor.cfg
+import janitor.symbols
 import janitor.typecache
 import janitor.ansiterm
 from janitor.dump import get_frame_pc
@@ -19,6 +31,7 @@ def cast_to_intptr(expr):
 class Hooks(object):
     
     hooks_set = False
+    objfile_hooks_set = False
     save_enabled = False
     display_enabled = False
     disassemble_next_enabled = False
@@ -30,11 +43,20 @@ class Hooks(object):
     @staticmethod
     def stop_handler(event):
         
+        janitor.memcache.invalidate()
+        janitor.registers.snapshots.invalidate()
+        
         # janitor.disassemble.save_pc()
         
         if Hooks.save_enabled:
             janitor.registers.stop_handler(event)
         
+        if len(janitor.watch.watches) != 0:
+            try:
+                janitor.watch.display()
+            except:
+                pass
+        
         if Hooks.display_enabled:
             try:
                 frame = gdb.newest_frame()
@@ -60,36 +82,97 @@ class Hooks(object):
 
     @staticmethod
     def exited_handler(event):
+        janitor.memcache.invalidate()
+        janitor.memcache.cache.clear_uncached()
+        janitor.registers.snapshots.invalidate()
+        janitor.corefile.invalidate()
+        janitor.watch.reset()
         if Hooks.save_enabled:
             janitor.registers.exited_handler(event)
     
+    @staticmethod
+    def memory_changed_handler(event):
+        janitor.memcache.invalidate()
+        # Registers of older frames are unwound from stack
+        janitor.registers.snapshots.invalidate()
+    
+    @staticmethod
+    def inferior_call_handler(event):
+        janitor.memcache.invalidate()
+        janitor.registers.snapshots.invalidate()
+    
+    @staticmethod
+    def register_changed_handler(event):
+        janitor.registers.snapshots.invalidate()
+    
+    @staticmethod
+    def thread_exited_handler(event):
+        janitor.registers.thread_exited_handler(event)
+    
     @staticmethod
     def clear_objfiles_handler(progspace):
         Hooks.clear_type_cache()
+        janitor.memcache.invalidate()
+        janitor.memcache.cache.clear_uncached()
+        janitor.corefile.invalidate()
+        janitor.disassemble.clear_caches()
+        janitor.cfg.cache.clear()
+        janitor.symbols.symbol_map.clear()
 
     @staticmethod
     def new_objfile_handler(objfile):
         Hooks.clear_type_cache()
+        janitor.corefile.invalidate()
+        # Symbols in disassembly and function bounds may change
+        janitor.disassemble.clear_caches()
+        janitor.cfg.cache.clear()
+        janitor.symbols.symbol_map.clear()
+
+    @staticmethod
+    def connect_objfile_events():
+        """Connect handlers clearing caches of symbols and code when objfiles change."""
+        if not Hooks.objfile_hooks_set:
+            gdb.events.new_objfile.connect(Hooks.new_objfile_handler)
+            if hasattr(gdb.events, 'clear_objfiles'):
+                gdb.events.clear_objfiles.connect(Hooks.clear_objfiles_handler)
+            Hooks.objfile_hooks_set = True
 
     @staticmethod
     def connect():
+        Hooks.connect_objfile_events()
         if not Hooks.hooks_set:
             gdb.events.stop.connect(Hooks.stop_handler)
             gdb.events.exited.connect(Hooks.exited_handler)
-            gdb.events.new_objfile.connect(Hooks.new_objfile_handler)
-        if hasattr(gdb.events, 'clear_objfiles'):
-            gdb.events.clear_objfiles.connect(Hooks.clear_objfiles_handler)
+            if hasattr(gdb.events, 'memory_changed'):
+                gdb.events.memory_changed.connect(Hooks.memory_changed_handler)
+            if hasattr(gdb.events, 'inferior_call'):
+                gdb.events.inferior_call.connect(Hooks.inferior_call_handler)
+            if hasattr(gdb.events, 'register_changed'):
+                gdb.events.register_changed.connect(Hooks.register_changed_handler)
+            if hasattr(gdb.events, 'thread_exited'):
+                gdb.events.thread_exited.connect(Hooks.thread_exited_handler)
         Hooks.hooks_set = True
+        # Stops are noticed now, so register snapshots can be kept until the next one
+        janitor.registers.snapshots.invalidate()
+        janitor.registers.snapshots.enabled = True
 
     @staticmethod
     def disconnect():
         if Hooks.hooks_set:
             gdb.events.stop.disconnect(Hooks.stop_handler)
             gdb.events.exited.disconnect(Hooks.exited_handler)
-            gdb.events.new_objfile.disconnect(Hooks.new_objfile_handler)
-        if hasattr(gdb.events, 'clear_objfiles'):
-            gdb.events.clear_objfiles.disconnect(Hooks.clear_objfiles_handler)
+            if hasattr(gdb.events, 'memory_changed'):
+                gdb.events.memory_changed.disconnect(Hooks.memory_changed_handler)
+            if hasattr(gdb.events, 'inferior_call'):
+                gdb.events.inferior_call.disconnect(Hooks.inferior_call_handler)
+            if hasattr(gdb.events, 'register_changed'):
+                gdb.events.register_changed.disconnect(Hooks.register_changed_handler)
+            if hasattr(gdb.events, 'thread_exited'):
+                gdb.events.thread_exited.disconnect(Hooks.thread_exited_handler)
+        # Objfile handlers stay connected, caches enabled by default depend on them
         Hooks.hooks_set = False
+        janitor.registers.snapshots.enabled = False
+        janitor.registers.snapshots.invalidate()
 
 class JanitorPrefixCommand(gdb.Command):
     """Janitor is support package for assembly level debugging.
@@ -266,13 +349,39 @@ class EvaluatePromptCommand(gdb.Command):
 
 
 class InfoRegistersCommand(gdb.Command):
-    """Print registers in low-level debugger style."""
+    """Print registers in low-level debugger style.
+Usage: info janitor registers
+       info janitor registers all-threads [/c] [/g]
+
+With all-threads, registers of all stopped threads of the selected inferior
+are printed. Selected thread and frame are restored afterwards.
+/c prints one line per thread with pc, sp and flags.
+/g groups threads which have the same code addresses in the newest frames."""
     
     def __init__(self):
         super(InfoRegistersCommand, self).__init__(name="info janitor registers",
                                     command_class = gdb.COMMAND_STATUS)
     
     def invoke(self, arg_str, from_tty):
+        argv = gdb.string_to_argv(arg_str)
+        if len(argv) != 0:
+            if argv[0] != "all-threads":
+                raise gdb.GdbError ("unknown argument: " + argv[0])
+            condensed = False
+            group = False
+            for arg in argv[1:]:
+                if not arg.startswith("/") or len(arg) < 2:
+                    raise gdb.GdbError ("invalid modifier: " + arg)
+                for modifier in arg[1:]:
+                    if modifier == "c":
+                        condensed = True
+                    elif modifier == "g":
+                        group = True
+                    else:
+                        raise gdb.GdbError ("invalid modifier: /" + modifier)
+            janitor.registers.print_all_threads(condensed, group)
+            return
+        
         try:
             frame = gdb.selected_frame()
         except gdb.error as e:
@@ -338,11 +447,88 @@ class RegistersSaveParameter(gdb.Parameter):
         if self.value:
             Hooks.connect()
         else:
-            janitor.registers.prev_registers = {}
-            janitor.registers.curr_registers = {}
+            janitor.registers.saved_registers.clear()
         Hooks.save_enabled = self.value
+        janitor.registers.saved_registers.enabled = self.value
         return "Saving cpu registers " + ("enabled." if self.value else "disabled.")
 
+class RegisterHistorySizeParameter(gdb.Parameter):
+    """Usage: set janitor register-history-size [SIZE|unlimited]
+       show janitor register-history-size"""
+    
+    set_doc = "Set number of stops kept in janitor register history."
+    
+    show_doc = "Display number of stops kept in janitor register history."
+    
+    def __init__ (self):
+        super(RegisterHistorySizeParameter, self).__init__("janitor register-history-size",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_UINTEGER)
+        self.value = janitor.registers.history.size_limit
+    
+    def get_show_string (self, pvalue):
+        return "Register history size is " + str(pvalue) + "."
+
+    def get_set_string (self):
+        janitor.registers.history.set_size_limit(self.value)
+        return "Register history size set to " + ("unlimited" if self.value == None else str(self.value)) + "."
+
+class InfoRegisterHistoryCommand(gdb.Command):
+    """Print registers saved at previous stops.
+Usage: info janitor register-history
+       info janitor register-history REGISTER [COUNT]
+       info janitor register-history diff STOP [STOP]
+
+Without arguments, stops, threads and registers in history are summarized.
+With REGISTER, the last COUNT changes of its value in the selected thread
+are displayed, together with the stop at which it changed last time.
+With diff, registers differing between two stops are displayed, the second
+stop is the last one by default. Stops are numbered from 1, zero and negative
+numbers count back from the last stop.
+
+Stops of all threads are numbered together, but registers are kept for each
+thread, so that stop of one thread is not a change of another one. Diff of
+stops reported by different threads compares registers of those threads.
+
+Registers are saved when `janitor registers-save` is enabled."""
+    
+    def __init__(self):
+        super(InfoRegisterHistoryCommand, self).__init__(name="info janitor register-history",
+                                    command_class = gdb.COMMAND_STATUS)
+    
+    @staticmethod
+    def parse_stop(text):
+        try:
+            return int(text, 0)
+        except ValueError:
+            raise gdb.GdbError ("invalid stop number: " + text)
+    
+    def invoke(self, arg_str, from_tty):
+        argv = gdb.string_to_argv(arg_str)
+        history = janitor.registers.history
+        if len(argv) == 0:
+            janitor.registers.print_history_summary()
+            return
+        if history.last_stop == 0:
+            raise gdb.GdbError ("register history is empty")
+        
+        if argv[0] == "diff":
+            if len(argv) < 2 or len(argv) > 3:
+                raise gdb.GdbError ("usage: info janitor register-history diff STOP [STOP]")
+            first = history.resolve_stop(self.parse_stop(argv[1]))
+            second = history.last_stop
+            if len(argv) == 3:
+                second = history.resolve_stop(self.parse_stop(argv[2]))
+            janitor.registers.print_history_diff(first, second)
+            return
+        
+        if len(argv) > 2:
+            raise gdb.GdbError ("too many arguments")
+        count = 20
+        if len(argv) == 2:
+            count = cast_to_intptr(argv[1])
+        janitor.registers.print_register_timeline(argv[0], count)
+
 class RegistersOnStopParameter(gdb.Parameter):
     """Usage: set janitor registers-on-stop [on|off]
        show janitor registers-on-stop"""
@@ -411,12 +597,68 @@ def split_on_commas(expr):
     result.append(expr[start:].strip())
     return result
 
+
+OUTPUT_OPTION_RE = re.compile(r"(?:^|\s)--output(?:=|\s+)(\S+)")
+OUTPUT_REDIRECT_RE = re.compile(r"(?:^|\s)(>>?)\s*([^\s>]\S*)\s*$")
+# Redirection targets which are more likely right operands of shift or comparison:
+# numbers, registers and convenience variables, or anything with operators
+EXPRESSION_TARGET_RE = re.compile(r"^(?:[-+!(]|\$)|^(?:0[xX][0-9a-fA-F]+|[0-9]+)[uUlL]*$|[()\[\]*&|^<=]")
+
+def check_redirect_target(target):
+    """Refuse redirection to TARGET when it may be operand of the last expression,
+e.g. `janitor dump $sp, +$rcx >> 2`."""
+    ambiguous = EXPRESSION_TARGET_RE.search(target) != None
+    if not ambiguous and "/" not in target and "." not in target:
+        # Bare name may be a symbol
+        try:
+            gdb.parse_and_eval(target)
+            ambiguous = True
+        except (gdb.error, RuntimeError):
+            pass
+    if ambiguous:
+        raise gdb.GdbError ("ambiguous redirection to '%s', put shift in parentheses, or write file as ./%s or use --output"
+                % (target, target))
+
+def split_output_arg(arg_str):
+    """Remove output file specification from command arguments.
     
+    Returns remaining arguments and output object to be used by the command."""
+    path = None
+    append = False
+    match = OUTPUT_OPTION_RE.search(arg_str)
+    if match != None:
+        path = match.group(1)
+        arg_str = (arg_str[:match.start()] + " " + arg_str[match.end():]).strip()
+    match = OUTPUT_REDIRECT_RE.search(arg_str)
+    # Shift operator inside parentheses is not redirection
+    if match != None and arg_str.count("(", 0, match.start()) != arg_str.count(")", 0, match.start()):
+        match = None
+    if match != None:
+        if path != None:
+            raise gdb.GdbError ("output file specified twice")
+        path = match.group(2)
+        check_redirect_target(path)
+        append = (match.group(1) == ">>")
+        arg_str = arg_str[:match.start()].strip()
+    if path != None:
+        path = os.path.expanduser(path)
+    return arg_str, janitor.output.open_output(path, append)
 
 class DisassembleCommand(gdb.Command):
     """Disassemble in low-level debugger style with colors
 
-Usage: janitor disassemble [start] [,end|,+length]"""
+Usage: janitor disassemble [/s] [start] [,end|,+length] [> file|>> file]
+       janitor disassemble [/s] -N [end] [> file|>> file]
+
+With -N, N instructions ending at `end` are displayed and the next
+janitor disassemble -N continues backwards from the first of them.
+
+With /s, source lines are displayed before their instructions.
+
+Output can be written to a file with `> file`, appended with `>> file`,
+or written with `--output file` option. Shift operators must be put in
+parentheses. Redirection to a file which looks like a number, register or
+symbol, e.g. `> 2` or `>> $rax`, is refused as ambiguous, write `./2` then."""
 
     def __init__(self):
         super(DisassembleCommand, self).__init__("janitor disassemble",
@@ -427,9 +669,28 @@ Usage: janitor disassemble [start] [,end|,+length]"""
     
     def invoke(self, arg_str, from_tty):
         intptr_type = None
+        arg_str, output = split_output_arg(arg_str)
+        
+        source = False
+        arg_str = arg_str.strip()
+        if arg_str.startswith("/"):
+            fmt, sep, arg_str = arg_str[1:].partition(' ')
+            if fmt != "s":
+                raise gdb.GdbError ("invalid format /" + fmt)
+            source = True
+            # Line tables are cached until objfiles change
+            Hooks.connect()
+        
+        # disassemble -N - N instructions backwards
+        backward = None
+        match = re.match(r"^\s*-(\d+)(\s+|$)", arg_str)
+        if match != None:
+            backward = int(match.group(1))
+            arg_str = arg_str[match.end():]
+        
         argv = split_on_commas(arg_str)
         
-        if len(argv) > 2:
+        if len(argv) > 2 or (backward != None and len(argv) > 1):
             raise gdb.GdbError ("too many arguments")
         
         # disassemble +1 -> disassemble ,+1
@@ -478,8 +739,15 @@ Usage: janitor disassemble [start] [,end|,+length]"""
         except:
             pass
         
+        if backward != None:
+            if backward > 0:
+                with output:
+                    janitor.disassemble.start_address = janitor.disassemble.disassemble_backward(gdb.selected_frame().architecture(), start_address, backward, flavor, source)
+            return
+        
         if end_address == None or end_address >= start_address:
-            janitor.disassemble.start_address = janitor.disassemble.disassemble(gdb.selected_frame().architecture(), start_address, end_address, flavor)
+            with output:
+                janitor.disassemble.start_address = janitor.disassemble.disassemble(gdb.selected_frame().architecture(), start_address, end_address, flavor, source)
 
 class DisassembleNextInstrParameter(gdb.Parameter):
     """Usage: set janitor disassemble-next-instr [on|off]
@@ -509,7 +777,7 @@ class DisassembleNextInstrParameter(gdb.Parameter):
 
 class DumpCommand(gdb.Command):
     """Dump memory in low-level debugger style with colors
-Usage: janitor dump [/fmt] [start] [,end|,+length]
+Usage: janitor dump [/fmt] [start] [,end|,+length] [> file|>> file]
 
 The /fmt parameter is different from the one used in x or print command.
 There is no repeat count or format letter, instead it consists of size and endianness.
@@ -519,7 +787,12 @@ Endianness letters are l - little endian, b - big endian.
 Order of size and endianness letter is not significant, `b` and `l` are interpreted as endianness letter only
 if accompanied with size letter.
 
-Size of word can be configured with set `janitor word-size`."""
+Size of word can be configured with set `janitor word-size`.
+
+Output can be written to a file with `> file`, appended with `>> file`,
+or written with `--output file` option. Shift operators must be put in
+parentheses. Redirection to a file which looks like a number, register or
+symbol, e.g. `> 2` or `>> $rax`, is refused as ambiguous, write `./2` then."""
 
     def __init__(self):
         super(DumpCommand, self).__init__("janitor dump",
@@ -529,10 +802,20 @@ Size of word can be configured with set `janitor word-size`."""
     def invoke(self, arg_str, from_tty):
         
         fmt = None
+        reference = None
+        arg_str, output = split_output_arg(arg_str)
         
         if len(arg_str)>0 and arg_str[0] == '/':
             fmt, sep, arg_str = arg_str[1:].partition(' ')
         
+        # Compare with snapshot: /diff NAME
+        if fmt != None and fmt.endswith("diff"):
+            fmt = fmt[:-4]
+            name, sep, arg_str = arg_str.strip().partition(' ')
+            if name == "":
+                raise gdb.GdbError ("missing snapshot name")
+            reference = janitor.snapshot.get(name)
+        
         argv = split_on_commas(arg_str)
         
         if len(argv) > 2:
@@ -542,6 +825,8 @@ Size of word can be configured with set `janitor word-size`."""
                 argv = ( "", argv[0] )
             
         start_address = janitor.dump.start_address
+        if reference != None:
+            start_address = reference.address
         if len(argv) > 0 and argv[0] != "":
             start_address = cast_to_intptr(argv[0])
             janitor.dump.highlight_start = None
@@ -567,7 +852,7 @@ Size of word can be configured with set `janitor word-size`."""
             # I don't know any way to ask gdb about default architecture endianness
             user_endian = gdb.parameter("endian")
             if user_endian == "big":
-                janitor.dump.endian = janitor.dump.BIG_ENDIAN
+                janitor.dump.endian = janitor.dump.ENDIAN_BIG
         
 
         if len(argv) > 1 and argv[1] != "":
@@ -578,17 +863,400 @@ Size of word can be configured with set `janitor word-size`."""
             else:
                 end_address = cast_to_intptr(argv[1])
                 janitor.dump.length = None
+        elif reference != None:
+            end_address = reference.end_address()
         elif janitor.dump.length != None:
             end_address = start_address + janitor.dump.length
         else:
             end_address = None
         
+        if reference != None and (start_address < reference.address or end_address > reference.end_address()):
+            raise gdb.GdbError ("range is outside of snapshot " + reference.name)
+        
         if end_address == None or end_address >= start_address:
-            janitor.dump.start_address = janitor.dump.dump(start_address, end_address)
+            with output:
+                janitor.dump.start_address = janitor.dump.dump(start_address, end_address, reference,
+                        not janitor.dump.diff_unchanged)
+
+class SnapshotCommand(gdb.Command):
+    """Save copy of memory region for later comparison with `janitor dump /diff NAME`
+Usage: janitor snapshot NAME [start, end|+length]
+       janitor snapshot /d NAME
+
+Without range, region of existing snapshot NAME is captured again.
+With /d snapshot is deleted."""
+
+    def __init__(self):
+        super(SnapshotCommand, self).__init__("janitor snapshot",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_EXPRESSION)
+    
+    def invoke(self, arg_str, from_tty):
+        delete = False
+        arg_str = arg_str.strip()
+        if arg_str.startswith("/d "):
+            delete = True
+            arg_str = arg_str[3:].strip()
+        
+        name, sep, arg_str = arg_str.partition(' ')
+        if name == "":
+            raise gdb.GdbError ("missing snapshot name")
+        
+        if delete:
+            janitor.snapshot.delete(name)
+            return
+        
+        argv = split_on_commas(arg_str)
+        if len(argv) == 0:
+            snapshot = janitor.snapshot.get(name)
+            start_address = snapshot.address
+            length = len(snapshot.data)
+        elif len(argv) == 2 and argv[0] != "" and argv[1] != "":
+            start_address = cast_to_intptr(argv[0])
+            if argv[1][0] == '+':
+                length = cast_to_intptr(argv[1][1:])
+            else:
+                length = cast_to_intptr(argv[1]) + 1 - start_address
+        else:
+            raise gdb.GdbError ("usage: janitor snapshot NAME [start, end|+length]")
+        
+        if length <= 0:
+            raise gdb.GdbError ("empty range")
+        
+        janitor.snapshot.take(name, start_address, length)
+
+class InfoSnapshotsCommand(gdb.Command):
+    """Display memory snapshots saved by `janitor snapshot` command
+Usage: info janitor snapshots"""
+    
+    def __init__(self):
+        super(InfoSnapshotsCommand, self).__init__(name="info janitor snapshots",
+                                    command_class = gdb.COMMAND_STATUS)
+    
+    def invoke(self, arg_str, from_tty):
+        if len(janitor.snapshot.snapshots) == 0:
+            print("No snapshots.")
+            return
+        for name in sorted(janitor.snapshot.snapshots):
+            snapshot = janitor.snapshot.snapshots[name]
+            print("%-16s 0x%X-0x%X (%d bytes)" % (name, snapshot.address, snapshot.end_address(), len(snapshot.data)))
+
+class DiffUnchangedParameter(gdb.Parameter):
+    """Usage: set janitor diff-unchanged [on|off]
+       show janitor diff-unchanged"""
+    
+    set_doc = "Set display of lines without changes in janitor dump /diff output."
+    
+    show_doc = "Display whether lines without changes are shown in janitor dump /diff output."
+    
+    def __init__ (self):
+        super(DiffUnchangedParameter, self).__init__("janitor diff-unchanged",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = True
+        janitor.dump.diff_unchanged = True
+    
+    def get_show_string (self, pvalue):
+        return "Display of unchanged lines is " + ("on." if self.value else "off.")
+
+    def get_set_string (self):
+        janitor.dump.diff_unchanged = self.value
+        return "Display of unchanged lines " + ("on." if self.value else "off.")
+
+class WatchCommand(gdb.Command):
+    """Display memory regions on every stop
+Usage: janitor watch
+       janitor watch add [/fmt] start, end|+length
+       janitor watch delete NUMBER
+       janitor watch clear
+
+Without subcommand, watched regions are displayed immediately.
+Lines changed since the previous stop are marked and changed bytes highlighted.
+See `janitor dump` command for description of /fmt."""
+
+    def __init__(self):
+        super(WatchCommand, self).__init__("janitor watch",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_NONE,
+                                                        True)
+    
+    def invoke(self, arg_str, from_tty):
+        if len(janitor.watch.watches) == 0:
+            print("No watches.")
+            return
+        janitor.watch.display()
+
+class WatchAddCommand(gdb.Command):
+    """Add memory region displayed on every stop
+Usage: janitor watch add [/fmt] start, end|+length"""
+
+    def __init__(self):
+        super(WatchAddCommand, self).__init__("janitor watch add",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_EXPRESSION)
+    
+    def invoke(self, arg_str, from_tty):
+        width = None
+        endian = None
+        
+        if len(arg_str)>0 and arg_str[0] == '/':
+            fmt, sep, arg_str = arg_str[1:].partition(' ')
+            width, endian = janitor.dump.decode_format(fmt)
+        
+        if width == None:
+            width = 1
+        
+        if endian == None:
+            endian = janitor.dump.ENDIAN_LITTLE
+            if gdb.parameter("endian") == "big":
+                endian = janitor.dump.ENDIAN_BIG
+        
+        argv = split_on_commas(arg_str)
+        if len(argv) != 2 or argv[0] == "" or argv[1] == "":
+            raise gdb.GdbError ("usage: janitor watch add [/fmt] start, end|+length")
+        
+        start_address = cast_to_intptr(argv[0])
+        if argv[1][0] == '+':
+            length = cast_to_intptr(argv[1][1:])
+        else:
+            length = cast_to_intptr(argv[1]) + 1 - start_address
+        
+        if length <= 0:
+            raise gdb.GdbError ("empty range")
+        
+        watch = janitor.watch.add(start_address, length, width, endian)
+        Hooks.connect()
+        print("Watch %d: 0x%X, +%d" % (watch.number, watch.address, watch.length))
+
+class WatchDeleteCommand(gdb.Command):
+    """Delete memory region displayed on every stop
+Usage: janitor watch delete NUMBER"""
+
+    def __init__(self):
+        super(WatchDeleteCommand, self).__init__("janitor watch delete",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_NONE)
+    
+    def invoke(self, arg_str, from_tty):
+        try:
+            number = int(arg_str.strip())
+        except ValueError:
+            raise gdb.GdbError ("usage: janitor watch delete NUMBER")
+        janitor.watch.delete(number)
+
+class WatchClearCommand(gdb.Command):
+    """Delete all memory regions displayed on every stop
+Usage: janitor watch clear"""
+
+    def __init__(self):
+        super(WatchClearCommand, self).__init__("janitor watch clear",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_NONE)
+    
+    def invoke(self, arg_str, from_tty):
+        janitor.watch.clear()
+
+class SearchCommand(gdb.Command):
+    """Search memory for a sequence of bytes
+Usage: janitor search [/fmt] start, end|+length, value [, value...] [> file|>> file]
+
+Each value is either string literal or integer expression.
+The /fmt parameter is the same as for `janitor dump` command. Integer values
+are stored with size and endianness given by /fmt. If size is not given,
+size of expression type is used.
+
+Lines of memory containing each match are displayed with matched bytes highlighted."""
+
+    def __init__(self):
+        super(SearchCommand, self).__init__("janitor search",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_EXPRESSION)
+    
+    def invoke(self, arg_str, from_tty):
+        
+        width = None
+        endian = None
+        arg_str, output = split_output_arg(arg_str)
+        
+        if len(arg_str)>0 and arg_str[0] == '/':
+            fmt, sep, arg_str = arg_str[1:].partition(' ')
+            width, endian = janitor.dump.decode_format(fmt)
+        
+        if endian == None:
+            endian = janitor.dump.ENDIAN_LITTLE
+            if gdb.parameter("endian") == "big":
+                endian = janitor.dump.ENDIAN_BIG
+        
+        argv = split_on_commas(arg_str)
+        
+        if len(argv) < 3:
+            raise gdb.GdbError ("usage: janitor search [/fmt] start, end|+length, value [, value...]")
+        
+        start_address = cast_to_intptr(argv[0])
+        if argv[1] != "" and argv[1][0] == '+':
+            end_address = start_address + cast_to_intptr(argv[1][1:]) - 1
+        else:
+            end_address = cast_to_intptr(argv[1])
+        
+        pattern = janitor.search.encode_pattern(argv[2:], width, endian)
+        
+        matches = janitor.search.search(start_address, end_address, pattern)
+        with output:
+            janitor.search.print_matches(matches, len(pattern), width, endian)
+
+class CfgCommand(gdb.Command):
+    """Display basic blocks of function
+Usage: janitor cfg [/dot] [func|addr] [> file|>> file]
+       janitor cfg [/dot] start, end|+length [> file|>> file]
+
+Function containing `addr` (current PC by default) is split into basic
+blocks, which are displayed with their predecessors and successors.
+With /dot, the graph is written in Graphviz DOT format."""
+
+    def __init__(self):
+        super(CfgCommand, self).__init__("janitor cfg",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_EXPRESSION)
+    
+    def invoke(self, arg_str, from_tty):
+        arg_str, output = split_output_arg(arg_str)
+        dot = False
+        arg_str = arg_str.strip()
+        if arg_str.startswith("/"):
+            fmt, sep, arg_str = arg_str[1:].partition(' ')
+            if fmt != "dot":
+                raise gdb.GdbError ("invalid format /" + fmt)
+            dot = True
+        argv = split_on_commas(arg_str)
+        if len(argv) > 2:
+            raise gdb.GdbError ("too many arguments")
+        
+        flavor = None
+        try:
+            flavor = gdb.parameter("disassembly-flavor")
+        except:
+            pass
+        arch = gdb.selected_frame().architecture()
+        
+        if len(argv) == 2:
+            start_address = cast_to_intptr(argv[0])
+            if argv[1] != "" and argv[1][0] == '+':
+                end_address = start_address + cast_to_intptr(argv[1][1:])
+            else:
+                end_address = cast_to_intptr(argv[1]) + 1
+            if end_address <= start_address:
+                raise gdb.GdbError ("empty range")
+            cfg = janitor.cfg.cache.get(arch, start_address, end_address, flavor)
+        else:
+            if len(argv) == 1 and argv[0] != "":
+                address = cast_to_intptr(argv[0])
+            else:
+                address = get_frame_pc(gdb.selected_frame())
+            cfg = janitor.cfg.get_cfg(arch, address, flavor)
+        
+        with output:
+            if dot:
+                janitor.cfg.print_dot(cfg)
+            else:
+                janitor.cfg.print_cfg(cfg, arch, flavor)
+
+class XrefIndexCommand(gdb.Command):
+    """Index cross-references of objfile
+Usage: janitor xref-index [FILE]
+
+Code sections of FILE, or of the main executable, are disassembled and
+targets of branches and calls and referenced addresses are stored on disk.
+Index is keyed by build ID, so it is reused in later sessions.
+Interrupted indexing continues where it stopped."""
+
+    def __init__(self):
+        super(XrefIndexCommand, self).__init__("janitor xref-index",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_FILENAME)
+    
+    def invoke(self, arg_str, from_tty):
+        path = arg_str.strip()
+        if path == "":
+            path = janitor.xref.objfile_path()
+        path = os.path.expanduser(path)
+        
+        instructions, refs, done, total = janitor.xref.build_index(path)
+        print("Indexed %d instructions and %d references of %s." % (instructions, refs, path))
+        if done < total:
+            print("Index covers %d of %d bytes of code." % (done, total))
+
+class XrefsCommand(gdb.Command):
+    """Display instructions referring to address
+Usage: janitor xrefs ADDR [> file|>> file]
+
+Calls, jumps and other references to ADDR are looked up in index created
+by janitor xref-index for objfile containing ADDR."""
+
+    def __init__(self):
+        super(XrefsCommand, self).__init__("janitor xrefs",
+                                                        gdb.COMMAND_DATA,
+                                                        gdb.COMPLETE_EXPRESSION)
+    
+    def invoke(self, arg_str, from_tty):
+        arg_str, output = split_output_arg(arg_str)
+        if arg_str.strip() == "":
+            raise gdb.GdbError ("usage: janitor xrefs ADDR")
+        address = cast_to_intptr(arg_str)
+        with output:
+            janitor.xref.print_xrefs(address)
+
+class XrefDirParameter(gdb.Parameter):
+    """Usage: set janitor xref-dir [DIR]
+       show janitor xref-dir"""
+    
+    set_doc = "Set directory of cross-reference indexes created by janitor xref-index."
+    
+    show_doc = "Display directory of cross-reference indexes created by janitor xref-index."
+    
+    def __init__ (self):
+        super(XrefDirParameter, self).__init__("janitor xref-dir",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_OPTIONAL_FILENAME)
+        self.value = ""
+        janitor.xref.index_dir = None
+    
+    def get_show_string (self, pvalue):
+        if janitor.xref.index_dir == None:
+            return "Cross-reference indexes are stored in " + janitor.xref.default_index_dir() + "."
+        return "Cross-reference indexes are stored in " + janitor.xref.index_dir + "."
+
+    def get_set_string (self):
+        if self.value == None or self.value == "":
+            janitor.xref.index_dir = None
+        else:
+            janitor.xref.index_dir = os.path.expanduser(self.value)
+        return self.get_show_string(self.value)
+
+class SearchTargetParameter(gdb.Parameter):
+    """Usage: set janitor search-target [on|off]
+       show janitor search-target"""
+    
+    set_doc = "Enable or disable searching memory by GDB for janitor search command."
+    
+    show_doc = "Display whether memory is searched by GDB for janitor search command."
+    
+    def __init__ (self):
+        super(SearchTargetParameter, self).__init__("janitor search-target",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = True
+        janitor.search.use_target_search = True
+    
+    def get_show_string (self, pvalue):
+        return "Searching memory by GDB is " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        janitor.search.use_target_search = self.value
+        return "Searching memory by GDB " + ("enabled." if self.value else "disabled.")
 
 class DumpStackCommand(gdb.Command):
     """Dump raw stack in low-level debugger style with colors.
-Usage: janitor raw-stack [/fmt] [+length]
+Usage: janitor raw-stack [/fmt] [+length] [> file|>> file]
 
 Displays stack correctly only on architectures where stack grows downward.
 See `janitor dump` command for description of /fmt.
@@ -607,6 +1275,7 @@ See `janitor dump` command for description of /fmt.
             janitor.dump.saved_endian = janitor.dump.endian
         
         janitor.dump.width = janitor.dump.format_width['w']
+        arg_str, output = split_output_arg(arg_str)
         
         if len(arg_str)>0 and arg_str[0] == '/':
             fmt, sep, arg_str = arg_str[1:].partition(' ')
@@ -617,7 +1286,7 @@ See `janitor dump` command for description of /fmt.
             # I don't know any way to ask gdb about default architecture endianness
             user_endian = gdb.parameter("endian")
             if user_endian == "big":
-                janitor.dump.endian = janitor.dump.BIG_ENDIAN
+                janitor.dump.endian = janitor.dump.ENDIAN_BIG
         
         if janitor.dump.width == None:
             janitor.dump.width = 1
@@ -664,7 +1333,8 @@ See `janitor dump` command for description of /fmt.
             end_address = None
         
         if end_address == None or end_address >= start_address:
-            janitor.dump.start_address = janitor.dump.dump(start_address, end_address)
+            with output:
+                janitor.dump.start_address = janitor.dump.dump(start_address, end_address)
 
     
 class DumpWordWidthParameter(gdb.Parameter):
@@ -714,6 +1384,347 @@ class DumpLineAlignParameter(gdb.Parameter):
         janitor.dump.dump_obj.ALIGNED = 16 if self.value else 1
         return "Dump line alignment " + ("on." if self.value else "off.")
 
+class DumpCollapseParameter(gdb.Parameter):
+    """Usage: set janitor dump-collapse [on|off]
+       show janitor dump-collapse"""
+    
+    set_doc = "Set collapsing of repeated lines in dump command output."
+    
+    show_doc = "Display collapsing of repeated lines in dump command output."
+    
+    def __init__ (self):
+        super(DumpCollapseParameter, self).__init__("janitor dump-collapse",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = False
+        janitor.dump.collapse = False
+    
+    def get_show_string (self, pvalue):
+        return "Dump line collapsing is " + ("on." if self.value else "off.")
+
+    def get_set_string (self):
+        janitor.dump.collapse = self.value
+        return "Dump line collapsing " + ("on." if self.value else "off.")
+
+class DumpSymbolsParameter(gdb.Parameter):
+    """Usage: set janitor dump-symbols [on|off]
+       show janitor dump-symbols"""
+    
+    set_doc = "Set displaying symbols pointed to by words in dump and raw-stack command output."
+    
+    show_doc = "Display whether symbols pointed to by words are displayed in dump and raw-stack command output."
+    
+    def __init__ (self):
+        super(DumpSymbolsParameter, self).__init__("janitor dump-symbols",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = False
+        janitor.dump.symbols = False
+    
+    def get_show_string (self, pvalue):
+        return "Dump symbols are " + ("on." if self.value else "off.")
+
+    def get_set_string (self):
+        if self.value:
+            # Symbol index is rebuilt when objfiles change
+            Hooks.connect()
+        janitor.symbols.symbol_map.clear()
+        janitor.dump.symbols = self.value
+        return "Dump symbols " + ("on." if self.value else "off.")
+
+class OutputFileParameter(gdb.Parameter):
+    """Usage: set janitor output-file [FILE]
+       show janitor output-file"""
+    
+    set_doc = "Set file to which janitor dump and disassemble output is appended."
+    
+    show_doc = "Display file to which janitor dump and disassemble output is appended."
+    
+    def __init__ (self):
+        super(OutputFileParameter, self).__init__("janitor output-file",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_OPTIONAL_FILENAME)
+        self.value = ""
+        janitor.output.output_file = None
+    
+    def get_show_string (self, pvalue):
+        if janitor.output.output_file == None:
+            return "Output is written to terminal."
+        return "Output is appended to " + janitor.output.output_file + "."
+
+    def get_set_string (self):
+        if self.value == None or self.value == "":
+            janitor.output.output_file = None
+            return "Output will be written to terminal."
+        janitor.output.output_file = os.path.expanduser(self.value)
+        return "Output will be appended to " + janitor.output.output_file + "."
+
+class OutputAnsiParameter(gdb.Parameter):
+    """Usage: set janitor output-ansi [on|off]
+       show janitor output-ansi"""
+    
+    set_doc = "Enable or disable ANSI terminal sequences in output written to file."
+    
+    show_doc = "Display whether ANSI terminal sequences are kept in output written to file."
+    
+    def __init__ (self):
+        super(OutputAnsiParameter, self).__init__("janitor output-ansi",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = False
+        janitor.output.keep_ansi = False
+    
+    def get_show_string (self, pvalue):
+        return "ANSI terminal sequences in output file are " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        janitor.output.keep_ansi = self.value
+        return "ANSI terminal sequences in output file " + ("enabled." if self.value else "disabled.")
+
+class ReadChunkSizeParameter(gdb.Parameter):
+    """Usage: set janitor read-chunk-size [SIZE|unlimited]
+       show janitor read-chunk-size"""
+    
+    set_doc = "Set maximum number of bytes read from inferior at once by janitor dump command."
+    
+    show_doc = "Display maximum number of bytes read from inferior at once by janitor dump command."
+    
+    def __init__ (self):
+        super(ReadChunkSizeParameter, self).__init__("janitor read-chunk-size",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_UINTEGER)
+        self.value = janitor.dump.read_chunk_size
+    
+    def get_show_string (self, pvalue):
+        return "Read chunk size is " + str(pvalue) + "."
+
+    def get_set_string (self):
+        janitor.dump.read_chunk_size = self.value
+        return "Read chunk size set to " + ("unlimited" if self.value == None else str(self.value)) + "."
+
+class MemoryCacheParameter(gdb.Parameter):
+    """Usage: set janitor memory-cache [on|off]
+       show janitor memory-cache"""
+    
+    set_doc = "Enable or disable caching inferior memory read by janitor commands."
+    
+    show_doc = "Display whether caching inferior memory read by janitor commands is activated."
+    
+    def __init__ (self):
+        super(MemoryCacheParameter, self).__init__("janitor memory-cache",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = False
+    
+    def get_show_string (self, pvalue):
+        return "Memory cache is " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        if self.value:
+            # Cache is invalidated on stop
+            Hooks.connect()
+        else:
+            janitor.memcache.invalidate()
+            janitor.memcache.cache.clear_uncached()
+        janitor.memcache.cache.enabled = self.value
+        return "Memory cache " + ("enabled." if self.value else "disabled.")
+
+class MemoryCacheSizeParameter(gdb.Parameter):
+    """Usage: set janitor memory-cache-size [SIZE|unlimited]
+       show janitor memory-cache-size"""
+    
+    set_doc = "Set maximum size of janitor memory cache in bytes."
+    
+    show_doc = "Display maximum size of janitor memory cache in bytes."
+    
+    def __init__ (self):
+        super(MemoryCacheSizeParameter, self).__init__("janitor memory-cache-size",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_UINTEGER)
+        self.value = janitor.memcache.cache.size_limit
+    
+    def get_show_string (self, pvalue):
+        return "Memory cache size is " + str(pvalue) + "."
+
+    def get_set_string (self):
+        janitor.memcache.cache.size_limit = self.value
+        janitor.memcache.invalidate()
+        return "Memory cache size set to " + ("unlimited" if self.value == None else str(self.value)) + "."
+
+class CoreMmapParameter(gdb.Parameter):
+    """Usage: set janitor core-mmap [on|off]
+       show janitor core-mmap"""
+    
+    set_doc = "Enable or disable reading core file memory directly from memory-mapped files."
+    
+    show_doc = "Display whether core file memory is read directly from memory-mapped files."
+    
+    def __init__ (self):
+        super(CoreMmapParameter, self).__init__("janitor core-mmap",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = True
+        janitor.corefile.enabled = True
+    
+    def get_show_string (self, pvalue):
+        return "Reading core files directly is " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        janitor.corefile.enabled = self.value
+        janitor.corefile.invalidate()
+        if self.value:
+            Hooks.connect()
+        return "Reading core files directly " + ("enabled." if self.value else "disabled.")
+
+class InfoMemoryCacheCommand(gdb.Command):
+    """Print janitor memory cache statistics.
+Usage: info janitor memory-cache [reset]
+
+With `reset` argument, statistics are cleared after printing."""
+    
+    def __init__(self):
+        super(InfoMemoryCacheCommand, self).__init__(name="info janitor memory-cache",
+                                    command_class = gdb.COMMAND_STATUS)
+    
+    def invoke(self, arg_str, from_tty):
+        arg_str = arg_str.strip()
+        if arg_str != "" and arg_str != "reset":
+            raise gdb.GdbError ("invalid argument")
+        
+        cache = janitor.memcache.cache
+        lookups = cache.hits + cache.misses
+        print("Memory cache is " + ("enabled." if cache.enabled else "disabled."))
+        print("Cached pages:   %d (%d bytes)" % (len(cache.pages), len(cache.pages) * janitor.memcache.PAGE_SIZE))
+        print("Uncached pages: %d" % len(cache.uncached))
+        print("Page hits:      %d" % cache.hits)
+        print("Page misses:    %d" % cache.misses)
+        if lookups != 0:
+            print("Hit ratio:      %.1f%%" % (100.0 * cache.hits / lookups))
+        print("Target reads:   %d (%d bytes)" % (cache.reads, cache.bytes_read))
+        print("Invalidations:  %d" % cache.invalidations)
+        
+        if arg_str == "reset":
+            cache.reset_stats()
+
+class DisassembleChunkSizeParameter(gdb.Parameter):
+    """Usage: set janitor disassemble-chunk-size [SIZE|unlimited]
+       show janitor disassemble-chunk-size"""
+    
+    set_doc = "Set maximum number of bytes disassembled at once by janitor disassemble command."
+    
+    show_doc = "Display maximum number of bytes disassembled at once by janitor disassemble command."
+    
+    def __init__ (self):
+        super(DisassembleChunkSizeParameter, self).__init__("janitor disassemble-chunk-size",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_UINTEGER)
+        self.value = janitor.disassemble.disassemble_chunk_size
+    
+    def get_show_string (self, pvalue):
+        return "Disassemble chunk size is " + str(pvalue) + "."
+
+    def get_set_string (self):
+        janitor.disassemble.disassemble_chunk_size = self.value
+        return "Disassemble chunk size set to " + ("unlimited" if self.value == None else str(self.value)) + "."
+
+class DisassembleCacheParameter(gdb.Parameter):
+    """Usage: set janitor disassemble-cache [on|off]
+       show janitor disassemble-cache"""
+    
+    set_doc = "Enable or disable caching instructions disassembled by janitor disassemble command."
+    
+    show_doc = "Display whether caching instructions disassembled by janitor disassemble command is activated."
+    
+    def __init__ (self):
+        super(DisassembleCacheParameter, self).__init__("janitor disassemble-cache",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = True
+        janitor.disassemble.cache.enabled = True
+        # Cache is cleared when objfiles change
+        Hooks.connect_objfile_events()
+    
+    def get_show_string (self, pvalue):
+        return "Disassembly cache is " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        if self.value:
+            # Cache is cleared when objfiles change
+            Hooks.connect()
+        janitor.disassemble.cache.clear()
+        janitor.disassemble.cache.enabled = self.value
+        return "Disassembly cache " + ("enabled." if self.value else "disabled.")
+
+class DisassembleArrowsParameter(gdb.Parameter):
+    """Usage: set janitor disassemble-arrows [on|off]
+       show janitor disassemble-arrows"""
+    
+    set_doc = "Enable or disable arrows from jumps to their targets in janitor disassemble listing."
+    
+    show_doc = "Display whether arrows from jumps to their targets are drawn by janitor disassemble command."
+    
+    def __init__ (self):
+        super(DisassembleArrowsParameter, self).__init__("janitor disassemble-arrows",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_BOOLEAN)
+        self.value = False
+    
+    def get_show_string (self, pvalue):
+        return "Jump arrows are " + ("enabled." if self.value else "disabled.")
+
+    def get_set_string (self):
+        janitor.disassemble.jump_arrows = self.value
+        return "Jump arrows " + ("enabled." if self.value else "disabled.")
+
+class DisassembleCacheSizeParameter(gdb.Parameter):
+    """Usage: set janitor disassemble-cache-size [SIZE|unlimited]
+       show janitor disassemble-cache-size"""
+    
+    set_doc = "Set maximum number of instructions in janitor disassembly cache."
+    
+    show_doc = "Display maximum number of instructions in janitor disassembly cache."
+    
+    def __init__ (self):
+        super(DisassembleCacheSizeParameter, self).__init__("janitor disassemble-cache-size",
+                                                                gdb.COMMAND_STATUS,
+                                                                gdb.PARAM_UINTEGER)
+        self.value = janitor.disassemble.cache.size_limit
+    
+    def get_show_string (self, pvalue):
+        return "Disassembly cache size is " + str(pvalue) + "."
+
+    def get_set_string (self):
+        janitor.disassemble.cache.size_limit = self.value
+        janitor.disassemble.cache.clear()
+        return "Disassembly cache size set to " + ("unlimited" if self.value == None else str(self.value)) + "."
+
+class InfoDisassembleCacheCommand(gdb.Command):
+    """Print janitor disassembly cache statistics.
+Usage: info janitor disassemble-cache [reset]
+
+With `reset` argument, statistics are cleared after printing."""
+    
+    def __init__(self):
+        super(InfoDisassembleCacheCommand, self).__init__(name="info janitor disassemble-cache",
+                                    command_class = gdb.COMMAND_STATUS)
+    
+    def invoke(self, arg_str, from_tty):
+        arg_str = arg_str.strip()
+        if arg_str != "" and arg_str != "reset":
+            raise gdb.GdbError ("invalid argument")
+        
+        cache = janitor.disassemble.cache
+        lookups = cache.hits + cache.misses
+        print("Disassembly cache is " + ("enabled." if cache.enabled else "disabled."))
+        print("Cached instructions: %d" % len(cache.entries))
+        print("Hits:                %d" % cache.hits)
+        print("Misses:              %d" % cache.misses)
+        if lookups != 0:
+            print("Hit ratio:           %.1f%%" % (100.0 * cache.hits / lookups))
+        
+        if arg_str == "reset":
+            cache.reset_stats()
+
 class I8086HackParameter(gdb.Parameter):
     """Usage: set janitor i8086 [on|off]
        show janitor i8086"""
@@ -751,6 +1762,10 @@ InfoRegistersCommand()
 InfoFlagsCommand()
 # set janitor registers-save
 RegistersSaveParameter()
+# set janitor register-history-size
+RegisterHistorySizeParameter()
+# info janitor register-history
+InfoRegisterHistoryCommand()
 # set janitor registers-on-stop
 RegistersOnStopParameter()
 
@@ -758,6 +1773,16 @@ RegistersOnStopParameter()
 DisassembleCommand()
 # set janitor disassemble-next-instr
 DisassembleNextInstrParameter()
+# set janitor disassemble-chunk-size
+DisassembleChunkSizeParameter()
+# set janitor disassemble-cache
+DisassembleCacheParameter()
+# set janitor disassemble-cache-size
+DisassembleCacheSizeParameter()
+# info janitor disassemble-cache
+InfoDisassembleCacheCommand()
+# set janitor disassemble-arrows
+DisassembleArrowsParameter()
 
 # janitor dump
 DumpCommand()
@@ -765,8 +1790,51 @@ DumpCommand()
 DumpWordWidthParameter()
 # set janitor dump-line-align
 DumpLineAlignParameter()
+# set janitor dump-collapse
+DumpCollapseParameter()
+# set janitor dump-symbols
+DumpSymbolsParameter()
 # janitor stack
 DumpStackCommand()
+# janitor snapshot
+SnapshotCommand()
+# info janitor snapshots
+InfoSnapshotsCommand()
+# set janitor diff-unchanged
+DiffUnchangedParameter()
+# janitor watch
+WatchCommand()
+WatchAddCommand()
+WatchDeleteCommand()
+WatchClearCommand()
+# janitor search
+SearchCommand()
+# set janitor search-target
+SearchTargetParameter()
+# janitor cfg
+CfgCommand()
+# janitor xref-index
+XrefIndexCommand()
+# janitor xrefs
+XrefsCommand()
+# set janitor xref-dir
+XrefDirParameter()
+# set janitor read-chunk-size
+ReadChunkSizeParameter()
+
+# set janitor output-file
+OutputFileParameter()
+# set janitor output-ansi
+OutputAnsiParameter()
+
+# set janitor memory-cache
+MemoryCacheParameter()
+# set janitor memory-cache-size
+MemoryCacheSizeParameter()
+# info janitor memory-cache
+InfoMemoryCacheCommand()
+# set janitor core-mmap
+CoreMmapParameter()
 
 # set janitor ansi
 AnsiParameter()
@@ -0,0 +1,171 @@
+"""Reading memory of core file targets directly from memory-mapped files.
+
+Memory of PT_LOAD segments stored in the core file, and sections of the executable
+and shared libraries, is served from mmap of those files without asking GDB.
+Anything else is left to GDB."""
+
+import bisect
+import re
+
+import gdb
+
+import janitor.elffile
+
+enabled = True
+
+CORE_FILE_RE = re.compile(r"^Local core dump file:\s*$")
+EXEC_FILE_RE = re.compile(r"^Local exec file:\s*$")
+FILE_NAME_RE = re.compile(r"^\s+`(.*)', file type")
+SECTION_RE = re.compile(r"^\s+0x([0-9a-fA-F]+) - 0x([0-9a-fA-F]+) is (\S+)(?: in (.*))?$")
+
+class MappedMemory(object):
+    """Address ranges of inferior memory backed by memory-mapped files."""
+
+    def __init__(self):
+        self.files = {}
+        self.starts = []
+        self.ends = []
+        self.views = []
+
+    def close(self):
+        self.starts = []
+        self.ends = []
+        self.views = []
+        for elf in self.files.values():
+            elf.close()
+        self.files = {}
+
+    def get_file(self, path):
+        if path not in self.files:
+            self.files[path] = janitor.elffile.ElfFile(path)
+        return self.files[path]
+
+    def overlaps(self, start, end):
+        index = bisect.bisect_right(self.starts, start)
+        if index > 0 and self.ends[index - 1] > start:
+            return True
+        return index < len(self.starts) and self.starts[index] < end
+
+    def add(self, start, view):
+        """Add range at START backed by VIEW, unless it overlaps range added before."""
+        end = start + len(view)
+        if len(view) == 0 or self.overlaps(start, end):
+            return False
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.views.insert(index, view)
+        return True
+
+    def add_core(self, path):
+        core = self.get_file(path)
+        for segment in core.segments:
+            if segment.type == janitor.elffile.PT_LOAD and segment.filesz != 0:
+                self.add(segment.vaddr, core.view[segment.offset : segment.offset + segment.filesz])
+
+    def add_section(self, path, name, start, end):
+        try:
+            elf = self.get_file(path)
+        except (IOError, OSError, janitor.elffile.ElfError):
+            return
+        for section in elf.sections:
+            if section.name == name and section.size == end - start:
+                data = elf.section_data(section)
+                if data != None:
+                    self.add(start, data)
+                return
+
+    def read(self, address, length):
+        """Get LENGTH bytes at ADDRESS, None if they are not all mapped."""
+        index = bisect.bisect_right(self.starts, address) - 1
+        if index < 0 or address >= self.ends[index]:
+            return None
+        offset = address - self.starts[index]
+        if address + length <= self.ends[index]:
+            return self.views[index][offset : offset + length]
+        # Range continues in adjacent mapped ranges
+        parts = [ self.views[index][offset:] ]
+        remaining = length - len(parts[0])
+        index += 1
+        while remaining > 0:
+            if index >= len(self.starts) or self.starts[index] != self.ends[index - 1]:
+                return None
+            parts.append(self.views[index][:remaining])
+            remaining -= len(parts[-1])
+            index += 1
+        return b"".join(parts)
+
+def load_memory():
+    """Build mapped memory from 'info target' output, None if the target is not a core file."""
+    info = gdb.execute("info target", False, True)
+    memory = MappedMemory()
+    is_core = False
+    block = None
+    block_file = None
+    sections = []
+    for line in info.splitlines():
+        if CORE_FILE_RE.match(line):
+            block = "core"
+            continue
+        if EXEC_FILE_RE.match(line):
+            block = "exec"
+            continue
+        match = FILE_NAME_RE.match(line)
+        if match != None:
+            block_file = match.group(1)
+            if block == "core":
+                try:
+                    memory.add_core(block_file)
+                    is_core = True
+                except (IOError, OSError, janitor.elffile.ElfError):
+                    return None
+            continue
+        match = SECTION_RE.match(line)
+        if match != None and block == "exec":
+            path = match.group(4) if match.group(4) != None else block_file
+            if path != None:
+                sections.append(( path, match.group(3), int(match.group(1), 16), int(match.group(2), 16) ))
+
+    if not is_core:
+        memory.close()
+        return None
+
+    # Memory stored in core takes precedence over file contents
+    for path, name, start, end in sections:
+        memory.add_section(path, name, start, end)
+    return memory
+
+memory = None
+memory_key = None
+
+def get_memory():
+    """Get mapped memory of selected inferior, None if it is not a core file."""
+    global memory, memory_key
+    inferior = gdb.selected_inferior()
+    if inferior.pid == 0:
+        return None
+    key = (inferior.num, inferior.pid, gdb.current_progspace().filename)
+    if key != memory_key:
+        invalidate()
+        memory_key = key
+        try:
+            memory = load_memory()
+        except gdb.error:
+            memory = None
+    return memory
+
+def invalidate():
+    global memory, memory_key
+    if memory != None:
+        memory.close()
+    memory = None
+    memory_key = None
+
+def read(address, length):
+    """Read memory from mapped core file, None if not possible."""
+    if not enabled:
+        return None
+    mapped = get_memory()
+    if mapped == None:
+        return None
+    return mapped.read(address, length)
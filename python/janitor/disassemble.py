@@ -1,17 +1,113 @@
 
 """Implementation of 'janitor disassemble' command for GDB."""
 
+import bisect
+import collections
+import heapq
+import re
+
 import gdb
 
 import janitor.ansiterm
 from janitor.ansiterm import term
+import janitor.cfg
 import janitor.dump
+import janitor.memcache
+import janitor.output
+import janitor.source
+import janitor.xref
 from janitor.dump import get_frame_pc
 
 start_address = None
 saved_pc = None
 length = None
 
+# Maximum number of bytes disassembled at once, None means unlimited
+disassemble_chunk_size = 0x1000
+
+# Longest instruction of supported architectures, used to estimate range of code to fetch
+MAX_INSTR_LENGTH = 16
+
+# Draw arrows from jumps to their targets in the listing
+jump_arrows = False
+# Maximum number of arrow lanes in the gutter
+JUMP_ARROWS_MAX_LANES = 8
+# Longer ranges are listed without arrows, as the whole listing has to be decoded before it is displayed
+JUMP_ARROWS_MAX_RANGE = 0x4000
+
+class DisassemblyCache(object):
+    """LRU cache of disassembled instructions.
+    
+    Entries are keyed by architecture, flavor and address and hold instruction bytes,
+    so that instruction is disassembled again when the code changes. Entries are
+    dropped when GDB settings in SETTINGS change."""
+    
+    # GDB settings which change disassembly of the same bytes
+    SETTINGS = ( "disassembler-options", "print asm-demangle" )
+    
+    def __init__(self):
+        self.enabled = True
+        # Maximum number of cached instructions
+        self.size_limit = 16384
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.settings = None
+    
+    def clear(self):
+        self.entries = collections.OrderedDict()
+    
+    def check_settings(self):
+        """Forget cached instructions and control flow graphs when SETTINGS differ from last check."""
+        settings = []
+        for name in self.SETTINGS:
+            try:
+                settings.append(gdb.parameter(name))
+            except RuntimeError:
+                # Setting is missing in older GDB
+                settings.append(None)
+        settings = tuple(settings)
+        if settings != self.settings:
+            if self.settings != None:
+                self.clear()
+                janitor.cfg.cache.clear()
+            self.settings = settings
+    
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+    
+    def lookup(self, arch_name, flavor, address, read_code):
+        """Get cached instruction at ADDRESS and its bytes, None if it's not cached or code has changed."""
+        if not self.enabled:
+            return None
+        key = (arch_name, flavor, address)
+        entry = self.entries.get(key)
+        if entry == None:
+            self.misses += 1
+            return None
+        code, asm = entry
+        try:
+            current_code = read_code(address, len(code))
+        except gdb.error:
+            current_code = None
+        if current_code != code:
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return { "addr": address, "asm": asm, "length": len(code) }, code
+    
+    def store(self, arch_name, flavor, instr, code):
+        if not self.enabled:
+            return
+        self.entries[(arch_name, flavor, instr["addr"])] = (code, instr["asm"])
+        while self.size_limit != None and len(self.entries) > self.size_limit:
+            self.entries.popitem(last = False)
+
+cache = DisassemblyCache()
+
 class DecorateArgs(object):
     STATE_NONE = 0
     STATE_REG = 1
@@ -47,7 +143,17 @@ class DecorateArgs(object):
         STATE_ANNO_IDEN: term.COLOR_GREEN | term.BOLD,
         STATE_ANNO_NUMBER: term.COLOR_GREEN
     }
-        
+    
+    # Words and single other characters of arguments
+    TOKEN_RE = re.compile(r"\w+|\W")
+    # Characters which don't change state inside of annotation identifier, number and other text
+    ANNO_IDEN_RE = re.compile(r"[\w%$#@:]*")
+    ANNO_NUMBER_RE = re.compile(r"[0-9A-Fa-fXx]*")
+    ANNO_OTHER_RE = re.compile(r"[^\w%$#@:]*")
+    
+    # Maximum number of memoized decorated arguments
+    MEMO_SIZE = 8192
+
 
     def __init__(self, arch_name, flavor):
         self.flavor = flavor
@@ -55,6 +161,8 @@ class DecorateArgs(object):
             self.keywords = self.I386_KEYWORDS
         if arch_name == "arm":
             self.registers = self.ARM_REGISTERS
+        # Decorated arguments by ( arguments, initial color, ANSI enabled )
+        self.memo = {}
     
     def new_state(self, state):
         if self.state == state:
@@ -75,125 +183,74 @@ class DecorateArgs(object):
         self.state_start = self.args_len
         self.termline.reset()
     
-    def peek_identifier(self):
-        ptr = self.index + 1
-        # To re or not to re?
-        while ptr < self.args_len:
-            c = self.args[ptr]
-            if not c.isalnum() and c != '_':
-                break
-            ptr += 1
-        return self.args[self.index : ptr]
-
     def invoke(self, args, termline):
-        
+        """Append decorated ARGS to TERMLINE. The same arguments recur often, so decorated
+strings are memoized."""
+        key = (args, termline.color, term.ansi_enabled)
+        decorated = self.memo.get(key)
+        if decorated == None:
+            line = janitor.ansiterm.TermLine()
+            line.color = termline.color
+            self.decorate(args, line)
+            decorated = "".join(line.line_as_list)
+            if len(self.memo) >= self.MEMO_SIZE:
+                self.memo.clear()
+            self.memo[key] = decorated
+        termline.append_raw(decorated, term.DEFAULT_COLOR)
+    
+    def decorate(self, args, termline):
         self.state = None
         self.termline = termline
         self.index = 0
         self.args = args
         self.state_start = 0
         self.args_len = len(args)
-        self.num_paren = 0
+        num_paren = 0
 
         self.new_state(self.STATE_NONE)
         
-        self.identifier = False
-        self.number = False
-        self.ptr = False
-        self.first = True
-        self.annotation = False
-        self.offset = False
-
-        while self.index < self.args_len:
-            c = self.args[self.index]
-            
-            # In annotation
-            if self.annotation:
-                if c.isalpha() or (c in "_%$#@:"):
-                    if not self.identifier and (not self.number or not (c.upper() in "ABCDEFX")):
-                        self.identifier = True
-                        self.new_state(self.STATE_ANNO_IDEN)
-                elif c.isdigit():
-                    if not self.identifier and not self.number:
-                        self.number = True
-                        self.new_state(self.STATE_ANNO_NUMBER)
-                elif self.identifier or self.number:
-                    self.identifier = False
-                    self.number = False
-                    self.new_state(self.STATE_ANNO)
-            
-            # % - Register name
-            elif c == '%':
-                if not self.identifier:
-                    if self.state == self.STATE_INDIRECT:
-                        self.new_state(self.STATE_INDIRECT_REG)
-                    else:
-                        self.new_state(self.STATE_REG)
-            
-            # $ or # - Assume constant value
-            elif c == '$' or c == '#':
-                if not self.identifier:
-                    self.new_state(self.STATE_CONST)
-            
-            # * on beginning of number or register - Indirect call
-            elif c == '*' and self.first:
-                self.new_state(self.STATE_INDIRECT)
-                self.identifier = False
-                self.number = False
-            
-            # Count parentheses to determine value type
-            elif c == '[' or c == '(':
-                self.num_paren += 1;
-                self.new_state(self.STATE_NONE)
-                self.identifier = False
-                self.number = False
-            elif c == ']' or c == ')':
-                self.num_paren -= 1;
-                self.new_state(self.STATE_NONE)
-                self.identifier = False
-                self.number = False
+        identifier = False
+        number = False
+        ptr = False
+        first = True
+        offset = False
+
+        for match in self.TOKEN_RE.finditer(args):
+            token = match.group()
+            c = token[0]
+            self.index = match.start()
             
             # Digit starts number, unless part of identifier
-            elif c.isdigit():
-                if not self.number and not self.identifier:
-                    self.number = True
+            if c.isdigit():
+                if not number and not identifier:
+                    number = True
                     # Try to determine value type
                     if self.state == self.STATE_NONE:
                         # after DWORD PTR
-                        if self.ptr:
-                            if self.num_paren == 0:
-                                ## Indirect jump - maybe
-                                #self.new_state(self.STATE_INDIRECT)
-                                # Offset
-                                self.new_state(self.STATE_OFFSET)
-                            else:
-                                # Offset
-                                self.new_state(self.STATE_OFFSET)
+                        if ptr:
+                            # Offset
+                            self.new_state(self.STATE_OFFSET)
+                        # Bare number - either const or offset. Take a guess.
+                        elif self.flavor == "intel" and num_paren == 0 and not offset:
+                            self.new_state(self.STATE_CONST)
                         else:
-                            # Bare number - either const or offset. Take a guess.
-                            if self.flavor == "intel" and self.num_paren == 0 and not self.offset:
-                                self.new_state(self.STATE_CONST)
-                            else:
-                                self.new_state(self.STATE_OFFSET)
-                
-                # Skip the number or whatever it is
-                self.index += len(self.peek_identifier())
+                            self.new_state(self.STATE_OFFSET)
                 continue
             
             # Identifier - most likely a register
-            elif c.isalpha() or c == '_':
-                ident = self.peek_identifier()
-                if not self.number and not self.identifier:
-                    self.identifier = True
-                    if self.keywords is not None and ident.upper() in self.keywords:
+            if c.isalpha() or c == '_':
+                if not number and not identifier:
+                    identifier = True
+                    ident = token.upper()
+                    if self.keywords is not None and ident in self.keywords:
                         # Keyword
                         self.new_state(self.STATE_KEYWORD)
-                        if ident.upper() == "PTR":
-                            self.ptr = True
+                        if ident == "PTR":
+                            ptr = True
                     elif self.state == self.STATE_INDIRECT or self.state == self.STATE_INDIRECT_REG:
                         self.new_state(self.STATE_INDIRECT_REG)
                     elif self.registers is not None:
-                        if ident.upper() in self.registers:
+                        if ident in self.registers:
                             self.new_state(self.STATE_REG)
                         else:
                             # Assume keyword
@@ -201,46 +258,203 @@ class DecorateArgs(object):
                     else:
                         # Assume register?
                         self.new_state(self.STATE_REG)
-                # Skip the identifier
-                self.index += len(ident)
                 continue
             
+            # % - Register name
+            if c == '%':
+                if not identifier:
+                    if self.state == self.STATE_INDIRECT:
+                        self.new_state(self.STATE_INDIRECT_REG)
+                    else:
+                        self.new_state(self.STATE_REG)
+            
+            # $ or # - Assume constant value
+            elif c == '$' or c == '#':
+                if not identifier:
+                    self.new_state(self.STATE_CONST)
+            
+            # * on beginning of number or register - Indirect call
+            elif c == '*' and first:
+                self.new_state(self.STATE_INDIRECT)
+                identifier = False
+                number = False
+            
+            # Count parentheses to determine value type
+            elif c == '[' or c == '(':
+                num_paren += 1
+                self.new_state(self.STATE_NONE)
+                identifier = False
+                number = False
+            elif c == ']' or c == ')':
+                num_paren -= 1
+                self.new_state(self.STATE_NONE)
+                identifier = False
+                number = False
+            
             # comma outside parentheses cancels ptr and offset
             elif c == ',':
                 self.new_state(self.STATE_NONE)
-                self.identifier = False
-                self.number = False
-                if self.num_paren == 0:
-                    self.ptr = False
-                    self.offset = False
+                identifier = False
+                number = False
+                if num_paren == 0:
+                    ptr = False
+                    offset = False
             
-            # : - assume offset following
-            #elif c == ':':
-            #    self.offset = True
-            #    self.new_state(self.STATE_NONE)
-            #    self.identifier = False
-            #    self.number = False
-            
-            # < - begins annotation
+            # < - begins annotation, which continues to the end
             elif c == '<':
                 self.new_state(self.STATE_ANNO)
-                self.annotation = True
+                self.decorate_annotation(self.index + 1, identifier, number)
+                break
             
             # end of number or identifier
             else:
                 self.new_state(self.STATE_NONE)
-                self.identifier = False
-                self.number = False
+                identifier = False
+                number = False
             
             # for special treatment of *
-            if c == ',':
-                self.first = True
-            else:
-                self.first = False
-        
-            self.index += 1
+            first = (c == ',')
         
         self.finish()
+    
+    def decorate_annotation(self, index, identifier, number):
+        args = self.args
+        while index < self.args_len:
+            # Skip characters which don't change state
+            if identifier:
+                index = self.ANNO_IDEN_RE.match(args, index).end()
+            elif number:
+                index = self.ANNO_NUMBER_RE.match(args, index).end()
+            if index >= self.args_len:
+                break
+            
+            c = args[index]
+            self.index = index
+            if c.isalpha() or (c in "_%$#@:"):
+                identifier = True
+                self.new_state(self.STATE_ANNO_IDEN)
+            elif c.isdigit():
+                number = True
+                self.new_state(self.STATE_ANNO_NUMBER)
+            else:
+                if identifier or number:
+                    identifier = False
+                    number = False
+                    self.new_state(self.STATE_ANNO)
+                index = self.ANNO_OTHER_RE.match(args, index + 1).end()
+                continue
+            index += 1
+
+decorators = {}
+
+def get_decorate_args(arch_name, flavor):
+    """Get DecorateArgs of architecture and flavor, kept with their memoized arguments."""
+    key = (arch_name, flavor)
+    if key not in decorators:
+        decorators[key] = DecorateArgs(arch_name, flavor)
+    return decorators[key]
+
+class JumpArrows(object):
+    """Gutter with arrows from jumps to their targets within listing.
+
+    Each jump spans lines from its source to its target and gets a lane (column)
+    of the gutter. Lanes are assigned in order of span start, a lane is reused once
+    the previous span in it has ended, so that the number of lanes is the largest
+    number of overlapping spans. Lane 0 is the rightmost one."""
+
+    FORWARD_COLOR = term.COLOR_GREEN
+    BACKWARD_COLOR = term.COLOR_CYAN
+
+    def __init__(self, addrs, jumps, max_lanes):
+        """ADDRS are addresses of listed instructions, JUMPS are ( source, target ) pairs."""
+        line_of = {}
+        for line in range(len(addrs)):
+            line_of[addrs[line]] = line
+        spans = []
+        for source, target in jumps:
+            target_line = line_of.get(target)
+            if target_line == None or target == source:
+                continue
+            source_line = line_of[source]
+            spans.append(( min(source_line, target_line), max(source_line, target_line), source_line, target_line ))
+        spans.sort()
+
+        free_lanes = []
+        # ( last line, lane ) of spans occupying lanes
+        busy_lanes = []
+        self.width = 0
+        # Spans starting at line, ( first line, last line, source line, target line, lane )
+        self.starts = collections.defaultdict(list)
+        self.targets = set()
+        self.sources = set()
+        for first, last, source_line, target_line in spans:
+            while len(busy_lanes) != 0 and busy_lanes[0][0] < first:
+                heapq.heappush(free_lanes, heapq.heappop(busy_lanes)[1])
+            if len(free_lanes) != 0:
+                lane = heapq.heappop(free_lanes)
+            elif self.width < max_lanes:
+                lane = self.width
+                self.width += 1
+            else:
+                # Too many overlapping jumps, this one is not drawn
+                continue
+            heapq.heappush(busy_lanes, ( last, lane ))
+            self.starts[first].append(( first, last, source_line, target_line, lane ))
+            self.targets.add(target_line)
+            self.sources.add(source_line)
+        self.active = []
+        self.line = -1
+
+    def color(self, span):
+        return self.FORWARD_COLOR if span[3] > span[2] else self.BACKWARD_COLOR
+
+    def advance(self, line):
+        """Update spans passing through LINE."""
+        if line == self.line:
+            return
+        self.line = line
+        self.active = [ span for span in self.active if span[1] >= line ] + self.starts.get(line, [])
+
+    def append(self, termline, line, continued):
+        """Append gutter of LINE, CONTINUED is True for wrapped part of its instruction."""
+        if self.width == 0:
+            return
+        self.advance(line)
+        # Columns are ( character, color ), the last one holds arrow heads
+        cells = [ ( " ", None ) ] * (self.width + 1)
+        ends = []
+        for span in self.active:
+            column = self.width - 1 - span[4]
+            if continued:
+                if span[1] > line:
+                    cells[column] = ( "|", self.color(span) )
+            elif span[0] < line < span[1]:
+                cells[column] = ( "|", self.color(span) )
+            else:
+                ends.append(span)
+        # Horizontal parts of spans ending at this line, starting with the leftmost ones
+        ends.sort(key = lambda span: -span[4])
+        for span in ends:
+            column = self.width - 1 - span[4]
+            color = self.color(span)
+            cells[column] = ( "," if span[0] == line else "`", color )
+            for right in range(column + 1, self.width):
+                char = cells[right][0]
+                if char == " ":
+                    cells[right] = ( "-", color )
+                elif char == "|":
+                    cells[right] = ( "+", cells[right][1] )
+            if cells[self.width][0] != ">":
+                cells[self.width] = ( ">" if span[3] == line else "-", color )
+
+        for char, color in cells:
+            if color == None:
+                termline.reset()
+            else:
+                termline.set_color(color)
+            termline.append(char)
+        termline.reset()
+        termline.append(" ")
 
 class Disassemble(janitor.dump.DumpBase):
     CURRENT_PC_COLOR = term.COLOR_GREEN | term.BOLD
@@ -281,9 +495,9 @@ class Disassemble(janitor.dump.DumpBase):
         
         self.termline.set_color(self.BYTES_COLOR)
         if length > 0: # Unlikely false
-            self.termline.append("%02X" % ord(bytes[0]))
+            self.termline.append("%02X" % bytes[0])
         for byte in bytes[1 : self.bytes_per_line]:
-            self.termline.append(" %02X" % ord(byte))
+            self.termline.append(" %02X" % byte)
         self.termline.reset()
         # padding
         if padding:
@@ -291,9 +505,101 @@ class Disassemble(janitor.dump.DumpBase):
                 self.termline.append((self.bytes_per_line - length) * "   ")
             self.termline.append(" ")
     
-    def invoke(self, arch, start_addr, end_addr, flavor):
+    def read_code(self, address, length):
+        """Get instruction bytes. They are sliced from buffer holding range of code
+up to `fetch_end`, so that the range is read from inferior only once."""
+        offset = address - self.code_address
+        if offset >= 0 and offset + length <= len(self.code):
+            return self.code[offset : offset + length]
+        
+        fetch_length = self.fetch_end - address
+        while fetch_length > length:
+            try:
+                self.code = bytes(janitor.memcache.read_memory(address, fetch_length))
+                self.code_address = address
+                return self.code[0 : length]
+            except gdb.error:
+                # End of range is not readable, try shorter one
+                fetch_length //= 2
+        return bytes(janitor.memcache.read_memory(address, length))
+    
+    def set_fetch_range(self, address, end_addr, count):
+        """Set end of code which will be read together with instruction at ADDRESS."""
+        if end_addr == None:
+            fetch_end = address + count * MAX_INSTR_LENGTH
+        else:
+            fetch_end = end_addr + MAX_INSTR_LENGTH
+        if disassemble_chunk_size != None:
+            fetch_end = min(fetch_end, address + disassemble_chunk_size + MAX_INSTR_LENGTH)
+        self.fetch_end = fetch_end
+    
+    def instructions(self, arch, start_addr, end_addr, count):
+        """Yield ( instruction, bytes ) pairs of COUNT instructions or of range up to END_ADDR.
+Cached instructions are used while their bytes are unchanged, the rest is disassembled
+in chunks of `disassemble_chunk_size` bytes, so that output starts immediately and
+only a part of long range is kept in memory."""
+        arch_name = arch.name()
+        address = start_addr
+        self.code_address = address
+        self.code = b""
+        while (count > 0) if end_addr == None else (address <= end_addr):
+            self.set_fetch_range(address, end_addr, count)
+            cached = cache.lookup(arch_name, self.flavor, address, self.read_code)
+            if cached != None:
+                yield cached
+                address += cached[0]["length"]
+                if count != None:
+                    count -= 1
+                continue
+            
+            chunk_end = end_addr
+            if disassemble_chunk_size != None:
+                chunk_end = address + disassemble_chunk_size - 1
+                if end_addr != None:
+                    chunk_end = min(end_addr, chunk_end)
+            if chunk_end == None:
+                disass = arch.disassemble(start_pc = address, count = count)
+            elif end_addr == None:
+                disass = arch.disassemble(start_pc = address, end_pc = chunk_end, count = count)
+            else:
+                disass = arch.disassemble(start_pc = address, end_pc = chunk_end)
+            if len(disass) == 0:
+                return
+            for instr in disass:
+                code = self.read_code(instr["addr"], instr["length"])
+                cache.store(arch_name, self.flavor, instr, code)
+                yield instr, code
+            address = disass[-1]["addr"] + disass[-1]["length"]
+            if count != None:
+                count -= len(disass)
+            disass = None
+    
+    def jump_arrows(self, arch, listing):
+        """Lay out arrows between lines of LISTING. Jumps are taken from cached control
+flow graph when the listing is within one function, otherwise they are parsed."""
+        addrs = [ instr["addr"] for instr, instr_bytes in listing ]
+        if len(addrs) == 0:
+            return JumpArrows(addrs, [], JUMP_ARROWS_MAX_LANES)
+        bounds = function_range(addrs[0])
+        if bounds != None and addrs[-1] < bounds[1]:
+            cfg = janitor.cfg.cache.get(arch, bounds[0], bounds[1], self.flavor)
+            # Jumps are sorted by source
+            first = bisect.bisect_left(cfg.jumps, ( addrs[0], ))
+            last = bisect.bisect_left(cfg.jumps, ( addrs[-1] + 1, ))
+            return JumpArrows(addrs, cfg.jumps[first : last], JUMP_ARROWS_MAX_LANES)
+        arch_name = arch.name()
+        jumps = []
+        for instr, instr_bytes in listing:
+            kind, target, falls = janitor.xref.instruction_flow(arch_name, instr["asm"])
+            if kind == janitor.xref.KIND_JUMP and target != None:
+                jumps.append(( instr["addr"], target ))
+        return JumpArrows(addrs, jumps, JUMP_ARROWS_MAX_LANES)
+    
+    def invoke(self, arch, start_addr, end_addr, flavor, source = False):
+        cache.check_settings()
         self.termline = janitor.ansiterm.TermLine()
-        self.decorate_args = DecorateArgs(arch.name(), flavor)
+        self.decorate_args = get_decorate_args(arch.name(), flavor)
+        self.flavor = flavor
         self.address = start_addr
         self.current_pc = None
         self.selected_pc = None
@@ -302,10 +608,14 @@ class Disassemble(janitor.dump.DumpBase):
             self.bytes_per_line = self.ARM_BYTES_PER_LINE
         
         count = None
-        if gdb.newest_frame().is_valid():
-            self.current_pc = get_frame_pc(gdb.newest_frame())
-        if gdb.selected_frame().is_valid():
-            self.selected_pc = get_frame_pc(gdb.selected_frame())
+        try:
+            if gdb.newest_frame().is_valid():
+                self.current_pc = get_frame_pc(gdb.newest_frame())
+            if gdb.selected_frame().is_valid():
+                self.selected_pc = get_frame_pc(gdb.selected_frame())
+        except gdb.error:
+            # No process, e.g. disassembling executable file
+            pass
         
         if end_addr == None:
             height = gdb.parameter("height")
@@ -313,11 +623,20 @@ class Disassemble(janitor.dump.DumpBase):
                 count = int(height / 2) - 2
             else:
                 count = 12
-            disass = arch.disassemble(start_pc = start_addr, count = count)
-        else:
-            disass = arch.disassemble(start_pc = start_addr, end_pc = end_addr)
     
-        for instr in disass:
+        listing = self.instructions(arch, start_addr, end_addr, count)
+        arrows = None
+        if jump_arrows and (end_addr == None or end_addr - start_addr < JUMP_ARROWS_MAX_RANGE):
+            listing = list(listing)
+            arrows = self.jump_arrows(arch, listing)
+        
+        sources = janitor.source.SourceLines() if source else None
+        
+        for line, (instr, instr_bytes) in enumerate(listing):
+            
+            # Source lines
+            if sources != None:
+                sources.show(instr["addr"])
             
             self.termline.start()
             
@@ -328,12 +647,13 @@ class Disassemble(janitor.dump.DumpBase):
             # PC indicator
             self.append_pc_indicator(instr_len)
             
+            # Jump arrows
+            if arrows != None:
+                arrows.append(self.termline, line, False)
+            
             # Address
             self.append_address(instr_addr)
             
-            # Read instruction bytes
-            instr_bytes = gdb.selected_inferior().read_memory(self.address, instr_len)
-            
             # First group of bytes
             self.append_bytes(instr_bytes[0 : self.bytes_per_line], True)
             
@@ -357,7 +677,7 @@ class Disassemble(janitor.dump.DumpBase):
                 self.decorate_args.invoke(instr_args, self.termline)
 
             # Display line
-            print(self.termline.get_line())
+            janitor.output.write_line(self.termline.get_line())
 
             # More lines if something didn't fit
             byte_ptr = self.bytes_per_line
@@ -366,7 +686,12 @@ class Disassemble(janitor.dump.DumpBase):
                 self.termline.start()
                 
                 # Margin + address space + ' '
-                self.termline.append((4 + self.ADDR_WIDTH) * " ")
+                if arrows != None:
+                    self.termline.append(3 * " ")
+                    arrows.append(self.termline, line, True)
+                    self.termline.append((1 + self.ADDR_WIDTH) * " ")
+                else:
+                    self.termline.append((4 + self.ADDR_WIDTH) * " ")
                 
                 # Instruction bytes
                 if instr_len > byte_ptr:
@@ -383,7 +708,7 @@ class Disassemble(janitor.dump.DumpBase):
                     wrap_args = False
                 
                 # Display line
-                print(self.termline.get_line())
+                janitor.output.write_line(self.termline.get_line())
             
             # Adjust address
             self.address += instr["length"]
@@ -392,8 +717,87 @@ class Disassemble(janitor.dump.DumpBase):
 
 disassemble_obj = Disassemble()
 
-def disassemble(arch, start_addr, end_addr, flavor):
-    return disassemble_obj.invoke(arch, start_addr, end_addr, flavor)
+def function_range(address):
+    """Get ( start, end ) of function containing ADDRESS, None if it's not known."""
+    try:
+        block = gdb.block_for_pc(address)
+    except RuntimeError:
+        return None
+    while block != None and block.function == None:
+        block = block.superblock
+    if block == None:
+        return None
+    return block.start, block.end
+
+def function_start(address):
+    """Get start of function containing ADDRESS, None if it's not known."""
+    bounds = function_range(address)
+    if bounds == None:
+        return None
+    return bounds[0]
+
+def anchored_start(arch, address, count):
+    """Find start of COUNT instructions before ADDRESS outside of known function.
+Decoding is tried from addresses far enough before ADDRESS, the first one whose
+instructions end exactly at ADDRESS is used."""
+    distance = count * MAX_INSTR_LENGTH
+    for skew in range(MAX_INSTR_LENGTH):
+        anchor = max(0, address - distance + skew)
+        if anchor >= address:
+            break
+        try:
+            disass = arch.disassemble(start_pc = anchor, end_pc = address - 1)
+        except gdb.error:
+            continue
+        if len(disass) != 0 and disass[-1]["addr"] + disass[-1]["length"] == address:
+            return disass[max(0, len(disass) - count)]["addr"]
+    raise gdb.GdbError ("cannot find instruction boundary before 0x%X" % address)
+
+def backward_start(arch, address, count, flavor):
+    """Get address of instruction COUNT instructions before ADDRESS.
+
+Variable length instructions can be decoded reliably only forward from a known
+boundary, so instructions are taken from cached control flow graph of the function,
+which is decoded from its start and kept for repeated backward scrolling."""
+    while count > 0:
+        bounds = function_range(address - 1)
+        if bounds == None:
+            return anchored_start(arch, address, count)
+        addrs = janitor.cfg.cache.get(arch, bounds[0], bounds[1], flavor).addrs
+        before = bisect.bisect_left(addrs, address)
+        if before >= count:
+            return addrs[before - count]
+        # Continue in the preceding function
+        count -= before
+        address = bounds[0]
+    return address
+
+def clear_caches():
+    """Forget cached disassembly, e.g. when objfiles change."""
+    cache.clear()
+    janitor.source.cache.clear()
+
+def disassemble(arch, start_addr, end_addr, flavor, source = False):
+    global start_address
+    try:
+        return disassemble_obj.invoke(arch, start_addr, end_addr, flavor, source)
+    except KeyboardInterrupt:
+        # Ctrl-C or quit from pager, continue with the first instruction not displayed
+        start_address = disassemble_obj.address
+        raise
+
+def disassemble_backward(arch, end_addr, count, flavor, source = False):
+    """Disassemble COUNT instructions ending at END_ADDR, return address of the first one."""
+    global start_address
+    start_addr = backward_start(arch, end_addr, count, flavor)
+    if start_addr < end_addr:
+        try:
+            disassemble_obj.invoke(arch, start_addr, end_addr - 1, flavor, source)
+        except KeyboardInterrupt:
+            # Ctrl-C or quit from pager, continue with the first instruction not displayed
+            start_address = disassemble_obj.address
+            raise
+    return start_addr
 
 def save_pc():
     global saved_pc
@@ -4,10 +4,15 @@ import gdb
 
 import janitor.ansiterm
 from janitor.ansiterm import term
+import janitor.memcache
+import janitor.output
+import janitor.registers
+import janitor.render
+import janitor.symbols
 import janitor.typecache
-
-ENDIAN_LITTLE = 0
-ENDIAN_BIG = 1
+from janitor.render import ENDIAN_LITTLE, ENDIAN_BIG, format_width, format_endian, decode_format
+from janitor.render import bytes_type, hex_table, diff_mask, DumpBase, DumpLayout, DumpData
+from janitor.registers import read_register
 
 endian = None
 width = None
@@ -24,25 +29,17 @@ length = None
 highlight_start = None
 highlight_end = None
 
-format_width = {
-    '1': 1,
-    'b': 1,
-    '2': 2,
-    'h': 2,
-    's': 2,
-    'w': 4,
-    '4': 4,
-    'd': 4,
-    'l': 4,
-    '8': 8,
-    'g': 8,
-    'q': 8
-}
+# Maximum number of bytes fetched from inferior in single read, None means unlimited
+read_chunk_size = 0x10000
 
-format_endian = {
-    'l': ENDIAN_LITTLE,
-    'b': ENDIAN_BIG
-}
+# Collapse lines repeating the previous line
+collapse = False
+
+# Display lines without changes when comparing with snapshot
+diff_unchanged = True
+
+# Display <symbol+offset> of word values pointing to loaded sections
+symbols = False
 
 escapes = {
     7: '\\a',
@@ -65,13 +62,13 @@ def cast_val_to_intptr(val):
 
 def get_frame_pc(frame):
     if i8086_hack:
-        return cast_val_to_intptr(frame.read_register("cs")) * 16 + frame.pc()
+        return cast_val_to_intptr(read_register(frame, "cs")) * 16 + frame.pc()
     return frame.pc()
 
 def get_frame_sp(frame):
     if i8086_hack:
-        return cast_val_to_intptr(frame.read_register("ss")) * 16 + cast_val_to_intptr(frame.read_register("sp"))
-    return cast_val_to_intptr(frame.read_register("sp"))
+        return cast_val_to_intptr(read_register(frame, "ss")) * 16 + cast_val_to_intptr(read_register(frame, "sp"))
+    return cast_val_to_intptr(read_register(frame, "sp"))
 
 
 def escape_string(s):
@@ -108,183 +105,62 @@ def remove_nonprintable(s):
 def parse_format(fmt):
     global endian, width
     
-    new_width = None
-    new_endian = None
-    width_letter = None
-    if len(fmt) == 0:
-        return
+    new_width, new_endian = decode_format(fmt)
     
-    for l in fmt:
-        if l in format_width:
-            if new_width == None:
-                new_width = format_width[l]
-                width_letter = l
-            elif new_width == 1 or l not in format_endian:
-                new_width = format_width[l]
-                # Reinterpret previous 'b' as endian specifier
-                pl = width_letter
-                if pl in format_endian:
-                    if new_endian != None and new_endian != format_endian[pl]:
-                        raise gdb.GdbError ("contradictory endian specifier")
-                    new_endian = format_endian[pl]
-                else:
-                    raise gdb.GdbError ("contradictory width specifier")
-                width_letter = l
-            elif l in format_endian:
-                if new_endian != None and new_endian != format_endian[l]:
-                    raise gdb.GdbError ("contradictory endian specifier")
-                new_endian = format_endian[l]
-            elif new_width != format_width[l]:
-                raise gdb.GdbError ("contradictory width specifier")                
-        elif l in format_endian:
-            if new_endian != None and new_endian != format_endian[l]:
-                raise gdb.GdbError ("contradictory endian specifier")
-            new_endian = format_endian[l]
-        else:
-            raise gdb.GdbError ("invalid format specifier")
-
     if new_width != None:
         width = new_width
     
     if new_endian != None:
         endian = new_endian
 
-class DumpBase(object):
-    def __init__(self):
-        pass
-
-    def append_address(self, addr):
-        # Address
-        self.termline.set_color(self.ADDRESS_COLOR)
-        self.termline.append("%0*X" % (self.ADDR_WIDTH, addr))
-        self.termline.reset()
-        self.termline.append(" ")
-    
-
-class Dump(DumpBase):
+class Dump(janitor.render.DumpRenderer):
+    """Dump of inferior memory configured by variables of this module."""
     
-    ADDRESS_COLOR = term.COLOR_WHITE | term.BOLD
-    BYTES_COLOR = term.COLOR_WHITE
-    BYTES_SEP_COLOR = term.COLOR_WHITE
-    HIGHLIGHT_BYTES_COLOR = term.COLOR_WHITE | term.BOLD
-    CHARS_COLOR = term.COLOR_YELLOW | term.BOLD
-    CHARS_ALT_COLOR = term.COLOR_YELLOW
-    CHARS_CTRL_COLOR = term.COLOR_BLACK | term.BACKGROUND_YELLOW | term.HIGHLIGHT
-    CHARS_CTRL_ALT_COLOR = term.COLOR_BLACK | term.BACKGROUND_YELLOW
+    @property
+    def width(self):
+        return width
     
-    BYTES_PER_LINE = 16
-    ALIGNED = 1
-    ADDR_WIDTH = 8
-    GROUPING = 8
+    @property
+    def endian(self):
+        return endian
     
-    word_separator = " "
-    group_separator = "-"
-
-    def __init__(self):
-        super(Dump, self).__init__()
-
-    def append_word_start(self):
-        if width > 2:
-            self.termline.reset()
-            self.termline.append((width-1)//2 * " ")
-
-    def append_word_end(self, offset):
-        offset += width
-        if width > 1:
-            self.termline.reset()
-            self.termline.append((width)//2 * " ")
-        if offset < self.BYTES_PER_LINE:
-            self.termline.set_color(self.BYTES_SEP_COLOR)
-            if offset % self.GROUPING == 0:
-                self.termline.append(self.group_separator)
-            else:
-                self.termline.append(self.word_separator)
-        return offset
-        
-    def append_padding(self, word_str, offset, color):
-        self.append_word_start()
-        if self.termline.color != color:
-            self.termline.set_color(color)
-        self.termline.append(word_str)
-        return self.append_word_end(offset)
+    @property
+    def highlight_start(self):
+        return highlight_start
     
-    def append_byte(self, byte_str, address):
-        color = self.BYTES_COLOR
-        if address != None and highlight_start != None:
-            if address >= highlight_start:
-                color = self.HIGHLIGHT_BYTES_COLOR
-        if address != None and highlight_end != None:
-            if highlight_start == None:
-                color = self.HIGHLIGHT_BYTES_COLOR
-            if address >= highlight_end:
-                color = self.BYTES_COLOR
-        if self.termline.color != color:
-            self.termline.set_color(color)
-        self.termline.append(byte_str)
+    @property
+    def highlight_end(self):
+        return highlight_end
     
-    def append_bytes(self, bytes, offset, length, address):
-        word_off = 0
-        
-        # Padding before real start
-        while word_off + width <= offset:
-            self.termline.reset()
-            word_off = self.append_padding(width * "  ", word_off, term.DEFAULT_COLOR)
-        
-        # Process each n-width group of bytes
-        while word_off < offset + length:
-            self.append_word_start()
-            word = []
-            word_range = range(0, width, 1) if endian == ENDIAN_BIG else range(width - 1, -1, -1)
-            for idx in word_range:
-                if word_off + idx < offset or word_off + idx >= offset + length:
-                    self.append_byte("  ", None)
-                else:
-                    self.append_byte("%02X" % ord(bytes[word_off - offset + idx]), address + word_off + idx)
-            word_off = self.append_word_end(word_off)
-        
-        while word_off < self.BYTES_PER_LINE:
-            self.termline.reset()
-            word_off = self.append_padding(width * "  ", word_off, term.DEFAULT_COLOR)
-        
-        self.termline.reset()
-        self.termline.append(" ")
+    @property
+    def collapse(self):
+        return collapse
     
-    def append_chars(self, bytes, offset, length):
-        if offset != 0:
-            self.termline.append(offset * " ")
-        for c in bytes:
-            color = self.CHARS_COLOR
-            asc = ord(c)
-            
-            if (asc & 127) < 32:
-                color = self.CHARS_CTRL_COLOR
-                asc += 64
-            elif (asc & 127) == 127:
-                color |= self.CHARS_CTRL_COLOR
-                asc -= 64
-            
-            if asc > 128:
-                if color == self.CHARS_CTRL_COLOR:
-                    color = self.CHARS_CTRL_ALT_COLOR
-                else:
-                    color = self.CHARS_ALT_COLOR
-                asc -= 128
-            
-            if color != self.termline.color:
-                self.termline.set_color(color)
-            
-            self.termline.append(chr(asc))
+    @property
+    def read_chunk_size(self):
+        return read_chunk_size
     
-    def to_dump_string(self, s):
-        self.termline = janitor.ansiterm.TermLine()
-        self.append_chars(s, 0, len(s))
-        return self.termline.get_line()
+    @property
+    def annotate(self):
+        return janitor.symbols.format_symbol if symbols else None
     
-    def invoke(self, start_addr, end_addr):
-        self.termline = janitor.ansiterm.TermLine()
+    def read_chunk(self, address, line_address, end_addr):
+        """Read memory starting at ADDRESS, up to END_ADDR inclusive, in single request.
+Chunk ends on line boundary. If memory can't be read, retry with smaller chunks,
+down to the single line starting at LINE_ADDRESS."""
+        length, min_length = self.chunk_length(address, line_address, end_addr)
         
-        address = start_addr
-
+        while True:
+            try:
+                return janitor.memcache.read_memory(address, length)
+            except gdb.error:
+                if length <= min_length:
+                    raise
+            # Try again with half of the lines, so unreadable memory is located quickly
+            lines = (line_address + length - address) // self.BYTES_PER_LINE // 2
+            length = max(line_address + lines * self.BYTES_PER_LINE - address, min_length)
+    
+    def invoke(self, start_addr, end_addr, reference = None, changed_only = False):
         if end_addr == None:
             height = gdb.parameter("height")
             if height != None:
@@ -292,39 +168,10 @@ class Dump(DumpBase):
             else:
                 count = 12
             end_addr = start_addr + count * self.BYTES_PER_LINE - 1
-            
-        if self.ALIGNED > 1:
-            address -= address % self.ALIGNED
         
-        while address <= end_addr:
-            self.termline.start()
-            
-            # Address
-            self.append_address(address)
-
-            # Number of bytes to read
-            start_off = 0
-            if address < start_addr:
-                start_off = start_addr - address
-            bytes_to_read = self.BYTES_PER_LINE - start_off
-            if address + bytes_to_read > end_addr:
-                bytes_to_read = end_addr - address + 1
-            
-            bytes = gdb.selected_inferior().read_memory(address + start_off, bytes_to_read)
-
-            # Bytes
-            self.append_bytes(bytes, start_off, bytes_to_read, address)
-            
-            # Chars
-            self.append_chars(bytes, start_off, bytes_to_read)
-            
-            print(self.termline.get_line())
-            
-            address += self.BYTES_PER_LINE
-    
-        return end_addr + 1
+        return super(Dump, self).invoke(start_addr, end_addr, reference, changed_only)
 
 dump_obj = Dump()
 
-def dump(start_addr, end_addr):
-    return dump_obj.invoke(start_addr, end_addr)
+def dump(start_addr, end_addr, reference = None, changed_only = False):
+    return dump_obj.invoke(start_addr, end_addr, reference, changed_only)
@@ -0,0 +1,176 @@
+"""Minimal ELF file reader. Doesn't depend on gdb module."""
+
+import mmap
+import struct
+
+PT_LOAD = 1
+PT_NOTE = 4
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+SHF_ALLOC = 2
+SHF_EXECINSTR = 4
+SHF_TLS = 0x400
+
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STB_GLOBAL = 1
+SHN_UNDEF = 0
+SHN_LORESERVE = 0xff00
+
+NT_GNU_BUILD_ID = 3
+
+class ElfError(Exception):
+    pass
+
+class Segment(object):
+    def __init__(self, type, offset, vaddr, filesz, memsz, flags):
+        self.type = type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.filesz = filesz
+        self.memsz = memsz
+        self.flags = flags
+
+class Section(object):
+    def __init__(self, name, type, flags, addr, offset, size, link):
+        self.name = name
+        self.type = type
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+        self.link = link
+
+class ElfFile(object):
+    """ELF file mapped to memory. Contents are accessed without copying through `view`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        try:
+            self.parse()
+        except ElfError:
+            self.close()
+            raise
+        except (struct.error, IndexError, ValueError):
+            self.close()
+            raise ElfError ("invalid ELF file " + path)
+
+    def close(self):
+        if self.map == None:
+            return
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Slices of the map are still in use, it is closed when they are released
+            pass
+        self.map = None
+
+    def parse(self):
+        ident = self.map[0:16]
+        if ident[0:4] != b"\x7fELF":
+            raise ElfError ("not an ELF file " + self.path)
+        self.is64 = (ident[4] == 2)
+        self.endian = "<" if ident[5] == 1 else ">"
+        e = self.endian
+        if self.is64:
+            (self.type, self.machine, version, self.entry, phoff, shoff, flags, ehsize,
+                    phentsize, phnum, shentsize, shnum, shstrndx) = struct.unpack_from(e + "HHIQQQIHHHHHH", self.map, 16)
+        else:
+            (self.type, self.machine, version, self.entry, phoff, shoff, flags, ehsize,
+                    phentsize, phnum, shentsize, shnum, shstrndx) = struct.unpack_from(e + "HHIIIIIHHHHHH", self.map, 16)
+
+        self.segments = []
+        for index in range(phnum):
+            offset = phoff + index * phentsize
+            if self.is64:
+                p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align = struct.unpack_from(e + "IIQQQQQQ", self.map, offset)
+            else:
+                p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align = struct.unpack_from(e + "IIIIIIII", self.map, offset)
+            self.segments.append(Segment(p_type, p_offset, p_vaddr, p_filesz, p_memsz, p_flags))
+
+        self.sections = []
+        headers = []
+        for index in range(shnum):
+            offset = shoff + index * shentsize
+            if self.is64:
+                headers.append(struct.unpack_from(e + "IIQQQQIIQQ", self.map, offset))
+            else:
+                headers.append(struct.unpack_from(e + "IIIIIIIIII", self.map, offset))
+        names_offset = None
+        if shstrndx < len(headers):
+            names_offset = headers[shstrndx][4]
+        for sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize in headers:
+            name = self.get_string(names_offset + sh_name) if names_offset != None else ""
+            self.sections.append(Section(name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link))
+
+    def get_string(self, offset):
+        end = self.map.find(b"\0", offset)
+        if end == -1:
+            raise ElfError ("invalid string offset")
+        return self.map[offset:end].decode("iso-8859-1")
+
+    def get_section(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+    def section_data(self, section):
+        """Get contents of SECTION without copying."""
+        if section.type == SHT_NOBITS:
+            return None
+        return self.view[section.offset : section.offset + section.size]
+
+    def symbols(self):
+        """Iterate over ( name, value, size, info, section index ) of symbols in .symtab and .dynsym."""
+        if self.is64:
+            entry = struct.Struct(self.endian + "IBBHQQ")
+        else:
+            entry = struct.Struct(self.endian + "IIIBBH")
+        for section in self.sections:
+            if (section.type != SHT_SYMTAB and section.type != SHT_DYNSYM) or section.link >= len(self.sections):
+                continue
+            names_offset = self.sections[section.link].offset
+            count = section.size // entry.size
+            table = self.view[section.offset : section.offset + count * entry.size]
+            try:
+                for fields in entry.iter_unpack(table):
+                    if self.is64:
+                        st_name, st_info, st_other, st_shndx, st_value, st_size = fields
+                    else:
+                        st_name, st_value, st_size, st_info, st_other, st_shndx = fields
+                    if st_name == 0:
+                        continue
+                    yield self.get_string(names_offset + st_name), st_value, st_size, st_info, st_shndx
+            finally:
+                table.release()
+
+    def notes(self, offset, size):
+        """Iterate over ( type, name, description ) of notes in range of file."""
+        e = self.endian
+        end = offset + size
+        while offset + 12 <= end:
+            namesz, descsz, note_type = struct.unpack_from(e + "III", self.map, offset)
+            offset += 12
+            name = self.map[offset : offset + namesz].rstrip(b"\0")
+            offset += (namesz + 3) & ~3
+            desc = self.map[offset : offset + descsz]
+            offset += (descsz + 3) & ~3
+            yield note_type, name, desc
+
+    def build_id(self):
+        """Get GNU build ID as hex string, None if the file doesn't have one."""
+        ranges = [ ( s.offset, s.size ) for s in self.sections if s.name == ".note.gnu.build-id" ]
+        ranges += [ ( p.offset, p.filesz ) for p in self.segments if p.type == PT_NOTE ]
+        for offset, size in ranges:
+            for note_type, name, desc in self.notes(offset, size):
+                if note_type == NT_GNU_BUILD_ID and name == b"GNU":
+                    return "".join("%02x" % byte for byte in bytearray(desc))
+        return None
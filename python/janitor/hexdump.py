@@ -0,0 +1,190 @@
+"""Colored hexdump of files in janitor style, usable outside GDB.
+
+Usage: python -m janitor.hexdump [options] FILE [offset] [length] [/fmt]
+
+The /fmt parameter is the same as for `janitor dump` command."""
+
+import argparse
+import collections
+import mmap
+import multiprocessing
+import os
+import sys
+
+import janitor.ansiterm
+from janitor.ansiterm import term
+import janitor.output
+import janitor.render
+
+# Size of file part rendered by single worker process
+PART_SIZE = 0x100000
+
+class FileDump(janitor.render.DumpRenderer):
+    """Dump of memory-mapped file, addresses are file offsets plus BASE."""
+
+    read_chunk_size = 0x10000
+
+    def __init__(self, view, base):
+        super(FileDump, self).__init__()
+        self.view = view
+        self.base = base
+
+    def read_chunk(self, address, line_address, end_addr):
+        length, min_length = self.chunk_length(address, line_address, end_addr)
+        offset = address - self.base
+        return self.view[offset : offset + length]
+
+class PartDump(FileDump):
+    """Collects lines of a part of file. Collapsed ranges are kept as ( start, end ) tuples,
+so they can be joined with ranges of neighboring parts."""
+
+    def write_line(self, line):
+        self.lines.append(line)
+
+    def write_collapsed(self, start_addr, end_addr):
+        self.lines.append(( start_addr, end_addr ))
+
+    def render(self, start_addr, end_addr, first_addr):
+        self.lines = []
+        # With collapsing the line before the part is dumped too, so that repeating it is noticed
+        if self.collapse and start_addr > first_addr:
+            self.invoke(start_addr - self.BYTES_PER_LINE, end_addr)
+            return self.lines[1:]
+        self.invoke(start_addr, end_addr)
+        return self.lines
+
+# Dump object of worker process
+worker_dump = None
+
+def open_view(path):
+    with open(path, "rb") as f:
+        return memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+
+def configure(dump, args, width, endian):
+    dump.width = width
+    dump.endian = endian
+    dump.collapse = args.collapse
+
+def init_worker(path, args, width, endian, ansi_enabled):
+    global worker_dump
+    term.ansi_enabled = ansi_enabled
+    worker_dump = PartDump(open_view(path), args.address)
+    configure(worker_dump, args, width, endian)
+
+def render_part(part):
+    start_addr, end_addr, first_addr = part
+    return worker_dump.render(start_addr, end_addr, first_addr)
+
+def dump_parallel(args, view, width, endian, start_addr, end_addr):
+    """Render parts of file in worker processes, write them in order.
+Only limited number of parts is rendered ahead of the output."""
+    dump = FileDump(view, args.address)
+    dump.termline = janitor.ansiterm.TermLine()
+    # Collapsed range waiting for continuation in the next part
+    repeat = [ None ]
+
+    def write_lines(lines):
+        for line in lines:
+            if isinstance(line, tuple):
+                if repeat[0] != None and repeat[0][1] + 1 == line[0]:
+                    repeat[0] = ( repeat[0][0], line[1] )
+                else:
+                    flush()
+                    repeat[0] = line
+            else:
+                flush()
+                janitor.output.write_line(line)
+
+    def flush():
+        if repeat[0] != None:
+            dump.write_collapsed(repeat[0][0], repeat[0][1])
+            repeat[0] = None
+
+    pool = multiprocessing.Pool(args.jobs, init_worker, (args.file, args, width, endian, term.ansi_enabled))
+    try:
+        pending = collections.deque()
+        part_start = start_addr
+        while part_start <= end_addr:
+            part_end = min(part_start + PART_SIZE - 1, end_addr)
+            pending.append(pool.apply_async(render_part, (( part_start, part_end, start_addr ),)))
+            part_start = part_end + 1
+            if len(pending) >= 2 * args.jobs:
+                write_lines(pending.popleft().get())
+        while len(pending) != 0:
+            write_lines(pending.popleft().get())
+        flush()
+    finally:
+        pool.terminate()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog = "python -m janitor.hexdump",
+            description = "Display file contents as colored hexdump in janitor style.")
+    parser.add_argument("file", metavar = "FILE")
+    parser.add_argument("range", metavar = "offset/length//fmt", nargs = "*",
+            help = "offset and length of dumped part, /fmt as in janitor dump command")
+    parser.add_argument("-a", "--address", type = lambda s: int(s, 0), default = 0,
+            help = "address displayed for the start of file")
+    parser.add_argument("-c", "--collapse", action = "store_true",
+            help = "replace lines repeating the previous line with '*'")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+            help = "number of processes rendering parts of file")
+    parser.add_argument("--color", choices = ( "auto", "always", "never" ), default = "auto")
+    args = parser.parse_intermixed_args(argv)
+
+    fmt = ""
+    numbers = []
+    for arg in args.range:
+        if arg.startswith("/"):
+            fmt = arg[1:]
+        else:
+            try:
+                numbers.append(int(arg, 0))
+            except ValueError:
+                parser.error("invalid number " + arg)
+    if len(numbers) > 2:
+        parser.error("too many arguments")
+    args.offset = numbers[0] if len(numbers) > 0 else 0
+    args.length = numbers[1] if len(numbers) > 1 else None
+    try:
+        args.width, args.endian = janitor.render.decode_format(fmt)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.jobs < 1:
+        parser.error("invalid number of jobs")
+    return args
+
+def main(argv = None):
+    args = parse_args(sys.argv[1:] if argv == None else argv)
+
+    if args.color == "auto":
+        term.ansi_enabled = sys.stdout.isatty()
+    else:
+        term.ansi_enabled = (args.color == "always")
+
+    width = args.width if args.width != None else 1
+    endian = args.endian if args.endian != None else janitor.render.ENDIAN_LITTLE
+
+    size = os.path.getsize(args.file)
+    end = size if args.length == None else min(size, args.offset + args.length)
+    if args.offset >= end:
+        return 0
+    view = open_view(args.file)
+    start_addr = args.address + args.offset
+    end_addr = args.address + end - 1
+
+    try:
+        with janitor.output.Output(stream = sys.stdout):
+            if args.jobs > 1 and end - args.offset > PART_SIZE:
+                dump_parallel(args, view, width, endian, start_addr, end_addr)
+            else:
+                dump = FileDump(view, args.address)
+                configure(dump, args, width, endian)
+                dump.invoke(start_addr, end_addr)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Output closed, e.g. by head
+        sys.stderr.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
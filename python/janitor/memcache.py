@@ -0,0 +1,154 @@
+"""Page granular cache of inferior memory shared by janitor commands."""
+
+import collections
+
+import gdb
+
+import janitor.corefile
+
+PAGE_SIZE = 4096
+
+class MemoryCache(object):
+    def __init__(self):
+        self.enabled = False
+        # Maximum cache size in bytes
+        self.size_limit = 1024 * 1024
+        self.pages = collections.OrderedDict()
+        # Pages which couldn't be read as a whole, they are read exactly as requested
+        self.uncached = set()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+        self.bytes_read = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        if len(self.pages) != 0:
+            self.pages = collections.OrderedDict()
+            self.invalidations += 1
+
+    def clear_uncached(self):
+        self.uncached = set()
+
+    def max_pages(self):
+        if self.size_limit == None:
+            return None
+        return self.size_limit // PAGE_SIZE
+
+    def target_read(self, inferior, address, length):
+        self.reads += 1
+        self.bytes_read += length
+        return bytes(inferior.read_memory(address, length))
+
+    def store_page(self, key, page):
+        self.pages[key] = page
+        max_pages = self.max_pages()
+        if max_pages != None:
+            while len(self.pages) > max_pages:
+                self.pages.popitem(last = False)
+
+    def read_pages(self, inferior, first_page, end_page):
+        """Read and store pages FIRST_PAGE to END_PAGE (exclusive). When they can't be
+read at once, pages are read one by one and those failing are marked uncached."""
+        try:
+            data = self.target_read(inferior, first_page * PAGE_SIZE, (end_page - first_page) * PAGE_SIZE)
+        except gdb.error:
+            if end_page - first_page == 1:
+                self.uncached.add((inferior.num, first_page))
+                return
+            for page_num in range(first_page, end_page):
+                self.read_pages(inferior, page_num, page_num + 1)
+            return
+        offset = 0
+        for page_num in range(first_page, end_page):
+            self.store_page((inferior.num, page_num), data[offset : offset + PAGE_SIZE])
+            offset += PAGE_SIZE
+
+    def read(self, address, length):
+        """Read LENGTH bytes of memory at ADDRESS from cache or from selected inferior."""
+        # Core file memory is mapped directly, no need to cache it
+        data = janitor.corefile.read(address, length)
+        if data != None:
+            return data
+
+        inferior = gdb.selected_inferior()
+        if not self.enabled or length <= 0:
+            return bytearray(inferior.read_memory(address, length))
+
+        first_page = address // PAGE_SIZE
+        last_page = (address + length - 1) // PAGE_SIZE
+        for page_num in range(first_page, last_page + 1):
+            if (inferior.num, page_num) in self.uncached:
+                # Not readable as a whole, e.g. partly mapped or device memory
+                return bytearray(self.target_read(inferior, address, length))
+
+        # Collect consecutive missing pages to read them at once
+        missing_start = None
+        for page_num in range(first_page, last_page + 2):
+            if page_num <= last_page:
+                if (inferior.num, page_num) not in self.pages:
+                    self.misses += 1
+                    if missing_start == None:
+                        missing_start = page_num
+                    continue
+                self.hits += 1
+            if missing_start != None:
+                self.read_pages(inferior, missing_start, page_num)
+                missing_start = None
+
+        parts = []
+        for page_num in range(first_page, last_page + 1):
+            key = (inferior.num, page_num)
+            page = self.pages.get(key)
+            if page == None:
+                # Page failed now or was dropped to keep size limit
+                return bytearray(self.target_read(inferior, address, length))
+            self.pages.move_to_end(key)
+            parts.append(page)
+
+        offset = address - first_page * PAGE_SIZE
+        return bytearray(b"".join(parts)[offset : offset + length])
+
+    def read_string(self, address, limit = None):
+        """Read NUL-terminated string at ADDRESS, page by page. Terminating NUL is not included."""
+        result = []
+        total = 0
+        length = None
+        while limit == None or total < limit:
+            if length == None:
+                length = PAGE_SIZE - address % PAGE_SIZE
+                if limit != None:
+                    length = min(length, limit - total)
+            try:
+                data = bytes(self.read(address, length))
+            except gdb.error:
+                # Page may be only partially readable, try smaller pieces
+                if length > 1:
+                    length //= 2
+                    continue
+                if total == 0:
+                    raise
+                break
+            end = data.find(b"\0")
+            if end != -1:
+                result.append(data[:end])
+                break
+            result.append(data)
+            total += len(data)
+            address += len(data)
+            length = None
+        return bytearray(b"".join(result))
+
+cache = MemoryCache()
+
+def read_memory(address, length):
+    return cache.read(address, length)
+
+def read_string(address, limit = None):
+    return cache.read_string(address, limit)
+
+def invalidate():
+    cache.invalidate()
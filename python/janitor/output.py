@@ -0,0 +1,75 @@
+"""Destination of lines produced by janitor dump and disassemble commands."""
+
+import io
+
+from janitor.ansiterm import term
+
+# File to which output is appended, None means terminal
+output_file = None
+
+# Keep ANSI terminal sequences in output written to file
+keep_ansi = False
+
+# Size of buffer used when writing to file
+BUFFER_SIZE = 256 * 1024
+
+class Output(object):
+    """Writes lines either to terminal or to file.
+
+    Used as context manager, while active all lines written with write_line() go to it."""
+
+    def __init__(self, path = None, append = False, stream = None):
+        self.path = path
+        self.append = append
+        # Already open file object, written as is
+        self.stream = stream
+        self.file = None
+        self.previous = None
+        self.saved_ansi = None
+
+    def __enter__(self):
+        global current
+        if self.path != None:
+            self.file = io.open(self.path, "a" if self.append else "w", buffering = BUFFER_SIZE,
+                    encoding = "utf-8", errors = "replace")
+            if not keep_ansi:
+                self.saved_ansi = term.ansi_enabled
+                term.ansi_enabled = False
+        self.previous = current
+        current = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global current
+        current = self.previous
+        self.previous = None
+        if self.saved_ansi != None:
+            term.ansi_enabled = self.saved_ansi
+            self.saved_ansi = None
+        if self.file != None:
+            self.file.close()
+            self.file = None
+        return False
+
+    def write_line(self, line):
+        if self.stream != None:
+            self.stream.write(line)
+            self.stream.write(u"\n")
+        elif self.file == None:
+            print(line)
+        else:
+            self.file.write(line)
+            self.file.write(u"\n")
+
+current = Output()
+
+def open_output(path = None, append = False):
+    """Get output for command. Without PATH configured output file or terminal is used."""
+    if path == None:
+        if output_file == None:
+            return Output()
+        return Output(output_file, True)
+    return Output(path, append)
+
+def write_line(line):
+    current.write_line(line)
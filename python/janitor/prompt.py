@@ -7,7 +7,9 @@ import sys
 
 import janitor.typecache
 import janitor.dump
+import janitor.registers
 import janitor.ansiterm
+import janitor.memcache
 
 class PrettyPromptException(Exception):
     pass
@@ -34,6 +36,13 @@ py_string_types = { "c", "sc", "uc", "pc", "psc", "puc" }
 py_int_types = { "s", "us", "i", "ui", "l", "ul", "ll", "ull" }
 py_float_types = { "f", "d", "ld" }
     
+def value_string(value):
+    """Convert gdb.Value to string, reading pointed memory through janitor memory cache."""
+    value_type = value.type.strip_typedefs()
+    if value_type.code == gdb.TYPE_CODE_PTR and value_type.target().sizeof == 1:
+        return janitor.memcache.read_string(int(value)).decode("iso-8859-1")
+    return value.string("iso-8859-1")
+
 def try_cast(value, expr):
     if len(expr) == 0:
         raise PrettyPromptException()
@@ -80,14 +89,14 @@ def try_cast(value, expr):
     
     if string_str != None:
         if string_str == 's':
-            value = value.string("iso-8859-1")
+            value = value_string(value)
         elif string_str == 'e':
-            value = janitor.dump.escape_string(value.string("iso-8859-1"))
+            value = janitor.dump.escape_string(value_string(value))
         elif string_str == 't':
             dump = janitor.dump.Dump()
-            value = dump.to_dump_string(value.string("iso-8859-1"))
+            value = dump.to_dump_string(value_string(value))
         elif string_str == 'r':
-            value = janitor.dump.remove_nonprintable(value.string("iso-8859-1"))
+            value = janitor.dump.remove_nonprintable(value_string(value))
         else:
             raise PrettyPromptException()
     
@@ -324,7 +333,7 @@ def substitute_expression(expression, numbers = False):
             elif func == 'r' or func == 'nr':
                 # Read register
                 try:
-                    result = frame.read_register(attr)
+                    result = janitor.registers.read_register(frame, attr)
                 except Exception as e:
                     return "?{"+func+":?"+attr+"!"+str(e)+"}"
             elif attr == 'num' or func == 'fn':
@@ -1,10 +1,15 @@
 
 """Library functions for 'info janitor registers' and 'info janitor cpu-flags' commands."""
 
+import array
+import bisect
+import collections
+
 import gdb
 
 import janitor.ansiterm
 from janitor.ansiterm import term
+import janitor.symbols
 import janitor.typecache
 
 FLAGS_BITMASK_COLOR = term.COLOR_WHITE
@@ -21,6 +26,11 @@ VALUE_CHANGED_ATTR = term.HIGHLIGHT
 
 REG_LABEL_COLOR = term.COLOR_CYAN | term.BOLD
 REG_VALUE_COLOR = term.COLOR_MAGENTA | term.BOLD
+THREAD_COLOR = term.COLOR_YELLOW | term.BOLD
+SYMBOL_COLOR = term.COLOR_GREEN
+
+# Number of frames compared when threads are grouped by stack
+GROUP_STACK_DEPTH = 8
 
 class CpuDef(object):
     def __init__(self, regs, flags_reg, lines_list, flags_list, widest_register_type, flags_type):
@@ -30,6 +40,16 @@ class CpuDef(object):
         self.flags_list = flags_list
         self.widest_register_type = widest_register_type
         self.flags_type = flags_type
+        # Render plans for ANSI enabled and disabled
+        self.plans = {}
+    
+    def render_plan(self):
+        """Get register lines compiled for current terminal settings."""
+        plan = self.plans.get(term.ansi_enabled)
+        if plan == None:
+            plan = RenderPlan(self.lines_list)
+            self.plans[term.ansi_enabled] = plan
+        return plan
 
 #
 # i386
@@ -142,11 +162,132 @@ arm64_registers = ( "x0", "x1", "x2", "x3", "x4", "x5", "x6", "x7", "x8", "x9",
 
 arm64_def = CpuDef(arm64_registers, "cpsr", arm64_lines, arm64_flags_list, "unsigned long long", "unsigned int")
 
-# previous registers value
-prev_registers = {}
+class RegisterSnapshot(object):
+    """Registers of one frame of one thread, each read from GDB only once per stop."""
+    
+    def __init__(self, frame, thread_num):
+        self.frame = frame
+        self.thread_num = thread_num
+        self.raw = {}
+        self.values = {}
+        self.cpu_def = get_cpu_def(frame.architecture().name())
+    
+    def fill(self):
+        """Read all registers of CPU definition in one pass."""
+        if self.cpu_def is None:
+            return
+        for reg_name in self.cpu_def.regs:
+            if reg_name not in self.raw:
+                self.raw[reg_name] = self.frame.read_register(reg_name)
+    
+    def read(self, reg_name):
+        """Get register REG_NAME as gdb.Value."""
+        if reg_name not in self.raw:
+            self.raw[reg_name] = self.frame.read_register(reg_name)
+        return self.raw[reg_name]
+    
+    def value(self, reg_name):
+        """Get register REG_NAME as integer, cast to the widest register type
+or to flags type of the CPU definition."""
+        if reg_name in self.values:
+            return self.values[reg_name]
+        value = self.read(reg_name)
+        if self.cpu_def is not None:
+            if reg_name == self.cpu_def.flags_reg:
+                cast_type = janitor.typecache.cache.get_type(self.cpu_def.flags_type)
+            else:
+                cast_type = janitor.typecache.cache.get_type(self.cpu_def.widest_register_type)
+            if cast_type != None:
+                value = int(value.cast(cast_type))
+        self.values[reg_name] = value
+        return value
+
+class SnapshotCache(object):
+    """Register snapshots of frames used since the last stop.
+    
+    Snapshots are kept only while stop hooks are connected (`enabled`), otherwise
+    a stop couldn't be noticed and each request gets a new snapshot."""
+    
+    def __init__(self):
+        self.enabled = False
+        # Maximum number of frames kept
+        self.size_limit = 64
+        self.snapshots = []
+    
+    def invalidate(self):
+        """Drop all snapshots, called whenever registers may have changed."""
+        self.snapshots = []
+    
+    def get(self, frame):
+        """Get register snapshot of FRAME of the selected thread."""
+        thread_num = selected_thread_num()
+        if self.enabled:
+            for snapshot in self.snapshots:
+                if snapshot.thread_num == thread_num and snapshot.frame == frame:
+                    return snapshot
+        snapshot = RegisterSnapshot(frame, thread_num)
+        if self.enabled:
+            snapshot.fill()
+            self.snapshots.append(snapshot)
+            if len(self.snapshots) > self.size_limit:
+                del self.snapshots[0]
+        return snapshot
+
+snapshots = SnapshotCache()
+
+def selected_thread_num():
+    """Get global number of the selected thread, None if there is no thread."""
+    thread = gdb.selected_thread()
+    if thread == None:
+        return None
+    return thread.global_num if hasattr(thread, "global_num") else thread.num
+
+def read_register(frame, reg_name):
+    """Read register REG_NAME of FRAME through the snapshot cache."""
+    return snapshots.get(frame).read(reg_name)
+
+class SavedRegisters(object):
+    """Registers of one thread saved at the last two stops it was seen at."""
+    
+    def __init__(self, prev, curr, stop_number):
+        self.prev = prev
+        self.curr = curr
+        self.stop_number = stop_number
+
+class ThreadRegisters(object):
+    """Saved registers of recently stopped threads, keyed by global thread number,
+so that changes are always highlighted against values of the same thread."""
+    
+    def __init__(self):
+        # Threads are saved only while `janitor registers-save` is enabled
+        self.enabled = False
+        # Maximum number of threads kept, the least recently used are dropped
+        self.size_limit = 1024
+        # Incremented on each stop
+        self.stop_number = 0
+        self.threads = collections.OrderedDict()
+    
+    def clear(self):
+        self.threads = collections.OrderedDict()
+    
+    def drop(self, thread_num):
+        self.threads.pop(thread_num, None)
+    
+    def get(self, thread_num):
+        saved = self.threads.get(thread_num)
+        if saved != None:
+            self.threads.move_to_end(thread_num)
+        return saved
+    
+    def save(self, thread_num, values):
+        saved = self.threads.pop(thread_num, None)
+        saved = SavedRegisters(saved.curr if saved != None else {}, values, self.stop_number)
+        self.threads[thread_num] = saved
+        while len(self.threads) > self.size_limit:
+            self.threads.popitem(last = False)
+        return saved
 
-# current registers value
-curr_registers = {}
+saved_registers = ThreadRegisters()
 
 #def is_supported_arch(arch):
 #    if arch != "i386" and arch != "i8086" and arch != "i386:x86-64":
@@ -162,14 +303,277 @@ def get_cpu_def(arch):
     	return arm64_def
     return None
 
+VALUE_MASK = (1 << 64) - 1
+
+class RegisterColumn(object):
+    """Values of one register, stored only at stops where the value changed."""
+    
+    # Dead entries are dropped when there are at least that many of them
+    COMPACT_MIN = 256
+    
+    def __init__(self):
+        # Stop numbers fit in 32 bits, that's 4 billion stops
+        self.stops = array.array("I")
+        # Values are widened to 64 bits when the first one doesn't fit
+        self.values = array.array("I")
+        # Entries before this one are older than the history
+        self.first = 0
+    
+    def append(self, stop, value):
+        if len(self.values) > self.first and self.values[-1] == value:
+            return
+        if value > 0xffffffff and self.values.typecode == "I":
+            self.values = array.array("Q", self.values)
+        self.stops.append(stop)
+        self.values.append(value)
+    
+    def index_at(self, stop):
+        """Get index of entry holding value at STOP, None if it's older than the column."""
+        index = bisect.bisect_right(self.stops, stop, self.first) - 1
+        if index < self.first:
+            return None
+        return index
+    
+    def value_at(self, stop):
+        index = self.index_at(stop)
+        return self.values[index] if index != None else None
+    
+    def trim(self, oldest):
+        """Drop entries not needed for values at OLDEST stop and later."""
+        index = self.index_at(oldest)
+        if index != None:
+            self.first = index
+        # Arrays are shifted once dead entries are a sixteenth of them, so that dropping is amortized
+        if self.first >= self.COMPACT_MIN and self.first * 16 >= len(self.stops):
+            del self.stops[:self.first]
+            del self.values[:self.first]
+            self.first = 0
+    
+    def memory_size(self):
+        return len(self.stops) * self.stops.itemsize + len(self.values) * self.values.itemsize
+
+class RegisterHistory(object):
+    """Register values at the last `size_limit` stops. Stops are numbered from 1,
+    registers are kept for each thread, so that a stop of one thread doesn't show
+    as change of registers of another one."""
+    
+    # Columns are trimmed after that many stops
+    TRIM_INTERVAL = 1024
+    
+    def __init__(self):
+        self.size_limit = 100000
+        self.clear()
+    
+    def clear(self):
+        self.arch = None
+        # Columns of registers for each thread number
+        self.threads = {}
+        # Last stop of each thread
+        self.thread_last_stop = {}
+        # Thread number of each stop, stored when it differs from the previous stop
+        self.stop_threads = RegisterColumn()
+        # Register names in CPU definition order
+        self.names = []
+        self.first_stop = 1
+        self.last_stop = 0
+    
+    def record(self, arch, thread_num, reg_names, values):
+        """Add stop of thread THREAD_NUM with VALUES of REG_NAMES of architecture ARCH."""
+        if arch != self.arch:
+            self.clear()
+            self.arch = arch
+        self.last_stop += 1
+        stop = self.last_stop
+        self.stop_threads.append(stop, thread_num)
+        self.thread_last_stop[thread_num] = stop
+        columns = self.threads.get(thread_num)
+        if columns == None:
+            columns = {}
+            self.threads[thread_num] = columns
+        for reg_name in reg_names:
+            value = values.get(reg_name)
+            if value is None:
+                continue
+            try:
+                value = int(value)
+            except (gdb.error, TypeError, ValueError):
+                continue
+            column = columns.get(reg_name)
+            if column == None:
+                column = RegisterColumn()
+                columns[reg_name] = column
+                if reg_name not in self.names:
+                    self.names.append(reg_name)
+            column.append(stop, value & VALUE_MASK)
+        
+        if self.size_limit != None and stop - self.first_stop >= self.size_limit:
+            self.first_stop = stop - self.size_limit + 1
+            if stop % self.TRIM_INTERVAL == 0:
+                self.trim()
+    
+    def set_size_limit(self, size_limit):
+        self.size_limit = size_limit
+        if size_limit != None and self.stop_count() > size_limit:
+            self.first_stop = self.last_stop - size_limit + 1
+            self.trim()
+    
+    def trim(self):
+        self.stop_threads.trim(self.first_stop)
+        for thread_num, last_stop in list(self.thread_last_stop.items()):
+            if last_stop < self.first_stop:
+                # Thread didn't stop within history
+                del self.threads[thread_num]
+                del self.thread_last_stop[thread_num]
+                continue
+            for column in self.threads[thread_num].values():
+                column.trim(self.first_stop)
+    
+    def stop_count(self):
+        return self.last_stop - self.first_stop + 1
+    
+    def resolve_stop(self, stop):
+        """Get stop number from STOP, negative numbers count back from the last stop."""
+        if stop <= 0:
+            stop += self.last_stop
+        if stop < self.first_stop or stop > self.last_stop:
+            raise gdb.GdbError ("stop %d is not in history (%d-%d)" % (stop, self.first_stop, self.last_stop))
+        return stop
+    
+    def thread_at(self, stop):
+        """Get number of thread which reported STOP."""
+        return self.stop_threads.value_at(stop)
+    
+    def thread_nums(self):
+        """Get numbers of threads which stopped within history."""
+        return sorted(thread_num for thread_num, last_stop in self.thread_last_stop.items()
+                      if last_stop >= self.first_stop)
+    
+    def get_column(self, reg_name, thread_num):
+        if reg_name not in self.names:
+            raise gdb.GdbError ("register %s is not in history" % reg_name)
+        if self.thread_last_stop.get(thread_num, 0) < self.first_stop:
+            raise gdb.GdbError ("thread %s didn't stop within history" % thread_num)
+        column = self.threads[thread_num].get(reg_name)
+        if column == None:
+            raise gdb.GdbError ("register %s of thread %d is not in history" % (reg_name, thread_num))
+        return column
+    
+    def first_index(self, column):
+        """Get index of the first entry of COLUMN within history."""
+        index = column.index_at(self.first_stop)
+        # Thread started after the first stop of history
+        return index if index != None else column.first
+    
+    def last_change(self, reg_name, thread_num):
+        """Get stop at which REG_NAME of thread THREAD_NUM last changed, None if it didn't change within history."""
+        column = self.get_column(reg_name, thread_num)
+        if len(column.stops) - 1 == self.first_index(column):
+            return None
+        return column.stops[-1]
+    
+    def changes(self, reg_name, thread_num):
+        """Get list of ( stop, value ) of changes of REG_NAME of thread THREAD_NUM within history,
+the first one is the value at the first stop of the thread."""
+        column = self.get_column(reg_name, thread_num)
+        result = []
+        # Columns are trimmed only from time to time
+        for index in range(self.first_index(column), len(column.stops)):
+            result.append(( max(column.stops[index], self.first_stop), column.values[index] ))
+        return result
+    
+    def value_at(self, reg_name, thread_num, stop):
+        """Get value of REG_NAME of thread THREAD_NUM at its last stop up to STOP."""
+        return self.get_column(reg_name, thread_num).value_at(stop)
+    
+    def memory_size(self):
+        return self.stop_threads.memory_size() + sum(column.memory_size()
+                                                     for columns in self.threads.values()
+                                                     for column in columns.values())
+
+history = RegisterHistory()
+
+def value_width(arch):
+    return 16 if arch == "i386:x86-64" or arch == "aarch64" else 8
+
+def format_value(value, width):
+    termline = janitor.ansiterm.TermLine()
+    termline.set_color(REG_VALUE_COLOR)
+    termline.append("%0*X" % (width, value))
+    termline.reset()
+    return termline.get_line()
+
+def print_history_summary():
+    if history.last_stop == 0:
+        print("Register history is empty, registers are saved on stop with `set janitor registers-save on`.")
+        return
+    print("Architecture:  %s" % history.arch)
+    print("Stops:         %d-%d (%d)" % (history.first_stop, history.last_stop, history.stop_count()))
+    print("Threads:       %s" % " ".join(str(thread_num) for thread_num in history.thread_nums()))
+    print("Registers:     %s" % " ".join(history.names))
+    print("Memory used:   %d bytes" % history.memory_size())
+
+def history_thread_num():
+    """Get number of the selected thread, or of the thread of the last stop
+when the selected one didn't stop within history."""
+    thread_num = selected_thread_num()
+    if thread_num in history.thread_nums():
+        return thread_num
+    return history.thread_at(history.last_stop)
+
+def print_register_timeline(reg_name, count):
+    """Print the last COUNT changes of register REG_NAME of the selected thread."""
+    thread_num = history_thread_num()
+    changes = history.changes(reg_name, thread_num)
+    width = value_width(history.arch)
+    last = history.last_change(reg_name, thread_num)
+    if last == None:
+        print("%s of thread %d didn't change in stops %d-%d." % (reg_name, thread_num,
+                                                                 history.first_stop, history.last_stop))
+    else:
+        print("%s of thread %d last changed at stop %d, %d stops ago." % (reg_name, thread_num,
+                                                                          last, history.last_stop - last))
+    if count != None and len(changes) > count:
+        changes = changes[-count:]
+    for stop, value in changes:
+        print("%10d  %s" % (stop, format_value(value, width)))
+
+def print_history_diff(first, second):
+    """Print registers which differ between stops FIRST and SECOND, each taken
+from the thread which reported the stop."""
+    width = value_width(history.arch)
+    first_thread = history.thread_at(first)
+    second_thread = history.thread_at(second)
+    if first_thread != second_thread:
+        print("Stop %d is thread %d, stop %d is thread %d." % (first, first_thread, second, second_thread))
+    differs = False
+    for reg_name in history.names:
+        old = history.value_at(reg_name, first_thread, first)
+        new = history.value_at(reg_name, second_thread, second)
+        if old != new:
+            termline = janitor.ansiterm.TermLine()
+            termline.set_color(REG_LABEL_COLOR)
+            termline.append("%-6s" % reg_name)
+            termline.reset()
+            print(termline.get_line() + " " + format_value(old, width) + " -> " + format_value(new, width))
+            differs = True
+    if not differs:
+        print("Registers are the same at stops %d and %d." % (first, second))
+
+def save_frame_registers(frame, cpu_def):
+    """Save registers of FRAME, the newest frame of the selected thread."""
+    snapshot = snapshots.get(frame)
+    values = {}
+    for reg_name in cpu_def.regs:
+        values[reg_name] = snapshot.value(reg_name)
+    return saved_registers.save(snapshot.thread_num, values)
+
 def save_registers():
-    global prev_registers, curr_registers
     try:
         frame = gdb.newest_frame()
         arch = frame.architecture().name()
     except:
-        curr_registers = {}
-        prev_registers = {}
+        saved_registers.clear()
+        return
     
     if not frame.is_valid():
         return
@@ -178,32 +582,36 @@ def save_registers():
     if cpu_def is None:
         return
     
-    reg_list = cpu_def.regs
-    reg_count = len(reg_list)
-    reg_num = 0
-    prev_registers = curr_registers
-    curr_registers = {}
-    
-    wide_type = janitor.typecache.cache.get_type(cpu_def.widest_register_type)
-    flags_type = janitor.typecache.cache.get_type(cpu_def.flags_type)
-
-    while reg_num < reg_count:
-        reg_name = reg_list[reg_num]
-        if reg_name == cpu_def.flags_reg:
-            curr_registers[reg_name] = int(frame.read_register(reg_name).cast(flags_type))
-        elif wide_type != None:
-            curr_registers[reg_name] = int(frame.read_register(reg_name).cast(wide_type))
-        else:
-            curr_registers[reg_name] = frame.read_register(reg_name)
-        reg_num += 1
+    saved = save_frame_registers(frame, cpu_def)
+    history.record(arch, snapshots.get(frame).thread_num, cpu_def.regs, saved.curr)
+
+def previous_registers(frame, cpu_def):
+    """Get registers of the selected thread saved before the last stop, None if
+changes of FRAME aren't known."""
+    # Changes are known only for the newest frame
+    if frame != gdb.newest_frame():
+        return None
+    saved = saved_registers.get(selected_thread_num())
+    if saved == None:
+        if saved_registers.enabled:
+            # Thread didn't report any stop yet, its changes are known from the next one
+            save_frame_registers(frame, cpu_def)
+        return None
+    if saved.stop_number != saved_registers.stop_number:
+        # Another thread reported the stop, this one is compared with the last stop it was seen at
+        saved = save_frame_registers(frame, cpu_def)
+    return saved.prev
 
 def stop_handler(event):
+    saved_registers.stop_number += 1
     save_registers()
 
 def exited_handler(event):
-    global prev_registers, curr_registers
-    curr_registers = {}
-    prev_registers = {}
+    saved_registers.clear()
+
+def thread_exited_handler(event):
+    thread = event.inferior_thread
+    saved_registers.drop(thread.global_num if hasattr(thread, "global_num") else thread.num)
 
 def explain_flags(value, prev_value, flags):
     
@@ -260,52 +668,119 @@ def explain_frame_flags(frame):
     if cpu_def is None:
         return
     
-    eflags = frame.read_register(cpu_def.flags_reg)
-    if frame == gdb.newest_frame() and cpu_def.flags_reg in prev_registers:
-        prev_eflags = prev_registers[cpu_def.flags_reg]
-    else:
-        prev_eflags = None
+    eflags = read_register(frame, cpu_def.flags_reg)
+    prev = previous_registers(frame, cpu_def)
+    prev_eflags = prev.get(cpu_def.flags_reg) if prev != None else None
     explain_flags(eflags, prev_eflags, cpu_def.flags_list)
 
 
-def format_register(termline, label, width, value, prev_value, fmt):
-    termline.set_color(REG_LABEL_COLOR)
-    termline.append(label)
-    termline.reset()
-    
-    termline.append("=")
-    
-    termline.set_color(REG_VALUE_COLOR)
-    termline.set_attrib(VALUE_CHANGED_ATTR, prev_value != None and value != prev_value)
+def format_register_value(value, width, fmt):
     if type(fmt) is dict:
         if int(value) in fmt:
-            termline.append(fmt[int(value)])
-        else:
-            termline.append(fmt[None])
-    elif fmt == "b":
-        termline.append(format(int(value),'0'+str(width)+'b'))
-    else:
-        termline.append("%0*X" % (width, value))
-    termline.reset()
-
-def format_register_flags(termline, value, prev_value, flags):
-    result = ""
-    flags_count = len(flags)
-    flag_num = 0
-    while flag_num < flags_count:
-        flag = flags[flag_num]
-        if flag_num > 0:
-            termline.append(" ")
-        changed = prev_value != None and ((value ^ prev_value) & flag[0])
-        changed_attr = VALUE_CHANGED_ATTR if changed else 0
-        if value & flag[0]:
-            termline.set_color(FLAGS_VALUE_NAME_SET_COLOR | changed_attr)
-            termline.append(flag[1])
-        else:
-            termline.set_color(FLAGS_VALUE_NAME_RESET_COLOR | changed_attr)
-            termline.append(flag[2])
-        termline.reset()
-        flag_num += 1
+            return fmt[int(value)]
+        return fmt[None]
+    if fmt == "b":
+        return format(int(value),'0'+str(width)+'b')
+    return "%0*X" % (width, value)
+
+def colored(color, text):
+    """Get TEXT in COLOR, starting and ending in default color."""
+    return term.transition(term.DEFAULT_COLOR, color) + text + term.transition(color, term.DEFAULT_COLOR)
+
+class RenderPlan(object):
+    """Register lines of CpuDef compiled for print_frame_regs.
+
+    Each line is a flat list of operations, with labels and SGR sequences of the current
+    terminal settings already joined into strings:
+        ( OP_TEXT, text )
+        ( OP_REGISTER, register, prefix, width, mask, shift, format, value prefixes, value suffixes )
+        ( OP_FLAGS, register, prefix, ( ( mask, names ), ... ) )
+    Value prefixes and suffixes are indexed by changed state, flag names by set state * 2 + changed state."""
+
+    OP_TEXT = 0
+    OP_REGISTER = 1
+    OP_FLAGS = 2
+
+    def __init__(self, lines_list):
+        changed_color = REG_VALUE_COLOR | VALUE_CHANGED_ATTR
+        value_prefixes = ( term.transition(term.DEFAULT_COLOR, REG_VALUE_COLOR),
+                term.transition(term.DEFAULT_COLOR, REG_VALUE_COLOR) + term.transition(REG_VALUE_COLOR, changed_color) )
+        value_suffixes = ( term.transition(REG_VALUE_COLOR, term.DEFAULT_COLOR), term.transition(changed_color, term.DEFAULT_COLOR) )
+
+        self.lines = []
+        for line in lines_list:
+            ops = []
+            for elem_num in range(len(line)):
+                elem = line[elem_num]
+                if type(elem) is str:
+                    # Just a string to insert in line
+                    ops.append(( self.OP_TEXT, elem ))
+                    continue
+
+                prefix = " " if elem_num > 0 else ""
+                reg_name = elem[0]
+                if type(elem[1]) is tuple:
+                    # It's a flags register
+                    flags = []
+                    for flag in elem[1]:
+                        flags.append(( flag[0], ( colored(FLAGS_VALUE_NAME_RESET_COLOR, flag[2]),
+                                colored(FLAGS_VALUE_NAME_RESET_COLOR | VALUE_CHANGED_ATTR, flag[2]),
+                                colored(FLAGS_VALUE_NAME_SET_COLOR, flag[1]),
+                                colored(FLAGS_VALUE_NAME_SET_COLOR | VALUE_CHANGED_ATTR, flag[1]) ) ))
+                    ops.append(( self.OP_FLAGS, reg_name, prefix, tuple(flags) ))
+                    continue
+
+                elem_len = len(elem)
+                # Use register name in uppercase unless label is specified
+                label = elem[2] if elem_len > 2 else reg_name.upper()
+                mask = elem[3] if elem_len > 3 else None
+                shift = elem[4] if elem_len > 4 else None
+                # Optional binary format or enum set
+                fmt = elem[5] if elem_len > 5 else None
+                ops.append(( self.OP_REGISTER, reg_name, prefix + colored(REG_LABEL_COLOR, label) + "=", elem[1],
+                        mask, shift, fmt, value_prefixes, value_suffixes ))
+            self.lines.append(ops)
+
+    def render(self, read, prev_registers):
+        """Get list of lines, registers are read by READ function, PREV_REGISTERS are compared
+with them to highlight changes. PREV_REGISTERS may be None."""
+        OP_TEXT = self.OP_TEXT
+        OP_REGISTER = self.OP_REGISTER
+        result = []
+        for ops in self.lines:
+            parts = []
+            for op in ops:
+                kind = op[0]
+                if kind == OP_TEXT:
+                    parts.append(op[1])
+                    continue
+
+                reg_name = op[1]
+                value = read(reg_name)
+                prev_value = prev_registers.get(reg_name) if prev_registers != None else None
+
+                if kind == OP_REGISTER:
+                    kind, reg_name, prefix, width, mask, shift, fmt, value_prefixes, value_suffixes = op
+                    # First shift, then mask
+                    if shift != None:
+                        value >>= shift
+                        if prev_value != None:
+                            prev_value >>= shift
+                    if mask != None:
+                        value &= mask
+                        if prev_value != None:
+                            prev_value &= mask
+                    changed = int(prev_value != None and value != prev_value)
+                    parts += ( prefix, value_prefixes[changed], format_register_value(value, width, fmt), value_suffixes[changed] )
+                else:
+                    parts.append(op[2])
+                    diff = (value ^ prev_value) if prev_value != None else 0
+                    separator = ""
+                    for mask, names in op[3]:
+                        parts += ( separator, names[(2 if value & mask else 0) + (1 if diff & mask else 0)] )
+                        separator = " "
+            result.append("".join(parts))
+        return result
 
 def print_frame_regs(frame):
     arch = frame.architecture().name()
@@ -313,83 +788,153 @@ def print_frame_regs(frame):
     if cpu_def is None:
         return
     
-    lines = cpu_def.lines_list
-    line_count = len(lines)
-    line_num = 0
+    snapshot = snapshots.get(frame)
+    prev = previous_registers(frame, cpu_def)
+    
+    for line in cpu_def.render_plan().render(snapshot.read, prev):
+        print(line)
+
+class ThreadState(object):
+    """Registers and stack of one thread read by 'info janitor registers all-threads'."""
     
+    def __init__(self, thread, frame, arch, cpu_def, stack_depth):
+        self.thread = thread
+        self.arch = arch
+        snapshot = snapshots.get(frame)
+        self.pc = frame.pc()
+        self.sp = int(snapshot.value("sp"))
+        self.flags = int(snapshot.value(cpu_def.flags_reg))
+        # Code addresses of the newest frames
+        self.stack = [ self.pc ]
+        caller = frame
+        while len(self.stack) < stack_depth:
+            try:
+                caller = caller.older()
+            except gdb.error:
+                break
+            if caller == None:
+                break
+            self.stack.append(caller.pc())
+    
+    def signature(self):
+        return tuple(self.stack)
+
+def thread_label(thread):
+    label = "Thread %d" % thread.num
+    if thread.name != None:
+        label += " \"%s\"" % thread.name
+    return label
+
+def format_thread_numbers(threads):
+    """Get thread numbers of THREADS with runs of numbers joined to ranges."""
+    numbers = sorted(thread.num for thread in threads)
+    ranges = []
+    start = numbers[0]
+    for index in range(1, len(numbers) + 1):
+        if index == len(numbers) or numbers[index] != numbers[index - 1] + 1:
+            end = numbers[index - 1]
+            ranges.append("%d" % start if start == end else "%d-%d" % (start, end))
+            if index < len(numbers):
+                start = numbers[index]
+    return ", ".join(ranges)
+
+def format_thread_state(state, width):
+    """Get line with pc, sp and flags of thread STATE."""
+    termline = janitor.ansiterm.TermLine()
+    for label, value in ( ("PC", state.pc), ("SP", state.sp), ("FLAGS", state.flags) ):
+        termline.set_color(REG_LABEL_COLOR)
+        termline.append(label + "=")
+        termline.set_color(REG_VALUE_COLOR)
+        termline.append("%0*X " % (width if label != "FLAGS" else 8, value))
+    symbol = janitor.symbols.format_symbol(state.pc)
+    if symbol != None:
+        termline.set_color(SYMBOL_COLOR)
+        termline.append(symbol)
+    termline.reset()
+    return termline.get_line()
+
+def print_thread_header(text):
     termline = janitor.ansiterm.TermLine()
+    termline.set_color(THREAD_COLOR)
+    termline.append(text)
+    termline.reset()
+    print(termline.get_line())
+
+def read_thread_states(stack_depth, full):
+    """Switch to each stopped thread once, read its registers and return
+list of ( ThreadState, register block lines ). Lines are None unless FULL."""
+    results = []
+    inferior = gdb.selected_inferior()
+    for thread in sorted(inferior.threads(), key = lambda thread: thread.num):
+        if not thread.is_valid() or not thread.is_stopped():
+            continue
+        thread.switch()
+        try:
+            frame = gdb.newest_frame()
+        except gdb.error:
+            continue
+        arch = frame.architecture().name()
+        cpu_def = get_cpu_def(arch)
+        if cpu_def is None:
+            continue
+        state = ThreadState(thread, frame, arch, cpu_def, stack_depth)
+        lines = None
+        if full:
+            lines = cpu_def.render_plan().render(snapshots.get(frame).read, previous_registers(frame, cpu_def))
+        results.append(( state, lines ))
+    return results
+
+def print_all_threads(condensed, group):
+    """Print registers of all stopped threads of the selected inferior, in one line
+per thread when CONDENSED. Threads with the same code addresses in the newest
+GROUP_STACK_DEPTH frames are printed once when GROUP."""
+    selected_thread = gdb.selected_thread()
+    if selected_thread == None:
+        raise gdb.GdbError ("no thread selected")
+    try:
+        selected_frame = gdb.selected_frame()
+    except gdb.error:
+        selected_frame = None
+    try:
+        results = read_thread_states(GROUP_STACK_DEPTH if group else 1, not condensed)
+    finally:
+        if selected_thread.is_valid():
+            selected_thread.switch()
+            if selected_frame != None and selected_frame.is_valid():
+                selected_frame.select()
     
-    # Iterate over lines to display
-    while line_num < line_count:
-        line = lines[line_num]
-        
-        termline.start()
-        elem_count = len(line)
-        elem_num = 0
-        
-        # Iterate over registers in current line
-        while elem_num < elem_count:
-            elem = line[elem_num]
-            if type(elem) is str:
-                # Just a string to insert in line
-                termline.append(elem)
-                elem_num += 1
-                continue
-            
-            if elem_num > 0:
-                termline.append(" ")
-                
-            elem_len = len(elem)
-            reg_name = elem[0]
-            
-            # Read register value
-            value = frame.read_register(reg_name)
-            
-            # Previous register value
-            if frame == gdb.newest_frame() and reg_name in prev_registers:
-                prev_value = prev_registers[reg_name]
-            else:
-                prev_value = None
-            
-            if type(elem[1]) is tuple:
-                # It's a flags register
-                flags = elem[1]
-                format_register_flags(termline, value, prev_value, flags)
-                elem_num += 1
-                continue
-           
-            width = elem[1]
-            
-            # Use register name in uppercase unless label is specified
-            if elem_len > 2:
-                label = elem[2]
-            else:
-                label = reg_name.upper()
-           
-            # First shift, then mask, MMMKEY? 
-            # Shift
-            if elem_len > 4:
-                value >>= elem[4]
-                if prev_value != None:
-                    prev_value >>= elem[4]
-
-            # Mask
-            if elem_len > 3:
-                value &= elem[3]
-                if prev_value != None:
-                    prev_value &= elem[3]
-            
-            # Optional binary format or enum set
-            if elem_len > 5:
-                fmt = elem[5]
+    if len(results) == 0:
+        print("No stopped threads.")
+        return
+    width = value_width(results[0][0].arch)
+    
+    if not group:
+        for state, lines in results:
+            if condensed:
+                termline = janitor.ansiterm.TermLine()
+                termline.set_color(THREAD_COLOR)
+                termline.append("%-24s" % thread_label(state.thread))
+                termline.reset()
+                print(termline.get_line() + " " + format_thread_state(state, width))
             else:
-                fmt = None
-
-            format_register(termline, label, width, value, prev_value, fmt)
-            
-            elem_num += 1
-        
-        print(termline.get_line())
-        
-        line_num += 1
-
+                print_thread_header(thread_label(state.thread) + ":")
+                for line in lines:
+                    print(line)
+        return
+    
+    groups = collections.OrderedDict()
+    for result in results:
+        groups.setdefault(result[0].signature(), []).append(result)
+    for members in sorted(groups.values(), key = lambda members: -len(members)):
+        state, lines = members[0]
+        threads = [ member[0].thread for member in members ]
+        print_thread_header("%d thread%s: %s" % (len(threads), "s" if len(threads) != 1 else "",
+                format_thread_numbers(threads)))
+        if condensed:
+            print("  " + format_thread_state(state, width))
+        else:
+            for line in lines:
+                print(line)
+        callers = [ janitor.symbols.format_symbol(address) or "0x%X" % address for address in state.stack[1:] ]
+        if len(callers) != 0:
+            print("  called from " + " <- ".join(callers))
@@ -0,0 +1,549 @@
+"""Rendering of memory dump lines. Doesn't depend on gdb module, so it can be used outside GDB."""
+
+import operator
+
+try:
+    import gdb
+    FormatError = gdb.GdbError
+except ImportError:
+    FormatError = ValueError
+
+import janitor.ansiterm
+from janitor.ansiterm import term
+import janitor.output
+
+ENDIAN_LITTLE = 0
+ENDIAN_BIG = 1
+
+format_width = {
+    '1': 1,
+    'b': 1,
+    '2': 2,
+    'h': 2,
+    's': 2,
+    'w': 4,
+    '4': 4,
+    'd': 4,
+    'l': 4,
+    '8': 8,
+    'g': 8,
+    'q': 8
+}
+
+format_endian = {
+    'l': ENDIAN_LITTLE,
+    'b': ENDIAN_BIG
+}
+
+# Parameters of methods below are often called `bytes`
+bytes_type = bytes
+
+# Hex text of each byte value
+hex_table = [ "%02X" % byte for byte in range(256) ]
+
+# Translation table marking non-zero bytes with 1
+nonzero_table = bytes_type(bytearray([0] + 255 * [1]))
+
+def diff_mask(new, old):
+    """Get bytes with 1 where NEW and OLD buffers differ, 0 elsewhere. Buffers must be of the same length."""
+    new = bytes_type(new)
+    old = bytes_type(old)
+    if new == old:
+        return bytes_type(len(new))
+    # Whole buffers compared at once, differing bytes are non-zero after XOR
+    xor = int.from_bytes(new, "big") ^ int.from_bytes(old, "big")
+    return xor.to_bytes(len(new), "big").translate(nonzero_table)
+
+
+# / is already stripped
+def decode_format(fmt):
+    """Get width and endianness specified in FMT, None for those not specified."""
+    new_width = None
+    new_endian = None
+    width_letter = None
+    if len(fmt) == 0:
+        return None, None
+    
+    for l in fmt:
+        if l in format_width:
+            if new_width == None:
+                new_width = format_width[l]
+                width_letter = l
+            elif new_width == 1 or l not in format_endian:
+                new_width = format_width[l]
+                # Reinterpret previous 'b' as endian specifier
+                pl = width_letter
+                if pl in format_endian:
+                    if new_endian != None and new_endian != format_endian[pl]:
+                        raise FormatError ("contradictory endian specifier")
+                    new_endian = format_endian[pl]
+                else:
+                    raise FormatError ("contradictory width specifier")
+                width_letter = l
+            elif l in format_endian:
+                if new_endian != None and new_endian != format_endian[l]:
+                    raise FormatError ("contradictory endian specifier")
+                new_endian = format_endian[l]
+            elif new_width != format_width[l]:
+                raise FormatError ("contradictory width specifier")                
+        elif l in format_endian:
+            if new_endian != None and new_endian != format_endian[l]:
+                raise FormatError ("contradictory endian specifier")
+            new_endian = format_endian[l]
+        else:
+            raise FormatError ("invalid format specifier")
+
+    return new_width, new_endian
+
+
+class DumpBase(object):
+    def __init__(self):
+        pass
+
+    def append_address(self, addr):
+        # Address
+        self.termline.append_raw(term.transition(self.termline.color, self.ADDRESS_COLOR) +
+                "%0*X" % (self.ADDR_WIDTH, addr) +
+                term.transition(self.ADDRESS_COLOR, term.DEFAULT_COLOR) + " ", term.DEFAULT_COLOR)
+    
+
+class DumpLayout(object):
+    """Precomputed layout of bytes part of dump line for given width and endianness."""
+    
+    def __init__(self, dump, width, endian):
+        # Words described by tuples ( offset, byte offsets in display order, leading pad, trailing pad, separator )
+        self.words = []
+        start_pad = (width-1)//2 * " " if width > 2 else ""
+        end_pad = width//2 * " " if width > 1 else ""
+        template = []
+        display_order = []
+        word_off = 0
+        while word_off < dump.BYTES_PER_LINE:
+            if endian == ENDIAN_BIG:
+                order = tuple(range(word_off, word_off + width))
+            else:
+                order = tuple(range(word_off + width - 1, word_off - 1, -1))
+            next_off = word_off + width
+            if next_off >= dump.BYTES_PER_LINE:
+                sep = ""
+            elif next_off % dump.GROUPING == 0:
+                sep = dump.group_separator
+            else:
+                sep = dump.word_separator
+            self.words.append((word_off, order, start_pad, end_pad, sep))
+            template += ( start_pad, width * "%s", end_pad, sep.replace("%", "%%") )
+            display_order += order
+            word_off = next_off
+        
+        # Format string for whole line of bytes in single color
+        self.template = "".join(template) + " "
+        # Getter of all bytes of line in display order
+        self.order = operator.itemgetter(*display_order)
+
+class DumpData(object):
+    """Memory to be dumped. Hex text and characters of all bytes are prepared at once, when first needed."""
+    
+    def __init__(self, dump, data):
+        self.dump = dump
+        self.data = data
+        self.hexes = None
+        # Mask of bytes changed relative to reference, None if there is no reference
+        self.changed = None
+    
+    def set_reference(self, reference, offset):
+        """Compare data with REFERENCE bytes starting at OFFSET."""
+        self.changed = diff_mask(self.data, reference[offset : offset + len(self.data)])
+    
+    def prepare(self):
+        dump = self.dump
+        data = bytes_type(self.data)
+        self.hexes = list(map(hex_table.__getitem__, data))
+        self.chars = data.translate(dump.chars_table).decode("ascii")
+        self.classes = data.translate(dump.char_classes_table)
+        # Each character preceded by SGR sequence changing color from the previous character
+        sgr = dump.get_char_transitions(term.DEFAULT_COLOR)
+        self.char_pieces = list(map(operator.add, map(sgr.__getitem__, dump.transition_indexes(self.classes)), self.chars))
+
+class DumpRenderer(DumpBase):
+    """Renders memory dump lines. Memory is provided by subclasses via read_chunk()."""
+    
+    ADDRESS_COLOR = term.COLOR_WHITE | term.BOLD
+    BYTES_COLOR = term.COLOR_WHITE
+    BYTES_SEP_COLOR = term.COLOR_WHITE
+    HIGHLIGHT_BYTES_COLOR = term.COLOR_WHITE | term.BOLD
+    CHANGED_BYTES_COLOR = term.COLOR_RED | term.BOLD
+    CHARS_COLOR = term.COLOR_YELLOW | term.BOLD
+    CHARS_ALT_COLOR = term.COLOR_YELLOW
+    CHARS_CTRL_COLOR = term.COLOR_BLACK | term.BACKGROUND_YELLOW | term.HIGHLIGHT
+    CHARS_CTRL_ALT_COLOR = term.COLOR_BLACK | term.BACKGROUND_YELLOW
+    SYMBOL_COLOR = term.COLOR_GREEN
+    
+    BYTES_PER_LINE = 16
+    ALIGNED = 1
+    ADDR_WIDTH = 8
+    GROUPING = 8
+    
+    # Settings, subclasses may take them from elsewhere
+    width = 1
+    endian = ENDIAN_LITTLE
+    highlight_start = None
+    highlight_end = None
+    collapse = False
+    read_chunk_size = None
+    # Function getting <symbol+offset> text of word value, None if words are not annotated
+    annotate = None
+    
+    word_separator = " "
+    group_separator = "-"
+
+    def __init__(self):
+        super(DumpRenderer, self).__init__()
+        self.layouts = {}
+        self.char_transitions = {}
+        self.build_char_tables()
+
+    def build_char_tables(self):
+        """Precompute display character and color class of each byte value."""
+        # Color class of each byte value is index in char_colors list
+        classes = bytearray()
+        chars = bytearray()
+        self.char_colors = []
+        for asc in range(256):
+            color = self.CHARS_COLOR
+            
+            if (asc & 127) < 32:
+                color = self.CHARS_CTRL_COLOR
+                asc += 64
+            elif (asc & 127) == 127:
+                color |= self.CHARS_CTRL_COLOR
+                asc -= 64
+            
+            if asc > 128:
+                if color == self.CHARS_CTRL_COLOR:
+                    color = self.CHARS_CTRL_ALT_COLOR
+                else:
+                    color = self.CHARS_ALT_COLOR
+                asc -= 128
+            
+            if color not in self.char_colors:
+                self.char_colors.append(color)
+            classes.append(self.char_colors.index(color))
+            chars.append(asc)
+        
+        self.char_classes_table = bytes(classes)
+        self.chars_table = bytes(chars)
+
+    def get_layout(self):
+        """Get line layout for current width and endianness."""
+        key = (self.width, self.endian)
+        if key not in self.layouts:
+            self.layouts[key] = DumpLayout(self, self.width, self.endian)
+        return self.layouts[key]
+
+    def append_runs(self, runs):
+        """Append list of alternating colors and strings, with SGR sequences only where color changes."""
+        transition = term.transition
+        color = self.termline.color
+        parts = []
+        for index in range(0, len(runs), 2):
+            text = runs[index + 1]
+            if text != "":
+                parts += ( transition(color, runs[index]), text )
+                color = runs[index]
+        self.termline.append_raw("".join(parts), color)
+
+    def highlight_range(self, address):
+        """Get range of highlighted offsets in line starting at ADDRESS."""
+        if self.highlight_start == None and self.highlight_end == None:
+            return 0, 0
+        low = 0
+        high = self.BYTES_PER_LINE
+        if self.highlight_start != None:
+            low = max(self.highlight_start - address, 0)
+        if self.highlight_end != None:
+            high = min(self.highlight_end - address, high)
+        return low, high
+
+    def append_bytes(self, bytes, offset, length, address, changed = None):
+        low, high = self.highlight_range(address)
+        end = offset + length
+        layout = self.get_layout()
+        default = term.DEFAULT_COLOR
+        bytes_color = self.BYTES_COLOR
+        sep_color = self.BYTES_SEP_COLOR
+        
+        if (length == self.BYTES_PER_LINE and high <= low and changed == None and self.termline.color == default and
+                bytes_color == default and sep_color == default):
+            # Whole line in default color, just fill in the template
+            self.termline.append(layout.template % tuple(map(hex_table.__getitem__, layout.order(bytes))))
+            return
+        
+        padding = self.width * "  "
+        runs = []
+        for word_off, order, start_pad, end_pad, sep in layout.words:
+            if word_off + self.width <= offset or word_off >= end:
+                # Padding before real start or after end
+                runs += ( default, start_pad + padding + end_pad, sep_color, sep )
+                continue
+            
+            runs += ( default, start_pad )
+            for idx in order:
+                if idx < offset or idx >= end:
+                    runs += ( bytes_color, "  " )
+                elif changed != None and changed[idx - offset]:
+                    runs += ( self.CHANGED_BYTES_COLOR, hex_table[bytes[idx - offset]] )
+                elif low <= idx < high:
+                    runs += ( self.HIGHLIGHT_BYTES_COLOR, hex_table[bytes[idx - offset]] )
+                else:
+                    runs += ( bytes_color, hex_table[bytes[idx - offset]] )
+            runs += ( default, end_pad, sep_color, sep )
+        
+        runs += ( default, " " )
+        self.append_runs(runs)
+    
+    def get_char_transitions(self, color):
+        """Get table of SGR sequences between character colors, indexed by from_class * stride + to_class.
+Class len(char_colors) stands for COLOR, in which characters part starts."""
+        key = (color, term.ansi_enabled)
+        if key not in self.char_transitions:
+            colors = self.char_colors + [ color ]
+            self.char_transitions[key] = [ term.transition(from_color, to_color) if to_color in self.char_colors else ''
+                    for from_color in colors for to_color in colors ]
+        return self.char_transitions[key]
+    
+    def transition_indexes(self, classes):
+        """Get index in char transitions table for each character class in CLASSES.
+First character is assumed to follow the initial color."""
+        # Add shifted classes of preceding characters to classes of characters.
+        # There are no carries between bytes, so it is done on big integers.
+        if len(classes) == 0:
+            return bytes_type()
+        stride = len(self.char_colors) + 1
+        prev_classes = int.from_bytes(bytes_type((stride - 1,)) + classes[:-1], "big")
+        return (prev_classes * stride + int.from_bytes(classes, "big")).to_bytes(len(classes), "big")
+    
+    def append_chars(self, bytes, offset, length):
+        if offset != 0:
+            self.termline.append(offset * " ")
+        if len(bytes) == 0:
+            return
+        bytes = bytes_type(bytes)
+        chars = bytes.translate(self.chars_table).decode("ascii")
+        classes = bytes.translate(self.char_classes_table)
+        sgr = self.get_char_transitions(self.termline.color)
+        self.termline.append_raw("".join(map(operator.add, map(sgr.__getitem__, self.transition_indexes(classes)), chars)),
+                self.char_colors[classes[-1]])
+    
+    def append_line(self, data, pos, offset, length, address):
+        """Append bytes and chars of line starting at ADDRESS, taking LENGTH bytes at POS in DATA."""
+        low, high = self.highlight_range(address)
+        termline = self.termline
+        default = term.DEFAULT_COLOR
+        changed = data.changed
+        if changed != None and changed.find(b"\x01", pos, pos + length) == -1:
+            changed = None
+        if (length != self.BYTES_PER_LINE or low < high or changed != None or termline.color != default or
+                self.BYTES_COLOR != default or self.BYTES_SEP_COLOR != default):
+            bytes = data.data[pos : pos + length]
+            self.append_bytes(bytes, offset, length, address, changed[pos : pos + length] if changed != None else None)
+            self.append_chars(bytes, offset, length)
+            return
+        
+        # Whole line in default color, use bytes already converted
+        if data.hexes == None:
+            data.prepare()
+        layout = self.get_layout()
+        termline.append(layout.template % layout.order(data.hexes[pos : pos + length]))
+        
+        # Only transition to the first character depends on line
+        stride = len(self.char_colors) + 1
+        sgr = self.get_char_transitions(default)
+        end = pos + length
+        termline.append_raw(sgr[(stride - 1) * stride + data.classes[pos]] + data.chars[pos] + "".join(data.char_pieces[pos + 1 : end]),
+                self.char_colors[data.classes[end - 1]])
+    
+    def append_symbols(self, data, pos, offset, length):
+        """Append symbols of values of whole words in line, taking LENGTH bytes at POS in DATA."""
+        width = self.width
+        if width < 4:
+            return
+        byteorder = "big" if self.endian == ENDIAN_BIG else "little"
+        annotate = self.annotate
+        texts = []
+        word_off = (offset + width - 1) // width * width
+        while word_off + width <= offset + length:
+            start = pos + word_off - offset
+            value = int.from_bytes(bytes_type(data[start : start + width]), byteorder)
+            if value != 0:
+                text = annotate(value)
+                if text != None:
+                    texts.append(text)
+            word_off += width
+        if len(texts) != 0:
+            self.termline.set_color(self.SYMBOL_COLOR)
+            self.termline.append(" " + " ".join(texts))
+            self.termline.reset()
+    
+    def collapse_limit(self, address):
+        """Get maximum number of lines starting at ADDRESS which can be collapsed without hiding highlight."""
+        if self.highlight_start == None and self.highlight_end == None:
+            return None
+        low = self.highlight_start if self.highlight_start != None else 0
+        if self.highlight_end != None and self.highlight_end <= low:
+            return None
+        if address + self.BYTES_PER_LINE <= low:
+            return (low - address) // self.BYTES_PER_LINE
+        if self.highlight_end != None and address >= self.highlight_end:
+            return None
+        return 0
+    
+    def count_repeated(self, data, pos, line, max_lines):
+        """Count lines in DATA starting at POS which are the same as LINE, up to MAX_LINES."""
+        line_len = len(line)
+        max_lines = min(max_lines, (len(data) - pos) // line_len)
+        # Compare growing blocks of lines first, then narrow down with bisection
+        count = 0
+        step = 1
+        while count + step <= max_lines and data[pos + count * line_len : pos + (count + step) * line_len] == line * step:
+            count += step
+            step *= 2
+        while step > 1:
+            step //= 2
+            if count + step <= max_lines and data[pos + count * line_len : pos + (count + step) * line_len] == line * step:
+                count += step
+        return count
+    
+    def append_collapsed(self, start_addr, end_addr):
+        """Append marker of skipped lines repeating the previous line."""
+        self.termline.set_color(self.ADDRESS_COLOR)
+        self.termline.append("%-*s" % (self.ADDR_WIDTH, "*"))
+        self.termline.reset()
+        self.termline.append(" %0*X-%0*X %d identical lines" % (self.ADDR_WIDTH, start_addr, self.ADDR_WIDTH, end_addr,
+                (end_addr + 1 - start_addr) // self.BYTES_PER_LINE))
+    
+    def render_line(self, data, pos, length, address):
+        """Get dump line displaying LENGTH bytes at POS in DATA, starting at ADDRESS."""
+        self.termline = janitor.ansiterm.TermLine()
+        self.append_address(address)
+        self.append_line(data, pos, 0, length, address)
+        return self.termline.get_line()
+    
+    def chunk_length(self, address, line_address, end_addr):
+        """Get length of chunk starting at ADDRESS, up to END_ADDR inclusive, ending on line boundary,
+and length of its part in the line starting at LINE_ADDRESS."""
+        length = end_addr + 1 - address
+        if self.read_chunk_size != None:
+            lines = max(self.read_chunk_size // self.BYTES_PER_LINE, 1)
+            length = min(length, line_address + lines * self.BYTES_PER_LINE - address)
+        min_length = min(length, line_address + self.BYTES_PER_LINE - address)
+        return length, min_length
+    
+    def read_chunk(self, address, line_address, end_addr):
+        """Read memory starting at ADDRESS, up to END_ADDR inclusive, ending on line boundary."""
+        raise NotImplementedError
+    
+    def write_line(self, line):
+        janitor.output.write_line(line)
+    
+    def write_collapsed(self, start_addr, end_addr):
+        self.termline.start()
+        self.append_collapsed(start_addr, end_addr)
+        self.write_line(self.termline.get_line())
+    
+    def to_dump_string(self, s):
+        self.termline = janitor.ansiterm.TermLine()
+        s = bytearray(s.encode("iso-8859-1"))
+        self.append_chars(s, 0, len(s))
+        return self.termline.get_line()
+    
+    def invoke(self, start_addr, end_addr, reference = None, changed_only = False):
+        """Dump memory from START_ADDR to END_ADDR inclusive.
+If REFERENCE snapshot is given, bytes differing from it are highlighted,
+and with CHANGED_ONLY lines without changes are not displayed."""
+        self.termline = janitor.ansiterm.TermLine()
+        
+        address = start_addr
+        
+        if self.ALIGNED > 1:
+            address -= address % self.ALIGNED
+        
+        chunk = DumpData(self, bytearray())
+        chunk_start = start_addr
+        
+        # Previous line and start of repeated lines for collapsing
+        prev_line = None
+        repeat_start = None
+        
+        while address <= end_addr:
+            # Number of bytes to read
+            start_off = 0
+            if address < start_addr:
+                start_off = start_addr - address
+            bytes_to_read = self.BYTES_PER_LINE - start_off
+            if address + start_off + bytes_to_read > end_addr:
+                bytes_to_read = end_addr - address - start_off + 1
+            
+            # Fetch next chunk if line is not in the one already read
+            chunk_off = address + start_off - chunk_start
+            if chunk_off + bytes_to_read > len(chunk.data):
+                chunk_start = address + start_off
+                chunk = DumpData(self, self.read_chunk(chunk_start, address, end_addr))
+                chunk_off = 0
+                if reference != None:
+                    chunk.set_reference(reference.data, chunk_start - reference.address)
+            
+            # Skip lines without changes, using mask of the whole chunk
+            if changed_only and chunk.changed != None:
+                next_change = chunk.changed.find(b"\x01", chunk_off)
+                if next_change == -1:
+                    # Continue with line following the chunk
+                    address += (chunk_start + len(chunk.data) - address + self.BYTES_PER_LINE - 1) // self.BYTES_PER_LINE * self.BYTES_PER_LINE
+                    continue
+                if next_change >= chunk_off + bytes_to_read:
+                    # Continue with line containing the change
+                    address += (chunk_start + next_change - address) // self.BYTES_PER_LINE * self.BYTES_PER_LINE
+                    continue
+            
+            # Skip lines repeating the previous line
+            if prev_line != None and bytes_to_read == self.BYTES_PER_LINE:
+                max_lines = (end_addr + 1 - address) // self.BYTES_PER_LINE
+                limit = self.collapse_limit(address)
+                if limit != None:
+                    max_lines = min(max_lines, limit)
+                count = self.count_repeated(chunk.data, chunk_off, prev_line, max_lines)
+                if count != 0:
+                    if repeat_start == None:
+                        repeat_start = address
+                    address += count * self.BYTES_PER_LINE
+                    continue
+            
+            if repeat_start != None:
+                self.write_collapsed(repeat_start, address - 1)
+                repeat_start = None
+            
+            if self.collapse and reference == None and start_off == 0 and bytes_to_read == self.BYTES_PER_LINE:
+                prev_line = bytes_type(chunk.data[chunk_off : chunk_off + bytes_to_read])
+            else:
+                prev_line = None
+            
+            self.termline.start()
+            
+            # Address
+            self.append_address(address)
+            
+            # Bytes and chars
+            self.append_line(chunk, chunk_off, start_off, bytes_to_read, address)
+            
+            # Symbols pointed to by words
+            if self.annotate != None:
+                self.append_symbols(chunk.data, chunk_off, start_off, bytes_to_read)
+            
+            self.write_line(self.termline.get_line())
+            
+            address += self.BYTES_PER_LINE
+        
+        if repeat_start != None:
+            self.write_collapsed(repeat_start, address - 1)
+    
+        return end_addr + 1
+
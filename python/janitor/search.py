@@ -0,0 +1,137 @@
+"""Implementation of 'janitor search' command for GDB."""
+
+import gdb
+
+import janitor.dump
+import janitor.memcache
+import janitor.output
+
+# Use Inferior.search_memory, so the target can search without transferring memory
+use_target_search = True
+
+# Number of bytes read at once by local scan
+search_chunk_size = 0x100000
+
+# Search stops after finding that many matches
+max_matches = 1000
+
+def encode_string(literal):
+    """Convert C string or character literal to bytes, without terminating NUL."""
+    quote = literal[0]
+    if len(literal) < 2 or literal[-1] != quote:
+        raise gdb.GdbError ("unterminated string literal")
+    try:
+        return bytearray(literal[1:-1].encode("iso-8859-1").decode("unicode_escape").encode("iso-8859-1"))
+    except (UnicodeError, ValueError):
+        raise gdb.GdbError ("invalid string literal " + literal)
+
+def encode_value(expr, width, endian):
+    """Convert string literal or integer expression to bytes.
+
+    Integer is stored in WIDTH bytes, or size of its type if WIDTH is None."""
+    if expr[0] == '"' or expr[0] == "'":
+        return encode_string(expr)
+
+    value = gdb.parse_and_eval(expr)
+    if width == None:
+        width = value.type.strip_typedefs().sizeof
+    number = int(value) & ((1 << (8 * width)) - 1)
+    result = bytearray((number >> (8 * i)) & 0xFF for i in range(width))
+    if endian == janitor.dump.ENDIAN_BIG:
+        result.reverse()
+    return result
+
+def encode_pattern(exprs, width, endian):
+    pattern = bytearray()
+    for expr in exprs:
+        if expr == "":
+            raise gdb.GdbError ("empty pattern value")
+        pattern += encode_value(expr, width, endian)
+    if len(pattern) == 0:
+        raise gdb.GdbError ("missing search pattern")
+    return bytes(pattern)
+
+def scan_target(start_addr, end_addr, pattern, matches):
+    """Search using GDB, return address where the search should continue locally or None when done."""
+    inferior = gdb.selected_inferior()
+    address = start_addr
+    while address + len(pattern) - 1 <= end_addr and len(matches) < max_matches:
+        try:
+            found = inferior.search_memory(address, end_addr + 1 - address, pattern)
+        except gdb.error:
+            # Probably some memory in range can't be read, local scan skips it
+            return address
+        if found == None:
+            break
+        matches.append(int(found))
+        address = int(found) + 1
+    return None
+
+def scan_local(start_addr, end_addr, pattern, matches):
+    """Search bulk-read buffers. Unreadable pages are skipped."""
+    overlap = len(pattern) - 1
+    page_size = janitor.memcache.PAGE_SIZE
+    chunk_size = max(search_chunk_size, page_size)
+    # End of previous buffer, so that matches crossing chunk boundaries are found
+    tail = b""
+    address = start_addr
+    length = chunk_size
+    while address <= end_addr and len(matches) < max_matches:
+        length = min(length, end_addr + 1 - address)
+        try:
+            data = bytes(janitor.memcache.read_memory(address, length))
+        except gdb.error:
+            page_rest = page_size - address % page_size
+            if length > page_rest:
+                # Locate unreadable memory with smaller reads
+                length = max(length // 2, page_rest)
+            else:
+                address += length
+                length = chunk_size
+                tail = b""
+            continue
+
+        buf = tail + data
+        base = address - len(tail)
+        pos = buf.find(pattern)
+        while pos != -1 and len(matches) < max_matches:
+            matches.append(base + pos)
+            pos = buf.find(pattern, pos + 1)
+
+        tail = buf[len(buf) - overlap:] if overlap != 0 else b""
+        address += length
+        length = chunk_size
+
+def search(start_addr, end_addr, pattern):
+    """Find all occurrences of PATTERN starting in range from START_ADDR to END_ADDR inclusive."""
+    matches = []
+    address = start_addr
+    if use_target_search and hasattr(gdb.Inferior, "search_memory"):
+        address = scan_target(start_addr, end_addr, pattern, matches)
+    if address != None:
+        scan_local(address, end_addr, pattern, matches)
+    return matches
+
+def print_matches(matches, length, width, endian):
+    """Display dump lines containing each match, with matched bytes highlighted."""
+    dump = janitor.dump
+    bytes_per_line = dump.dump_obj.BYTES_PER_LINE
+    saved = (dump.width, dump.endian, dump.highlight_start, dump.highlight_end)
+    try:
+        dump.width = width if width != None else 1
+        dump.endian = endian
+        for address in matches:
+            dump.highlight_start = address
+            dump.highlight_end = address + length
+            line_start = address - address % bytes_per_line
+            line_end = (address + length - 1) | (bytes_per_line - 1)
+            dump.dump_obj.invoke(line_start, line_end)
+    finally:
+        dump.width, dump.endian, dump.highlight_start, dump.highlight_end = saved
+
+    if len(matches) == 0:
+        janitor.output.write_line("Pattern not found.")
+    elif len(matches) >= max_matches:
+        janitor.output.write_line("Search stopped after %d matches." % len(matches))
+    else:
+        janitor.output.write_line("%d %s found." % (len(matches), "match" if len(matches) == 1 else "matches"))
@@ -0,0 +1,43 @@
+"""Memory snapshots compared by 'janitor dump /diff' command."""
+
+import gdb
+
+import janitor.dump
+import janitor.memcache
+
+class Snapshot(object):
+    def __init__(self, name, address, data):
+        self.name = name
+        self.address = address
+        self.data = data
+
+    def end_address(self):
+        return self.address + len(self.data) - 1
+
+snapshots = {}
+
+def read_region(address, length):
+    """Read LENGTH bytes at ADDRESS in chunks used by dump command."""
+    chunk_size = janitor.dump.read_chunk_size
+    if chunk_size == None:
+        chunk_size = length
+    parts = []
+    offset = 0
+    while offset < length:
+        size = min(chunk_size, length - offset)
+        parts.append(bytes(janitor.memcache.read_memory(address + offset, size)))
+        offset += size
+    return b"".join(parts)
+
+def take(name, address, length):
+    snapshots[name] = Snapshot(name, address, read_region(address, length))
+    return snapshots[name]
+
+def get(name):
+    if name not in snapshots:
+        raise gdb.GdbError ("no snapshot named " + name)
+    return snapshots[name]
+
+def delete(name):
+    get(name)
+    del snapshots[name]
@@ -0,0 +1,158 @@
+"""Line tables and source files used by 'janitor disassemble /s'."""
+
+import bisect
+import collections
+
+import gdb
+
+import janitor.ansiterm
+from janitor.ansiterm import term
+import janitor.output
+
+FILE_COLOR = term.COLOR_CYAN | term.BOLD
+LINE_NUMBER_COLOR = term.COLOR_CYAN
+SOURCE_COLOR = term.COLOR_WHITE
+
+# Lines following the previously displayed one are displayed together with the new one
+# when there are at most that many of them
+GAP_LINES = 8
+
+class LineTable(object):
+    """Line table of symtab, sorted by address for bisect lookup. Line 0 marks
+address without line, e.g. end of sequence or code from another file."""
+
+    def __init__(self, symtab):
+        self.filename = symtab.filename
+        self.fullname = symtab.fullname()
+        lines = {}
+        for item in symtab.linetable():
+            # Later entries at the same address win, like in GDB
+            lines[item.pc] = item.line
+        self.addrs = sorted(lines)
+        self.lines = [ lines[address] for address in self.addrs ]
+
+    def lookup(self, address):
+        """Get ( line, start, end ) of entry containing ADDRESS, END is None for the last entry."""
+        index = bisect.bisect_right(self.addrs, address) - 1
+        if index < 0:
+            return 0, None, self.addrs[0] if len(self.addrs) != 0 else None
+        end = self.addrs[index + 1] if index + 1 < len(self.addrs) else None
+        return self.lines[index], self.addrs[index], end
+
+class SourceCache(object):
+    """Line tables of symtabs and lines of source files, both kept until objfiles change."""
+
+    def __init__(self):
+        # Maximum number of line tables and of source files kept
+        self.size_limit = 64
+        self.tables = collections.OrderedDict()
+        self.files = collections.OrderedDict()
+
+    def clear(self):
+        self.tables = collections.OrderedDict()
+        self.files = collections.OrderedDict()
+
+    def get_cached(self, entries, key, create):
+        if key in entries:
+            entries.move_to_end(key)
+            return entries[key]
+        value = create()
+        entries[key] = value
+        while len(entries) > self.size_limit:
+            entries.popitem(last = False)
+        return value
+
+    def line_table(self, symtab):
+        # Header files have symtab in every compilation unit including them
+        key = (symtab.objfile.filename, symtab.fullname(), symtab.global_block().start)
+        return self.get_cached(self.tables, key, lambda: LineTable(symtab))
+
+    def source_lines(self, fullname):
+        """Get list of lines of file FULLNAME, None if it can't be read."""
+        return self.get_cached(self.files, fullname, lambda: read_lines(fullname))
+
+cache = SourceCache()
+
+def read_lines(fullname):
+    try:
+        with open(fullname, "rb") as f:
+            return f.read().decode("utf-8", "replace").splitlines()
+    except (IOError, OSError):
+        return None
+
+class SourceLines(object):
+    """Displays source lines of instructions of one listing.
+
+    Line of instruction is found in line table of the previous instruction while
+    it covers the address, GDB is asked for symtab only when the line table
+    doesn't know the address."""
+
+    def __init__(self):
+        self.termline = janitor.ansiterm.TermLine()
+        self.table = None
+        self.line = 0
+        # Range of addresses having the current line
+        self.start = None
+        self.end = None
+        self.shown_table = None
+        self.shown_line = 0
+
+    def locate(self, address):
+        """Get ( line table, line ) of instruction at ADDRESS, line is 0 if it's not known."""
+        if (self.start != None and self.start <= address and
+                (self.end == None or address < self.end)):
+            return self.table, self.line
+        if self.table != None:
+            line, self.start, self.end = self.table.lookup(address)
+            if line != 0:
+                self.line = line
+                return self.table, self.line
+        sal = gdb.find_pc_line(address)
+        self.start = None
+        self.line = 0
+        if sal.symtab == None:
+            self.table = None
+            return None, 0
+        self.table = cache.line_table(sal.symtab)
+        line, self.start, self.end = self.table.lookup(address)
+        if line == 0:
+            # Not in symtab's own line table, e.g. address after end of sequence
+            self.start = None
+            return self.table, sal.line
+        self.line = line
+        return self.table, self.line
+
+    def append_line(self, number, text):
+        self.termline.start()
+        self.termline.set_color(LINE_NUMBER_COLOR)
+        self.termline.append("%-6d" % number)
+        self.termline.set_color(SOURCE_COLOR)
+        if text != None:
+            self.termline.append(text)
+        self.termline.reset()
+        janitor.output.write_line(self.termline.get_line())
+
+    def show(self, address):
+        """Display source lines of instruction at ADDRESS when its line differs from the previous one."""
+        table, line = self.locate(address)
+        if line == 0 or (table is self.shown_table and line == self.shown_line):
+            return
+        if table is not self.shown_table and (self.shown_table == None or table.fullname != self.shown_table.fullname):
+            self.termline.start()
+            self.termline.set_color(FILE_COLOR)
+            self.termline.append(table.filename + ":")
+            self.termline.reset()
+            janitor.output.write_line(self.termline.get_line())
+            self.shown_line = 0
+
+        lines = cache.source_lines(table.fullname)
+        first = line
+        if self.shown_line != 0 and self.shown_line < line and line - self.shown_line <= GAP_LINES:
+            first = self.shown_line + 1
+        for number in range(first, line + 1):
+            text = None
+            if lines != None and number <= len(lines):
+                text = lines[number - 1]
+            self.append_line(number, text)
+        self.shown_table = table
+        self.shown_line = line
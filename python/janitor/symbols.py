@@ -0,0 +1,138 @@
+"""Index of ELF symbols of loaded objfiles, used to annotate addresses with <symbol+offset>.
+
+Symbol tables are read directly from ELF files of objfiles listed by 'info target',
+so that resolving thousands of values doesn't ask GDB for each of them."""
+
+import array
+import bisect
+
+import gdb
+
+import janitor.corefile
+import janitor.elffile
+
+class ObjfileSymbols(object):
+    """Symbols of single objfile, sorted by run-time address."""
+
+    def __init__(self, path, sections):
+        """SECTIONS are ( name, start, end ) of sections of PATH loaded by GDB."""
+        self.path = path
+        # Loaded sections ( start, end, name ) which aren't thread-local templates
+        self.sections = []
+        elf = janitor.elffile.ElfFile(path)
+        try:
+            bias = None
+            for name, start, end in sections:
+                section = elf.get_section(name)
+                if section == None or not section.flags & janitor.elffile.SHF_ALLOC or section.flags & janitor.elffile.SHF_TLS:
+                    continue
+                if bias == None:
+                    bias = start - section.addr
+                self.sections.append(( start, end, name ))
+
+            # Best symbol for each address, ranked by type, size and binding
+            best = {}
+            if bias != None:
+                for name, value, size, info, shndx in elf.symbols():
+                    sym_type = info & 0xf
+                    if (shndx == janitor.elffile.SHN_UNDEF or shndx >= janitor.elffile.SHN_LORESERVE or
+                            sym_type > janitor.elffile.STT_FUNC or name.startswith("$")):
+                        continue
+                    rank = (sym_type != janitor.elffile.STT_NOTYPE, size != 0, info >> 4 == janitor.elffile.STB_GLOBAL)
+                    address = value + bias
+                    if address < 0:
+                        continue
+                    if address not in best or rank > best[address][1]:
+                        best[address] = ( name, rank )
+        finally:
+            elf.close()
+
+        self.addrs = array.array("Q", sorted(best))
+        self.names = [ best[address][0] for address in self.addrs ]
+
+    def lookup(self, address, section_start, section_name):
+        """Get ( name, offset ) of symbol preceding ADDRESS in section starting at SECTION_START."""
+        index = bisect.bisect_right(self.addrs, address) - 1
+        if index < 0 or self.addrs[index] < section_start:
+            return section_name, address - section_start
+        return self.names[index], address - self.addrs[index]
+
+def loaded_sections():
+    """Get dictionary of ( name, start, end ) lists of sections loaded by GDB, keyed by file path."""
+    info = gdb.execute("info target", False, True)
+    in_exec = False
+    exec_file = None
+    files = {}
+    for line in info.splitlines():
+        if janitor.corefile.EXEC_FILE_RE.match(line):
+            in_exec = True
+            continue
+        match = janitor.corefile.FILE_NAME_RE.match(line)
+        if match != None:
+            if in_exec:
+                exec_file = match.group(1)
+            continue
+        match = janitor.corefile.SECTION_RE.match(line)
+        if match != None and in_exec:
+            path = match.group(4) if match.group(4) != None else exec_file
+            if path != None:
+                files.setdefault(path, []).append(( match.group(3), int(match.group(1), 16), int(match.group(2), 16) ))
+    return files
+
+class SymbolMap(object):
+    """Loaded sections of all objfiles with their symbols. Built when first needed
+and kept until objfiles change."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.starts = []
+        self.ends = []
+        # ( objfile symbols, section name ) of sections
+        self.owners = []
+
+    def load(self):
+        ranges = []
+        for path, sections in loaded_sections().items():
+            try:
+                objfile = ObjfileSymbols(path, sections)
+            except (IOError, OSError, janitor.elffile.ElfError):
+                continue
+            for start, end, name in objfile.sections:
+                ranges.append(( start, end, objfile, name ))
+        ranges.sort(key = lambda item: item[0])
+        for start, end, objfile, name in ranges:
+            if len(self.ends) != 0 and start < self.ends[-1]:
+                # Overlapping section, the first one is kept
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.owners.append(( objfile, name ))
+        self.loaded = True
+
+    def lookup(self, address):
+        """Get ( name, offset ) of symbol containing ADDRESS, None if it isn't in a loaded section."""
+        if not self.loaded:
+            try:
+                self.load()
+            except gdb.error:
+                self.loaded = True
+        index = bisect.bisect_right(self.starts, address) - 1
+        if index < 0 or address >= self.ends[index]:
+            return None
+        objfile, name = self.owners[index]
+        return objfile.lookup(address, self.starts[index], name)
+
+symbol_map = SymbolMap()
+
+def format_symbol(address):
+    """Get <symbol+offset> text of ADDRESS, None if it isn't in a loaded section."""
+    symbol = symbol_map.lookup(address)
+    if symbol == None:
+        return None
+    name, offset = symbol
+    if offset == 0:
+        return "<%s>" % name
+    return "<%s+0x%x>" % (name, offset)
@@ -0,0 +1,127 @@
+"""Memory regions displayed on every stop."""
+
+import gdb
+
+import janitor.ansiterm
+from janitor.ansiterm import term
+import janitor.dump
+import janitor.memcache
+import janitor.output
+
+MARK_COLOR = term.COLOR_RED | term.BOLD
+HEADER_COLOR = term.COLOR_CYAN | term.BOLD
+
+class Watch(object):
+    def __init__(self, number, address, length, width, endian):
+        self.number = number
+        self.address = address
+        self.length = length
+        self.width = width
+        self.endian = endian
+        # Memory and rendered lines from previous stop
+        self.data = None
+        self.lines = []
+        # Indexes of lines displayed with changes highlighted
+        self.changed_lines = set()
+        # Rendered lines depend on ANSI setting
+        self.ansi_enabled = None
+
+    def reset(self):
+        self.data = None
+        self.lines = []
+        self.changed_lines = set()
+
+    def update(self):
+        """Read memory and render lines which differ from the previous stop.
+
+        Returns list of indexes of lines with changes."""
+        dump_obj = janitor.dump.dump_obj
+        bytes_per_line = dump_obj.BYTES_PER_LINE
+        data = janitor.dump.DumpData(dump_obj, janitor.memcache.read_memory(self.address, self.length))
+        line_count = (self.length + bytes_per_line - 1) // bytes_per_line
+
+        if self.data == None or self.ansi_enabled != term.ansi_enabled:
+            # Nothing to compare with, render everything
+            if self.data != None:
+                data.set_reference(self.data, 0)
+            redraw = range(line_count)
+            self.lines = line_count * [ None ]
+        else:
+            data.set_reference(self.data, 0)
+            redraw = set()
+            pos = data.changed.find(b"\x01")
+            while pos != -1:
+                line = pos // bytes_per_line
+                redraw.add(line)
+                pos = data.changed.find(b"\x01", (line + 1) * bytes_per_line)
+            # Remove highlight of changes from previous stop
+            redraw |= self.changed_lines
+
+        changed_lines = set()
+        for line in sorted(redraw):
+            pos = line * bytes_per_line
+            length = min(bytes_per_line, self.length - pos)
+            if data.changed != None and data.changed.find(b"\x01", pos, pos + length) != -1:
+                changed_lines.add(line)
+            self.lines[line] = dump_obj.render_line(data, pos, length, self.address + pos)
+
+        self.data = data.data
+        self.changed_lines = changed_lines
+        self.ansi_enabled = term.ansi_enabled
+        return changed_lines
+
+    def display(self):
+        termline = janitor.ansiterm.TermLine()
+        termline.set_color(HEADER_COLOR)
+        termline.append("Watch %d: 0x%X, +%d" % (self.number, self.address, self.length))
+        janitor.output.write_line(termline.get_line())
+
+        try:
+            changed_lines = self.update()
+        except gdb.error as e:
+            self.reset()
+            janitor.output.write_line("  " + str(e))
+            return
+
+        mark = term.transition(term.DEFAULT_COLOR, MARK_COLOR) + ">" + term.transition(MARK_COLOR, term.DEFAULT_COLOR)
+        for line in range(len(self.lines)):
+            janitor.output.write_line((mark if line in changed_lines else " ") + " " + self.lines[line])
+
+watches = []
+next_number = 1
+
+def add(address, length, width, endian):
+    global next_number
+    watch = Watch(next_number, address, length, width, endian)
+    next_number += 1
+    watches.append(watch)
+    return watch
+
+def delete(number):
+    for watch in watches:
+        if watch.number == number:
+            watches.remove(watch)
+            return
+    raise gdb.GdbError ("no watch number %d" % number)
+
+def clear():
+    del watches[:]
+
+def reset():
+    """Forget memory of all watches, e.g. when inferior exits."""
+    for watch in watches:
+        watch.reset()
+
+def display():
+    """Display all watches. Dump format and highlight are switched to those of each watch."""
+    dump = janitor.dump
+    saved = (dump.width, dump.endian, dump.highlight_start, dump.highlight_end)
+    try:
+        dump.highlight_start = None
+        dump.highlight_end = None
+        for watch in watches:
+            dump.width = watch.width
+            dump.endian = watch.endian
+            watch.display()
+    finally:
+        dump.width, dump.endian, dump.highlight_start, dump.highlight_end = saved
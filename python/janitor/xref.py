@@ -0,0 +1,339 @@
+"""Cross-reference index of objfiles, stored on disk and keyed by build ID.
+
+Executable sections are disassembled once by 'janitor xref-index', branch and call
+targets and referenced addresses are stored in SQLite database, so that
+'janitor xrefs' can answer who refers to an address in later sessions.
+Addresses are stored relative to the objfile's link-time addresses."""
+
+import hashlib
+import os
+import re
+
+import gdb
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+import janitor.disassemble
+import janitor.elffile
+import janitor.output
+import janitor.symbols
+
+# Directory of index databases, None means default cache directory
+index_dir = None
+
+# Number of bytes disassembled and stored in single transaction
+INDEX_CHUNK_SIZE = 0x10000
+
+SCHEMA_VERSION = 2
+
+KIND_CALL = 0
+KIND_JUMP = 1
+KIND_DATA = 2
+
+KIND_NAMES = { KIND_CALL: "Calls", KIND_JUMP: "Jumps", KIND_DATA: "References" }
+
+X86_CALLS = { "call", "callq", "calll", "callw", "lcall" }
+# Prefixes preceding mnemonic in GDB output
+X86_PREFIXES = { "bnd", "notrack", "rep", "repz", "repnz", "repe", "repne", "lock", "data16", "addr32", "cs", "ds" }
+# Instructions after which execution doesn't continue with the next one
+X86_TERMINATORS = { "jmp", "jmpq", "jmpl", "jmpw", "ljmp", "ret", "retq", "retl", "retw", "retf", "lret", "lretq",
+        "iret", "iretd", "iretq", "hlt", "ud2", "sysret", "sysexit" }
+ARM_TERMINATORS = { "b", "b.n", "b.w", "bal", "bx", "br", "ret", "eret" }
+ARM_CONDITIONS = "(?:eq|ne|cs|hs|cc|lo|mi|pl|vs|vc|hi|ls|ge|lt|gt|le|al)?"
+ARM_CALL_RE = re.compile(r"^blx?" + ARM_CONDITIONS + r"(?:\.[nw])?$")
+ARM_JUMP_RE = re.compile(r"^(?:bx?" + ARM_CONDITIONS + r"(?:\.[nw])?|b\.\w+|c?bn?z|tbn?z)$")
+
+# Address followed by symbol, e.g. 0x401136 <main+16>
+SYMBOLIC_RE = re.compile(r"(?<![\w$#*])(?:0x)?([0-9a-fA-F]+)\s+<[^>]*>")
+# Address in comment, e.g. # 0x404018 <stdout> or @ (0x10460 <main+36>)
+COMMENT_RE = re.compile(r"\s(?:#|@|;|//)\s+\(?(?:0x)?([0-9a-fA-F]+)")
+# Bare address operand
+ADDRESS_RE = re.compile(r"^(?:0x)?([0-9a-fA-F]+)$")
+
+def default_index_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home == None or cache_home == "":
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "janitor", "xref")
+
+def branch_kind(arch_name, mnemonic):
+    """Get KIND_CALL or KIND_JUMP for branch instruction, None for others."""
+    if arch_name.startswith("i386") or arch_name.startswith("i8086"):
+        if mnemonic in X86_CALLS:
+            return KIND_CALL
+        if mnemonic[0] == 'j' or mnemonic.startswith("loop") or mnemonic == "xbegin":
+            return KIND_JUMP
+        return None
+    if ARM_CALL_RE.match(mnemonic):
+        return KIND_CALL
+    if ARM_JUMP_RE.match(mnemonic) or mnemonic == "call" or mnemonic == "jal":
+        return KIND_JUMP
+    return None
+
+def split_instruction(asm):
+    """Get lowercase mnemonic and arguments of instruction ASM, without prefixes."""
+    parts = asm.split(None, 1)
+    if len(parts) == 0:
+        return "", ""
+    mnemonic = parts[0].lower()
+    if mnemonic in X86_PREFIXES and len(parts) == 2:
+        parts = parts[1].split(None, 1)
+        mnemonic = parts[0].lower()
+    return mnemonic, parts[1] if len(parts) == 2 else ""
+
+def falls_through(arch_name, mnemonic, args):
+    """Check whether execution may continue with the instruction following this one."""
+    if arch_name.startswith("i386") or arch_name.startswith("i8086"):
+        return mnemonic not in X86_TERMINATORS
+    if mnemonic in ARM_TERMINATORS:
+        return False
+    # Return by loading PC
+    operands = args.lower().replace(" ", "")
+    if mnemonic.startswith("pop") or mnemonic.startswith("ldm"):
+        return not re.search(r"[{,]pc[},]", operands)
+    if mnemonic.startswith("ldr") or mnemonic.startswith("mov"):
+        return not operands.startswith("pc,")
+    return True
+
+def branch_target(args):
+    """Get direct target of branch instruction with arguments ARGS, None for indirect branch."""
+    comment = COMMENT_RE.search(args)
+    if comment != None:
+        args = args[:comment.start()]
+    # Direct target is the last operand
+    operand = args.split("<", 1)[0].rsplit(",", 1)[-1].strip()
+    match = ADDRESS_RE.match(operand)
+    if match == None:
+        return None
+    return int(match.group(1), 16)
+
+def instruction_flow(arch_name, asm):
+    """Get ( kind, target, falls_through ) of instruction ASM. KIND is KIND_CALL, KIND_JUMP
+or None for other instructions, TARGET is None unless it is direct branch."""
+    mnemonic, args = split_instruction(asm)
+    if mnemonic == "":
+        return None, None, True
+    kind = branch_kind(arch_name, mnemonic)
+    target = branch_target(args) if kind != None else None
+    return kind, target, falls_through(arch_name, mnemonic, args)
+
+def instruction_refs(arch_name, asm):
+    """Get list of ( target, kind ) referenced by instruction ASM."""
+    mnemonic, args = split_instruction(asm)
+    if mnemonic == "":
+        return []
+
+    refs = []
+    comment = COMMENT_RE.search(args)
+    if comment != None:
+        refs.append(( int(comment.group(1), 16), KIND_DATA ))
+        args = args[:comment.start()]
+
+    kind = branch_kind(arch_name, mnemonic)
+    if kind != None:
+        target = branch_target(args)
+        if target != None:
+            refs.append(( target, kind ))
+    else:
+        for match in SYMBOLIC_RE.finditer(args):
+            refs.append(( int(match.group(1), 16), KIND_DATA ))
+    return refs
+
+def target_sections(path):
+    """Get list of ( name, start, end ) of sections of PATH loaded by GDB."""
+    result = []
+    for section_file, sections in janitor.symbols.loaded_sections().items():
+        if os.path.realpath(section_file) == os.path.realpath(path):
+            result += sections
+    return result
+
+def load_bias(elf, path):
+    """Get difference between run-time and link-time addresses of objfile."""
+    for name, start, end in target_sections(path):
+        section = elf.get_section(name)
+        if section != None and section.flags & janitor.elffile.SHF_ALLOC:
+            return start - section.addr
+    raise gdb.GdbError ("sections of %s are not loaded" % path)
+
+def objfile_path(address = None):
+    """Get path of objfile containing ADDRESS, or of main executable."""
+    path = None
+    if address != None:
+        path = gdb.solib_name(address)
+    if path == None:
+        path = gdb.current_progspace().filename
+    if path == None:
+        raise gdb.GdbError ("no executable file")
+    return path
+
+def index_key(elf, path):
+    """Build ID of objfile, or hash of its path, size and time for files without one."""
+    build_id = elf.build_id()
+    if build_id != None:
+        return build_id
+    stat = os.stat(path)
+    digest = hashlib.sha1(("%s:%d:%d" % (os.path.realpath(path), stat.st_size, int(stat.st_mtime))).encode("utf-8"))
+    return "nobuildid-" + digest.hexdigest()
+
+class XrefIndex(object):
+    """Index database of single objfile."""
+
+    def __init__(self, path, create):
+        if sqlite3 == None:
+            raise gdb.GdbError ("sqlite3 module is not available")
+        self.path = path
+        self.db = None
+        try:
+            self.elf = janitor.elffile.ElfFile(path)
+        except (IOError, OSError, janitor.elffile.ElfError) as e:
+            raise gdb.GdbError (str(e))
+        self.key = index_key(self.elf, path)
+        directory = index_dir if index_dir != None else default_index_dir()
+        self.db_path = os.path.join(directory, self.key + ".sqlite")
+        if not create and not os.path.exists(self.db_path):
+            self.close()
+            raise gdb.GdbError ("%s is not indexed, use janitor xref-index" % path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row != None and row[0] != str(SCHEMA_VERSION):
+            # Index of older version is built again
+            self.db.executescript("""
+                DROP TABLE IF EXISTS sections;
+                DROP TABLE IF EXISTS chunks;
+                DROP TABLE IF EXISTS xrefs;
+            """)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sections (name TEXT PRIMARY KEY, start INTEGER, end INTEGER, done INTEGER);
+            CREATE TABLE IF NOT EXISTS xrefs (target INTEGER, source INTEGER, kind INTEGER);
+            CREATE INDEX IF NOT EXISTS xrefs_target ON xrefs (target);
+        """)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('path', ?)", (path,))
+
+    def close(self):
+        if self.db != None:
+            self.db.close()
+            self.db = None
+        self.elf.close()
+
+    def code_sections(self):
+        return [ s for s in self.elf.sections
+                if s.flags & janitor.elffile.SHF_EXECINSTR and s.type != janitor.elffile.SHT_NOBITS and s.size != 0 ]
+
+    def progress(self):
+        """Get number of indexed and total bytes of code."""
+        done = 0
+        total = 0
+        for section in self.code_sections():
+            row = self.db.execute("SELECT done FROM sections WHERE name = ?", (section.name,)).fetchone()
+            if row != None:
+                done += min(row[0], section.addr + section.size) - section.addr
+            total += section.size
+        return done, total
+
+    def build(self, arch):
+        """Disassemble code sections not indexed yet. Every chunk is committed separately,
+so interrupted indexing continues where it stopped.
+
+Code is read from the objfile, not from the target: GDB reads read-only sections
+from files while trust-readonly-sections is on, so a remote target isn't asked
+for every chunk. That's also what an index keyed by build ID should describe."""
+        trusted = gdb.parameter("trust-readonly-sections")
+        if not trusted:
+            gdb.execute("set trust-readonly-sections on", False, True)
+        try:
+            return self.build_sections(arch)
+        finally:
+            if not trusted:
+                gdb.execute("set trust-readonly-sections off", False, True)
+
+    def build_sections(self, arch):
+        arch_name = arch.name()
+        bias = load_bias(self.elf, self.path)
+        instructions = 0
+        refs = 0
+        for section in self.code_sections():
+            section_end = section.addr + section.size
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO sections VALUES (?, ?, ?, ?)",
+                        (section.name, section.addr, section_end, section.addr))
+            address = self.db.execute("SELECT done FROM sections WHERE name = ?", (section.name,)).fetchone()[0]
+            while address < section_end:
+                chunk_end = min(section_end, address + INDEX_CHUNK_SIZE)
+                disass = arch.disassemble(start_pc = address + bias, end_pc = chunk_end + bias - 1)
+                if len(disass) == 0:
+                    # Nothing more can be decoded
+                    with self.db:
+                        self.db.execute("UPDATE sections SET done = ? WHERE name = ?", (section_end, section.name))
+                    break
+                rows = []
+                for instr in disass:
+                    source = instr["addr"] - bias
+                    for target, kind in instruction_refs(arch_name, instr["asm"]):
+                        rows.append(( target - bias, source, kind ))
+                next_address = disass[-1]["addr"] + disass[-1]["length"] - bias
+                with self.db:
+                    self.db.executemany("INSERT INTO xrefs VALUES (?, ?, ?)", rows)
+                    self.db.execute("UPDATE sections SET done = ? WHERE name = ?", (next_address, section.name))
+                instructions += len(disass)
+                refs += len(rows)
+                address = next_address
+                disass = None
+        return instructions, refs
+
+    def lookup(self, address):
+        """Get list of ( source, kind ) referring to run-time ADDRESS, sorted by kind and source."""
+        bias = load_bias(self.elf, self.path)
+        rows = self.db.execute("SELECT source, kind FROM xrefs WHERE target = ? ORDER BY kind, source",
+                (address - bias,)).fetchall()
+        return [ ( source + bias, kind ) for source, kind in rows ]
+
+def get_arch():
+    frame = gdb.selected_frame() if gdb.selected_inferior().pid != 0 else None
+    if frame != None and frame.is_valid():
+        return frame.architecture()
+    return gdb.selected_inferior().architecture()
+
+def build_index(path):
+    index = XrefIndex(path, True)
+    try:
+        instructions, refs = index.build(get_arch())
+        done, total = index.progress()
+    finally:
+        index.close()
+    return instructions, refs, done, total
+
+def print_xrefs(address):
+    """Display instructions referring to ADDRESS, grouped by kind of reference."""
+    index = XrefIndex(objfile_path(address), False)
+    try:
+        refs = index.lookup(address)
+        done, total = index.progress()
+    finally:
+        index.close()
+
+    if done < total:
+        janitor.output.write_line("Index is incomplete (%d%%), use janitor xref-index to continue." % (100 * done // total))
+    if len(refs) == 0:
+        janitor.output.write_line("No references to 0x%X found." % address)
+        return
+
+    arch = get_arch()
+    flavor = None
+    try:
+        flavor = gdb.parameter("disassembly-flavor")
+    except:
+        pass
+    kind = None
+    for source, source_kind in refs:
+        if source_kind != kind:
+            kind = source_kind
+            janitor.output.write_line("%s to 0x%X:" % (KIND_NAMES[kind], address))
+        janitor.disassemble.disassemble_obj.invoke(arch, source, source, flavor)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Replay golden corpus of instruction arguments through DecorateArgs.
+
+Usage: check_decorate_args.py [--update]
+
+Every line of decorate_args.jsonl holds architecture, disassembly flavor and
+arguments of one instruction, as printed by GDB in AT&T, Intel and ARM syntax,
+with expected plain and colored output of 'janitor disassemble'. The check runs
+without GDB. With --update, expected output is rewritten from the current code."""
+
+import json
+import os
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "decorate_args.jsonl")
+
+def install_gdb_module():
+    """Provide module named gdb so that janitor modules can be imported.
+DecorateArgs doesn't use GDB, other attributes are never called here."""
+    gdb = types.ModuleType("gdb")
+    class error(RuntimeError):
+        pass
+    class GdbError(Exception):
+        pass
+    gdb.error = error
+    gdb.MemoryError = error
+    gdb.GdbError = GdbError
+    gdb.VERSION = "12.1"
+    gdb.write = sys.stdout.write
+    def missing(name):
+        return type(name, (object,), {})
+    gdb.__getattr__ = missing
+    sys.modules["gdb"] = gdb
+
+def decorate(ansiterm, decorator, args, ansi):
+    ansiterm.term.ansi_enabled = ansi
+    termline = ansiterm.TermLine()
+    decorator.invoke(args, termline)
+    return termline.get_line()
+
+def main():
+    update = "--update" in sys.argv[1:]
+    sys.path.insert(0, os.path.join(HERE, "..", "python"))
+    install_gdb_module()
+    import janitor.ansiterm
+    import janitor.disassemble
+
+    with open(CORPUS, encoding = "utf-8") as f:
+        cases = [ json.loads(line) for line in f if line.strip() != "" ]
+
+    failures = 0
+    decorators = {}
+    # The second pass gets memoized arguments
+    for case in cases + ([] if update else cases):
+        key = (case["arch"], case["flavor"])
+        if key not in decorators:
+            decorators[key] = janitor.disassemble.DecorateArgs(case["arch"], case["flavor"])
+        for field, ansi in ( ("plain", False), ("colored", True) ):
+            result = decorate(janitor.ansiterm, decorators[(case["arch"], case["flavor"])], case["args"], ansi)
+            if update:
+                case[field] = result
+            elif result != case[field]:
+                failures += 1
+                if failures <= 10:
+                    print("%s %s %r (%s):\n  expected %r\n  got      %r" % (case["arch"], case["flavor"],
+                            case["args"], field, case[field], result))
+
+    if update:
+        with open(CORPUS, "w", encoding = "utf-8") as f:
+            for case in cases:
+                f.write(json.dumps(case, ensure_ascii = False, sort_keys = True) + "\n")
+        print("%d cases written" % len(cases))
+        return 0
+    print("%d cases, %d failures" % (len(cases) * 2, failures))
+    return 1 if failures != 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())